@@ -0,0 +1,180 @@
+"""
+benchmark suite of the simulator core. runs the scenarios with fixed seeds and short runtimes, monitor on and off,
+and scaling curves of scenarios.line_scenario over the number of flows, switches in a line and traffic classes.
+every case runs in a new process, so peak_rss_mb is the peak of that case only.
+results are written as JSON, the results of two commits can be compared with --compare.
+run from the repository root:
+python -m benchmarks.core_benchmark --output benchmark.json [--engine native] [--compare old_benchmark.json]
+"""
+from simulation.Core import SimulationEnvironment
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# name, scenario module, arguments of foo
+SCENARIOS = [("scenario1", "scenario1", ()),
+             ("simple_scenario", "simple_scenario", ("tbe", 0.5, "lrq")),
+             ("simple_scenario2", "simple_scenario2", (True, 0.5, "lrq")),
+             ("simple_scenario3", "simple_scenario3", (True, 0.5, "lrq")),
+             ("token_bucket_test", "token_bucket_test", (100,))]
+
+# arguments of scenarios.line_scenario.foo (flows, switches, traffic_classes), one value is varied per curve
+SCALING = {"flows": [((flows, 2, 8), flows) for flows in (1, 2, 4, 8, 16, 32)],
+           "switches": [((8, switches, 8), switches) for switches in (1, 2, 4, 8)],
+           "traffic_classes": [((8, 2, traffic_classes), traffic_classes) for traffic_classes in (1, 2, 4, 8)]}
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobyte on linux and in byte on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / 1024 ** 2 if sys.platform == "darwin" else peak_rss / 1024
+
+
+def run_case(module_name: str, args: tuple, runtime: int, monitor: bool, engine: str, seed: int) -> dict:
+    """
+    builds the first simulation of scenarios.<module_name>.foo(*args) and runs it for runtime
+    :param monitor: if False, monitoring of all nodes is switched off before the simulation starts
+    """
+    SimulationEnvironment.engine = engine
+    module = importlib.import_module("scenarios.%s" % module_name)
+    np.random.seed(seed)
+    sim_env = next(module.foo(*args))
+    if not monitor:
+        for node in sim_env.topology.nodes.values():
+            node.monitor = False
+    rss_before = peak_rss_mb()
+
+    start = time.perf_counter()
+    sim_env.run(runtime)
+    wall_time = time.perf_counter() - start
+
+    export_time = 0
+    rows = 0
+    if monitor:
+        start = time.perf_counter()
+        rows = sum(rows.__len__() for rows in sim_env.get_data().values())
+        export_time = time.perf_counter() - start
+
+    events = sim_env.processed_events()
+    frames = sim_env.next_frame_id
+    return {"engine": engine, "monitor": monitor, "runtime": runtime, "seed": seed,
+            "wall_time": wall_time, "events": events, "frames": frames,
+            "events_per_sec": events / wall_time, "frames_per_sec": frames / wall_time,
+            "export_time": export_time, "rows": rows,
+            "rss_before_mb": rss_before, "peak_rss_mb": peak_rss_mb()}
+
+
+def run_isolated(pool, repeat: int, *case_args) -> dict:
+    """
+    runs a case repeat times, each time in a new process of pool, and keeps the run with the lowest wall time
+    """
+    results = [pool.apply(run_case, case_args) for i in range(repeat)]
+    return min(results, key=lambda result: result["wall_time"])
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(runtime: int = 20000, scaling_runtime: int = 10000, engine: str = "simpy", seed: int = 0,
+                   repeat: int = 1, scaling: bool = True, verbose: bool = True) -> dict:
+    """
+    :param runtime: simulated time of each scenario run
+    :param scaling_runtime: simulated time of each run of the scaling curves
+    :param engine: "simpy" or "native"
+    :param repeat: runs per case, the fastest run is reported
+    :param scaling: if False, the scaling curves are skipped
+    :return: results, see module docstring
+    """
+    import simpy
+
+    results = {"meta": {"commit": git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        "python": platform.python_version(), "numpy": np.__version__, "simpy": simpy.__version__,
+                        "platform": platform.platform(), "engine": engine},
+               "scenarios": list(),
+               "scaling": dict()}
+    pool = multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1)
+    try:
+        for name, module_name, args in SCENARIOS:
+            for monitor in (True, False):
+                result = run_isolated(pool, repeat, module_name, args, runtime, monitor, engine, seed)
+                result["name"] = name
+                result["args"] = list(args)
+                results["scenarios"].append(result)
+                if verbose:
+                    print("%-18s monitor=%-5s %8.2fs %10.0f events/s %8.0f frames/s %7.1f MB" % (
+                        name, monitor, result["wall_time"], result["events_per_sec"], result["frames_per_sec"],
+                        result["peak_rss_mb"]))
+        if scaling:
+            for curve, points in SCALING.items():
+                results["scaling"][curve] = list()
+                for args, value in points:
+                    result = run_isolated(pool, repeat, "line_scenario", args, scaling_runtime, False, engine, seed)
+                    result[curve] = value
+                    result["args"] = list(args)
+                    results["scaling"][curve].append(result)
+                    if verbose:
+                        print("%-18s %-8d %8.2fs %10.0f events/s %8.0f frames/s %7.1f MB" % (
+                            curve, value, result["wall_time"], result["events_per_sec"], result["frames_per_sec"],
+                            result["peak_rss_mb"]))
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def compare(old_results: dict, new_results: dict):
+    """
+    prints the events per second of new_results relative to old_results for every case both contain
+    """
+    old_cases = {(result["name"], result["monitor"]): result for result in old_results["scenarios"]}
+    for result in new_results["scenarios"]:
+        old_result = old_cases.get((result["name"], result["monitor"]))
+        if old_result is not None:
+            print("%-18s monitor=%-5s events/s x%.2f, peak rss x%.2f" % (
+                result["name"], result["monitor"], result["events_per_sec"] / old_result["events_per_sec"],
+                result["peak_rss_mb"] / old_result["peak_rss_mb"]))
+    for curve, new_points in new_results["scaling"].items():
+        old_points = {old_result[curve]: old_result for old_result in old_results["scaling"].get(curve, ())}
+        for result in new_points:
+            old_result = old_points.get(result[curve])
+            if old_result is not None:
+                print("%-18s %-8d events/s x%.2f" % (
+                    curve, result[curve], result["events_per_sec"] / old_result["events_per_sec"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark of the simulator core")
+    parser.add_argument("--output", default="benchmark.json", help="JSON file the results are written to")
+    parser.add_argument("--runtime", type=int, default=20000, help="simulated time of the scenario runs")
+    parser.add_argument("--scaling-runtime", type=int, default=10000, help="simulated time of the scaling runs")
+    parser.add_argument("--engine", default="simpy", choices=("simpy", "native"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case, the fastest run is reported")
+    parser.add_argument("--no-scaling", action="store_true", help="skip the scaling curves")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare the results with")
+    options = parser.parse_args()
+
+    results = run_benchmarks(options.runtime, options.scaling_runtime, options.engine, options.seed,
+                             options.repeat, not options.no_scaling)
+    with open(options.output, "w") as file:
+        json.dump(results, file, indent=1)
+    if options.compare is not None:
+        with open(options.compare) as file:
+            compare(json.load(file), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+compares UBS (lrq, tbe) with credit based shapers (802.1Qav) on the line scenarios of CASES: the same flows and seed,
+only the switches differ. prints the mean and p99 end to end delay of every flow and the p99 delay per hop. run from the
+repository root:
+python -m scenarios.cbs_comparison [runtime]
+"""
+from simulation.Analytics import load_tables, flow_delay_summary, hop_delay_summary, pivot
+from scenarios.line_scenario import build
+
+import sys
+
+
+# (flows, switches, traffic_classes) of the compared line scenarios: mixed classes, one flow, one traffic class
+CASES = [(8, 3, 4), (1, 1, 8), (8, 2, 1)]
+
+
+def print_rows(rows: list):
+    for row in rows:
+        print("  ".join("%s %s" % (name, value if isinstance(value, int) else "%0.2f" % value)
+                        for name, value in row.items()))
+
+
+def main(runtime: int = 100000, seed: int = 0):
+    for flows, switches, traffic_classes in CASES:
+        print("line scenario: %d flows, %d switches, %d traffic classes" % (flows, switches, traffic_classes))
+        flow_rows = list()
+        hop_rows = list()
+        for switch_mode in ("lrq", "tbe", "cbs"):
+            sim_env = build(flows, switches, traffic_classes, 0.9, switch_mode, seed)
+            sim_env.run(runtime)
+            tables = load_tables(sim_env.iter_data())
+            for flow_dict in flow_delay_summary(tables, ("flow_id",)):
+                flow_dict["mode"] = switch_mode
+                flow_rows.append(flow_dict)
+            hop_rows += hop_delay_summary(tables, ("mode", "flow_id"))
+        for statistic in ("delay_mean", "delay_p99"):
+            print("end to end %s per flow" % statistic)
+            print_rows(pivot(flow_rows, ("flow_id",), "mode", statistic))
+        print("nodal_delay_p99 per flow, all hops")
+        print_rows(pivot(hop_rows, ("flow_id",), "mode", "nodal_delay_p99"))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
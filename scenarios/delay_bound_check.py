@@ -0,0 +1,30 @@
+"""
+compares the simulated delays of the line scenario with the analytical UBS delay bounds (see DelayBounds) for lrq and
+tbe switches. run from the repository root:
+python -m scenarios.delay_bound_check [runtime]
+"""
+from simulation.Analysis import DelayBounds
+from scenarios.line_scenario import build
+
+import sys
+
+
+def main(runtime: int = 100000, seed: int = 0) -> bool:
+    within = True
+    for switch_mode in ("lrq", "tbe"):
+        for load in (0.5, 0.9):
+            sim_env = build(8, 3, 4, load, switch_mode, seed)
+            sim_env.run(runtime)
+            bounds = DelayBounds(sim_env.topology)
+            check_result = bounds.check(sim_env.get_data())
+            end_to_end = [check_dict for check_dict in check_result if check_dict["hop"] == ""]
+            print("%s load %0.1f: max end to end bound %0.3f, max simulated %0.3f" % (
+                switch_mode, load, max(check_dict["bound"] for check_dict in end_to_end),
+                max(check_dict["simulated_max"] for check_dict in end_to_end)))
+            print(DelayBounds.report(check_result))
+            within = within and not any(check_dict["exceeded"] for check_dict in check_result)
+    return within
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(*[int(arg) for arg in sys.argv[1:]]) else 1)
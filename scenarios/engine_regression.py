@@ -0,0 +1,139 @@
+"""
+cross engine regression check: runs scenario1, simple_scenario*, token_bucket_test on the SimPy engine and on the
+native engine, checks that both produce the same results and that the native engine reaches TARGET.
+the native engine fuses zero delay callbacks (see SimulationEnvironment.fused_callbacks), so simultaneous events are
+recorded in a different order: frame tables are compared as sorted rows, UBS_Switch_Queue as the occupancy over
+time (see occupancy). the speed is the number of SimPy events per second of wall time, the native engine processes
+fewer callbacks for the same simulation. run from the repository root:
+python -m scenarios.engine_regression [runtime] [count] [seed] [target]
+"""
+from simulation.Core import SimulationEnvironment
+from scenarios import scenario1, simple_scenario, simple_scenario2, simple_scenario3, token_bucket_test
+
+import sys
+import time
+
+import numpy as np
+
+
+CASES = [("scenario1", scenario1.foo, ()),
+         ("simple_scenario", simple_scenario.foo, ("tbe", 0.5, "lrq")),
+         ("simple_scenario", simple_scenario.foo, ("lrq", 0.3, "tbe")),
+         ("simple_scenario", simple_scenario.foo, ("shapeless", 0.5, "shapeless")),
+         ("simple_scenario2", simple_scenario2.foo, (True, 0.5, "lrq")),
+         ("simple_scenario2", simple_scenario2.foo, (False, 0.5, "tbe")),
+         ("simple_scenario3", simple_scenario3.foo, (True, 0.5, "lrq")),
+         ("simple_scenario3", simple_scenario3.foo, (False, 0.4, "shapeless")),
+         ("token_bucket_test", token_bucket_test.foo, (100,))]
+
+# minimum ratio of the events per second of the native engine to those of the SimPy engine
+TARGET = 3.0
+
+# columns of a UBS_Switch_Queue row which describe the occupancy of the queue during an interval
+OCCUPANCY_COLUMNS = ("since", "until", "frames", "byte_length")
+
+
+def run_case(engine: str, scenario, args: tuple, runtime: int, count: int, seed: int) -> (dict, float, int):
+    """
+    :return: tables of count simulations of scenario(*args) (the column simulation, the index of the simulation,
+        replaces sim_id), the wall time of env.run and the number of processed events
+    """
+    default_engine = SimulationEnvironment.engine
+    SimulationEnvironment.engine = engine
+    try:
+        np.random.seed(seed)
+        generator = scenario(*args)
+        tables = dict()
+        wall_time = 0
+        events = 0
+        for i in range(count):
+            sim_env = next(generator)
+            start = time.perf_counter()
+            sim_env.run(runtime)
+            wall_time += time.perf_counter() - start
+            events += sim_env.processed_events()
+            for dict_format, rows in sim_env.get_data().items():
+                table = tables.setdefault(dict_format, list())
+                for row in rows:
+                    row = {key: value for key, value in row.items() if key != "sim_id"}
+                    row["simulation"] = i
+                    table.append(row)
+        return tables, wall_time, events
+    finally:
+        SimulationEnvironment.engine = default_engine
+
+
+def sorted_rows(rows: list) -> list:
+    return sorted(tuple(sorted((key, repr(value)) for key, value in row.items())) for row in rows)
+
+
+def occupancy(rows: list) -> list:
+    """
+    :param rows: rows of a UBS_Switch_Queue table
+    :return: sorted rows without intervals of length zero, neighbouring intervals of a queue with the same occupancy
+        are merged. simultaneous changes of a queue leave intervals of length zero, their number and order depend on
+        the order in which the simultaneous events were processed
+    """
+    queues = dict()
+    for row in rows:
+        if row["since"] == row["until"]:
+            continue
+        key = tuple(sorted((column, repr(value)) for column, value in row.items() if column not in OCCUPANCY_COLUMNS))
+        queues.setdefault(key, list()).append(row)
+    result = list()
+    for key, queue_rows in queues.items():
+        queue_rows.sort(key=lambda queue_row: queue_row["since"])
+        last = None
+        for row in queue_rows:
+            if last is not None and last[1] == row["since"] and last[2:] == (row["frames"], row["byte_length"]):
+                last[1] = row["until"]
+            else:
+                last = [row["since"], row["until"], row["frames"], row["byte_length"]]
+                result.append((key, last))
+    return sorted((key, tuple(interval)) for key, interval in result)
+
+
+def equal_tables(simpy_tables: dict, native_tables: dict) -> list:
+    """
+    :return: names of the tables which differ
+    """
+    differs = list()
+    for dict_format in sorted(set(simpy_tables) | set(native_tables)):
+        simpy_rows = simpy_tables.get(dict_format, list())
+        native_rows = native_tables.get(dict_format, list())
+        canonical = occupancy if dict_format == "UBS_Switch_Queue" else sorted_rows
+        if canonical(simpy_rows) != canonical(native_rows):
+            differs.append(dict_format)
+    return differs
+
+
+def main(runtime: int = 20000, count: int = 2, seed: int = 0, target: float = TARGET) -> bool:
+    equal = True
+    simpy_time = 0
+    native_time = 0
+    simpy_events = 0
+    native_events = 0
+    for name, scenario, args in CASES:
+        simpy_tables, simpy_wall_time, simpy_case_events = run_case("simpy", scenario, args, runtime, count, seed)
+        native_tables, native_wall_time, native_case_events = run_case("native", scenario, args, runtime, count,
+                                                                       seed)
+        simpy_time += simpy_wall_time
+        native_time += native_wall_time
+        simpy_events += simpy_case_events
+        native_events += native_case_events
+        rows = sum(table.__len__() for table in simpy_tables.values())
+        differs = equal_tables(simpy_tables, native_tables)
+        equal = equal and not differs
+        print("%-7s %s%s: %d rows, simpy %.2fs, native %.2fs%s" % (
+            "DIFFERS" if differs else "ok", name, args, rows, simpy_wall_time, native_wall_time,
+            " (%s)" % ", ".join(differs) if differs else ""))
+    ratio = simpy_time / native_time
+    print("simpy %d events in %.2fs, native %d callbacks in %.2fs" % (simpy_events, simpy_time, native_events,
+                                                                    native_time))
+    print("events/s: simpy %.0f, native %.0f, ratio %.2f, target %.2f: %s" % (
+        simpy_events / simpy_time, simpy_events / native_time, ratio, target, "ok" if ratio >= target else "MISSED"))
+    return equal and ratio >= target
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(*[float(arg) if i == 3 else int(arg) for i, arg in enumerate(sys.argv[1:])]) else 1)
@@ -0,0 +1,77 @@
+from simulation.Core import SimulationEnvironment, Topology
+from simulation.Talker import TokenBucketTalker
+from simulation.Switch import UBSSwitch, CBSSwitch
+from simulation.PriorityMap import PriorityMap
+from simulation.Path import Path
+from simulation.Flow import Flow
+from simulation.Node import Listener
+from simulation.Sampler import ExponentialSampler, UniformSampler
+from simulation.Wrapper import simulate_multiple
+
+import numpy as np
+
+# idle slope of a traffic class in switch_mode "cbs" = reserved rate (sum of the leaky rates of its flows) * headroom
+CBS_HEADROOM = 1.05
+
+
+def build(flows: int = 4, switches: int = 2, traffic_classes: int = 8, load: float = 0.9, switch_mode: str = "lrq",
+          seed: int = None, monitor: bool = True) -> SimulationEnvironment:
+    """
+    flows talkers send through a line of switches switches to one listener. every talker has one token bucket
+    shaped flow with leaky_rate = load * bandwidth / flows and exponential distributed frame times,
+    the priorities of the flows cycle through 0-7 and are mapped to traffic_classes traffic classes.
+    switch_mode "cbs" uses credit based shapers instead of UBS, the idle slope of a traffic class is the sum of the
+    leaky rates of its flows * CBS_HEADROOM, which has to stay below bandwidth (load * CBS_HEADROOM < 1).
+    used for scaling benchmarks, can be used as scenario factory for simulate_multiple_parallel
+    (e.g. functools.partial(build, 16, 4))
+    """
+    sim_env = SimulationEnvironment("line-%d-%d-%d" % (flows, switches, traffic_classes), seed)
+
+    bandwidth = 1000
+    mean_payload = 750
+    burstiness = mean_payload * 2 - 2
+    leaky_rate = load * bandwidth / flows
+
+    switch_addresses = ["switch%d" % (i + 1) for i in range(switches)]
+    priority_map = PriorityMap(traffic_classes)
+    payload_generator = UniformSampler(sim_env.random, 2, mean_payload * 2 - 2, rounded=True)
+
+    nodes = list()
+    # traffic class -> sum of the leaky rates of its flows
+    class_rates = dict()
+    for i in range(flows):
+        talker_address = "talker%d" % (i + 1)
+        path = Path(talker_address, *switch_addresses, "listener")
+        flow = Flow(i + 1, path, leaky_rate, burstiness)
+        class_rates[priority_map[i % 8]] = class_rates.get(priority_map[i % 8], 0) + leaky_rate
+        nodes.append(TokenBucketTalker(sim_env, talker_address, flow, i % 8, payload_generator,
+                                       ExponentialSampler(sim_env.random, mean_payload * 8 / leaky_rate), monitor))
+    idle_slopes = {traffic_class: class_rate * CBS_HEADROOM for traffic_class, class_rate in class_rates.items()}
+    if switch_mode == "cbs" and sum(idle_slopes.values()) >= bandwidth:
+        raise ValueError("load %s with cbs headroom %s reserves %s of bandwidth %s"
+                         % (load, CBS_HEADROOM, sum(idle_slopes.values()), bandwidth))
+    for switch_address in switch_addresses:
+        if switch_mode == "cbs":
+            nodes.append(CBSSwitch(sim_env, switch_address, priority_map, idle_slopes, monitor))
+        else:
+            nodes.append(UBSSwitch(sim_env, switch_address, priority_map, switch_mode, monitor))
+    nodes.append(Listener(sim_env, "listener"))
+
+    topology = Topology(*nodes)
+    topology.multi_connect(switch_addresses[0], bandwidth, *["talker%d" % (i + 1) for i in range(flows)])
+    for switch_a, switch_b in zip(switch_addresses, switch_addresses[1:]):
+        topology.connect(switch_a, switch_b, bandwidth)
+    topology.connect(switch_addresses[-1], "listener", bandwidth)
+    sim_env.topology = topology
+    return sim_env
+
+
+def foo(flows: int = 4, switches: int = 2, traffic_classes: int = 8, switch_mode: str = "lrq"):
+    seed = np.random.randint(2 ** 32)
+    while True:
+        yield build(flows, switches, traffic_classes, switch_mode=switch_mode, seed=seed)
+        seed = np.random.randint(2 ** 32)
+
+
+if __name__ == "__main__":
+    simulate_multiple(foo(16, 4, 8), 10, 100000, "line_scenario")
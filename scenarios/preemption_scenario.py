@@ -0,0 +1,66 @@
+"""
+frame preemption: one express flow with small frames competes with best effort flows with large frames at one
+egress port. compares the delay of the express flow with and without preemption. run from the repository root:
+python -m scenarios.preemption_scenario [runtime]
+"""
+from simulation.Core import SimulationEnvironment, Topology
+from simulation.Talker import TokenBucketTalker
+from simulation.Switch import UBSSwitch
+from simulation.PriorityMap import PriorityMap
+from simulation.Path import Path
+from simulation.Flow import Flow
+from simulation.Node import Listener
+from simulation.Sampler import ExponentialSampler, UniformSampler
+
+import sys
+
+import numpy as np
+
+
+def build(preemption: bool = True, best_effort: int = 3, load: float = 0.9, seed: int = None) -> SimulationEnvironment:
+    """
+    talker1 sends an express flow (priority 7, 64-128 byte frames, 5% of the bandwidth), best_effort talkers send
+    1000-1500 byte frames (priority 0) with load * bandwidth together, all through switch to listener
+    :param preemption: traffic class 7 is express, all others are preemptable
+    """
+    sim_env = SimulationEnvironment("preemption-%s" % preemption, seed)
+    bandwidth = 1000
+    priority_map = PriorityMap(8)
+
+    express_rate = 0.05 * bandwidth
+    nodes = [TokenBucketTalker(sim_env, "talker1", Flow(1, Path("talker1", "switch", "listener"), express_rate, 256),
+                               7, UniformSampler(sim_env.random, 64, 128, rounded=True),
+                               ExponentialSampler(sim_env.random, 96 * 8 / express_rate), True)]
+    leaky_rate = load * bandwidth / best_effort
+    for i in range(best_effort):
+        address = "talker%d" % (i + 2)
+        flow = Flow(i + 2, Path(address, "switch", "listener"), leaky_rate, 3000)
+        nodes.append(TokenBucketTalker(sim_env, address, flow, 0, UniformSampler(sim_env.random, 1000, 1500, rounded=True),
+                                       ExponentialSampler(sim_env.random, 1250 * 8 / leaky_rate), True))
+    nodes.append(UBSSwitch(sim_env, "switch", priority_map, "tbe", True, (7,) if preemption else ()))
+    nodes.append(Listener(sim_env, "listener"))
+
+    topology = Topology(*nodes)
+    topology.multi_connect("switch", bandwidth, *["talker%d" % (i + 1) for i in range(best_effort + 1)])
+    topology.connect("switch", "listener", bandwidth)
+    sim_env.topology = topology
+    return sim_env
+
+
+def main(runtime: int = 200000, seed: int = 0):
+    for preemption in (False, True):
+        sim_env = build(preemption, seed=seed)
+        sim_env.run(runtime)
+        frames = sim_env.get_data()["UBS_Switch_Frame"]
+        express = np.array([frame_dict["nodal_delay"] for frame_dict in frames
+                            if frame_dict["flow_id"] == 1 and frame_dict["nodal_delay"] != ""])
+        preemptions = [frame_dict["preemptions"] for frame_dict in frames if frame_dict["flow_id"] != 1]
+        best_effort = np.array([frame_dict["nodal_delay"] for frame_dict in frames
+                                if frame_dict["flow_id"] != 1 and frame_dict["nodal_delay"] != ""])
+        print("preemption %s: express delay mean %0.3f max %0.3f, best effort delay mean %0.3f, "
+              "%d preemptions of %d best effort frames" % (preemption, express.mean(), express.max(),
+                                                          best_effort.mean(), sum(preemptions), preemptions.__len__()))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
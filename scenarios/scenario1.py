@@ -5,13 +5,12 @@ from simulation.PriorityMap import PriorityMap
 from simulation.Path import Path
 from simulation.Flow import Flow
 from simulation.Node import Listener
+from simulation.Sampler import UniformSampler
 from simulation.Wrapper import simulate_multiple
 
 
 def payload_gen(sim_env: SimulationEnvironment, mean):
-    rnd = sim_env.random
-    while True:
-        yield rnd.uniform(2, mean * 2)
+    return UniformSampler(sim_env.random, 2, mean * 2)
 
 
 def foo():
@@ -95,4 +94,5 @@ def foo():
         yield sim_env
 
 
-simulate_multiple(foo(), 10, 100000, "scenario1_tbe")
+if __name__ == "__main__":
+    simulate_multiple(foo(), 10, 100000, "scenario1_tbe")
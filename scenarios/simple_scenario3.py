@@ -5,23 +5,19 @@ from simulation.PriorityMap import PriorityMap
 from simulation.Path import Path
 from simulation.Flow import Flow
 from simulation.Node import Listener
+from simulation.Sampler import ExponentialSampler, UniformSampler
 from simulation.Wrapper import simulate_multiple, simulate_multiple_multiple
 
 import numpy as np
-from sys import maxsize
 
 
 def time_gen(leaky_rate, mean_frame_len, sim_env: SimulationEnvironment):
-    rnd_state = sim_env.random
     mean = mean_frame_len * 8 / leaky_rate
-    while True:
-        yield rnd_state.exponential(mean)
+    return ExponentialSampler(sim_env.random, mean)
 
 
 def payload_gen(sim_env: SimulationEnvironment, mean):
-    rnd = sim_env.random
-    while True:
-        yield round(rnd.uniform(2, mean * 2 - 2))
+    return UniformSampler(sim_env.random, 2, mean * 2 - 2, rounded=True)
 
 
 def payload_gen_2(mean):
@@ -57,7 +53,7 @@ def foo(interleaved: bool, high_priority_leaky_rate, switch_mode):
     optional: use a specific seed and change it before yield statement
     """
 
-    seed = np.random.randint(maxsize)
+    seed = np.random.randint(2 ** 32)
     while True:
         # 1.
         sim_env = SimulationEnvironment("%s-%0.2f-%s" % (str(interleaved), high_priority_leaky_rate, switch_mode), seed)
@@ -110,25 +106,26 @@ def foo(interleaved: bool, high_priority_leaky_rate, switch_mode):
         sim_env.topology = topology
 
         # optional
-        seed = np.random.randint(maxsize)
+        seed = np.random.randint(2 ** 32)
 
         # 7.
         yield sim_env
 
 
-# simulate_multiple(foo("shapeless", 0.5, "tbe"), 15, 100000, "simple")
+if __name__ == "__main__":
+    # simulate_multiple(foo("shapeless", 0.5, "tbe"), 15, 100000, "simple")
 
-arr_mode = "lrq"
-simulate_multiple_multiple([foo(True, 0.5, arr_mode),
-                            foo(False, 0.5, arr_mode)], 10, 100000, "simple3_%s" % arr_mode)
+    arr_mode = "lrq"
+    simulate_multiple_multiple([foo(True, 0.5, arr_mode),
+                                foo(False, 0.5, arr_mode)], 10, 100000, "simple3_%s" % arr_mode)
 
-# simulate_multiple_multiple([foo("tbe", 0.1, "lrq"),
-#                            foo("tbe", 0.2, "lrq"),
-#                            foo("tbe", 0.3, "lrq"),
-#                            foo("tbe", 0.4, "lrq"),
-#                            foo("tbe", 0.5, "lrq"),
-#                            foo("tbe", 0.6, "lrq"),
-#                            foo("tbe", 0.7, "lrq"),
-#                            foo("tbe", 0.8, "lrq"),
-#                            foo("tbe", 0.9, "lrq"),
-#                            foo("tbe", 1, "lrq")], 10, 100000, "simple_tbe_lrq_row")
+    # simulate_multiple_multiple([foo("tbe", 0.1, "lrq"),
+    #                            foo("tbe", 0.2, "lrq"),
+    #                            foo("tbe", 0.3, "lrq"),
+    #                            foo("tbe", 0.4, "lrq"),
+    #                            foo("tbe", 0.5, "lrq"),
+    #                            foo("tbe", 0.6, "lrq"),
+    #                            foo("tbe", 0.7, "lrq"),
+    #                            foo("tbe", 0.8, "lrq"),
+    #                            foo("tbe", 0.9, "lrq"),
+    #                            foo("tbe", 1, "lrq")], 10, 100000, "simple_tbe_lrq_row")
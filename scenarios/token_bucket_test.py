@@ -5,7 +5,10 @@ from simulation.PriorityMap import PriorityMap
 from simulation.Path import Path
 from simulation.Flow import Flow
 from simulation.Node import Listener
-from simulation.Wrapper import simulate_multiple, simulate_multiple_multiple
+from simulation.Sampler import ExponentialSampler
+from simulation.Wrapper import simulate_multiple_multiple, simulate_multiple_multiple_parallel
+
+from functools import partial
 
 
 def payload_gen(payload):
@@ -14,41 +17,60 @@ def payload_gen(payload):
 
 
 def time_gen(mean, rnd_state):
-    while True:
-        yield rnd_state.exponential(mean)
+    return ExponentialSampler(rnd_state, mean)
 
 
-def foo(exp_mean):
-    offset = 987321
-    seed = 123456789
-    while True:
-        sim_env = SimulationEnvironment("exp_mean=%d" % exp_mean, seed)
-        seed += offset
+def build(exp_mean, seed: int = None) -> SimulationEnvironment:
+    """
+    builds one Simulation of this scenario, can be used as scenario factory for simulate_multiple_parallel
+    (e.g. functools.partial(build, 500))
+    """
+    sim_env = SimulationEnvironment("exp_mean=%d" % exp_mean, seed)
+
+    path = Path("talker", "listener")
 
-        path = Path("talker", "listener")
+    leaky_rate = 1000 * 0.05
+    burstiness = 1500
+    payload = 599
+    # exp_mean = 500
 
-        leaky_rate = 1000 * 0.05
-        burstiness = 1500
-        payload = 599
-        # exp_mean = 500
+    # print("frame_len = %d, bandwidth = 1GBit, transmission_time = %f" % (payload + 26, (payload + 26) * 8 / 1000))
+    # print("time to leak one frame = %f" % ((payload + 26) * 8 / leaky_rate))
+    # print("avg time to next frame = %d" % exp_mean)
+    # print()
 
-        # print("frame_len = %d, bandwidth = 1GBit, transmission_time = %f" % (payload + 26, (payload + 26) * 8 / 1000))
-        # print("time to leak one frame = %f" % ((payload + 26) * 8 / leaky_rate))
-        # print("avg time to next frame = %d" % exp_mean)
-        # print()
+    flow = Flow(1, path, leaky_rate, burstiness)
 
-        flow = Flow(1, path, leaky_rate, burstiness)
+    tbt = TokenBucketTalker(sim_env, "talker", flow, 0,
+                            payload_gen(payload), time_gen(exp_mean, sim_env.random),
+                            True)
+    listener = Listener(sim_env, "listener")
 
-        tbt = TokenBucketTalker(sim_env, "talker", flow, 0,
-                                payload_gen(payload), time_gen(exp_mean, sim_env.random),
-                                True)
-        listener = Listener(sim_env, "listener")
+    topology = Topology(tbt, listener)
+    topology.connect("talker", "listener")
+    sim_env.topology = topology
+    return sim_env
 
-        topology = Topology(tbt, listener)
-        topology.connect("talker", "listener")
-        sim_env.topology = topology
+
+def foo(exp_mean):
+    offset = 987321
+    seed = 123456789
+    while True:
+        sim_env = build(exp_mean, seed)
+        seed += offset
         yield sim_env
 
 
-# simulate_multiple(foo(500), 3, 10000, "token_bucket_test")
-simulate_multiple_multiple([foo(500), foo(300), foo(200), foo(125), foo(100), foo(75), foo(50)], 15, 100000, "token_bucket_test")
+def run_parallel(processes: int = None):
+    """
+    the sweep of __main__ on a process pool (see simulate_multiple_multiple_parallel). the replications get seeds
+    spawned from seed=123456789 instead of the fixed seeds of foo, so the results differ from the sequential sweep
+    """
+    simulate_multiple_multiple_parallel([partial(build, exp_mean) for exp_mean in (500, 300, 200, 125, 100, 75, 50)],
+                                        15, 100000, "token_bucket_test", seed=123456789, processes=processes)
+
+
+if __name__ == "__main__":
+    # simulate_multiple(foo(500), 3, 10000, "token_bucket_test")
+    simulate_multiple_multiple([foo(500), foo(300), foo(200), foo(125), foo(100), foo(75), foo(50)],
+                               15, 100000, "token_bucket_test")
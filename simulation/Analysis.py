@@ -0,0 +1,243 @@
+from simulation.Core import Topology
+from simulation.PriorityMap import PriorityMap
+from simulation.Switch import UBSSwitch
+from simulation.Talker import BaseTalker, Talker, TokenBucketTalker, UnshapedTalker
+
+from collections import defaultdict
+from math import inf
+
+
+class DelayBounds(object):
+    def __init__(self, topology: Topology, priority_map: PriorityMap = None, mode: str = None,
+                 frame_lengths: dict = None):
+        """
+        worst case delay bounds of all flows of topology, from the UBS delay bound (Specht, Samii: Urgency-Based
+        Scheduler for Time-Sensitive Switched Ethernet Networks). the bound of flow f at an egress port with
+        bandwidth r is
+            (b_H + b_C - l_f + l_L) / (r - r_H) + l_f / r
+        b_H, r_H: sum of the burstiness and leaky rates of the flows of higher traffic classes at that port,
+        b_C: sum of the burstiness of the flows of the traffic class of f at that port (including f),
+        l_f: minimum frame length of f, l_L: maximum frame length of the flows of lower traffic classes at that port.
+        lrq shapers limit the burstiness of every flow to its maximum frame length. the bound of a hop covers the
+        time from the release of a frame by its shaper (pseudo_queue_time of UBS_Switch_Frame) until it was sent
+        (forwarding_time). shaping delays do not add to the end to end bound (interleaved shaping for free), except
+        at the first switch if the talker sends bigger bursts than the shaper admits (token bucket talker, lrq).
+        the end to end bound starts when the frame is eligible to be sent by the talker, i.e. when it is created
+        (Talker) or conforms to its token bucket (TokenBucketTalker). all bounds are in micro seconds like all delays
+        of the simulation, inf if the leaky rates of the flows of a port exceed its bandwidth or the frames of a
+        flow are not shaped
+        :param topology: topology with talkers, UBS switches and connections like the scenarios build it
+        :param priority_map: traffic classes of the priorities; default = priority_map of each switch
+        :param mode: shaper mode of all switches, "lrq" or "tbe"; default = mode of each switch
+        :param frame_lengths: flow id -> (minimum, maximum) frame length in byte;
+            default = (0, flow.burstiness), the burstiness of a flow has to hold its largest frame
+        """
+        self.topology = topology
+        self.priority_map = priority_map
+        self.mode = mode
+        self.frame_lengths = frame_lengths if frame_lengths is not None else dict()
+        # flow id -> Flow, talker address, priority
+        self.flows = dict()
+        self.talkers = dict()
+        self.priorities = dict()
+        for address, node in topology.nodes.items():
+            if isinstance(node, BaseTalker):
+                priorities = node.get_priorities()
+                for flow in node.get_flows():
+                    self.flows[flow.id] = flow
+                    self.talkers[flow.id] = address
+                    self.priorities[flow.id] = priorities[flow.id]
+        # (sender address, receiver address) -> flow ids of the flows send over that link
+        self.link_flows = defaultdict(list)
+        for flow_id, flow in sorted(self.flows.items()):
+            for sender_address, receiver_addresses in flow.path.path_dict.items():
+                for receiver_address in receiver_addresses:
+                    self.link_flows[(sender_address, receiver_address)].append(flow_id)
+        # (flow id, switch address, egress address) -> bound of that hop
+        self.hop_bounds = dict()
+        # (flow id, receiver address) -> bound from the talker to receiver
+        self.bounds = dict()
+        self.compute()
+
+    def frame_length(self, flow_id: int) -> (float, float):
+        """
+        :return: minimum and maximum frame length of flow flow_id in byte
+        """
+        try:
+            return self.frame_lengths[flow_id]
+        except KeyError:
+            return 0, self.flows[flow_id].burstiness
+
+    def get_mode(self, switch: UBSSwitch) -> str:
+        mode = self.mode if self.mode is not None else switch.mode
+        if mode not in ("lrq", "tbe"):
+            raise ValueError("no delay bound for %s shapers (switch %s)" % (mode, switch.address))
+        return mode
+
+    def talker_bound(self, flow_id: int, switch_address: str) -> float:
+        """
+        :return: bound of the first hop of flow flow_id, from the talker until the release by the shaper of the
+            first switch switch_address
+        """
+        talker = self.topology[self.talkers[flow_id]]
+        flow = self.flows[flow_id]
+        bandwidth = self.topology.bandwidth(talker.address, switch_address)
+        if isinstance(talker, UnshapedTalker):
+            return inf
+        if isinstance(talker, TokenBucketTalker):
+            # at most burstiness bits are conformant at once and have to be sent one after another
+            bound = flow.burstiness * 8 / bandwidth
+            switch = self.topology[switch_address]
+            if isinstance(switch, UBSSwitch) and self.get_mode(switch) == "lrq":
+                # the lrq shaper spreads the burst to one frame per frame length / leaky rate
+                bound += (flow.burstiness - self.frame_length(flow_id)[0]) * 8 / flow.leaky_rate
+            return bound
+        if isinstance(talker, Talker):
+            # one FIFO queue for all flows of the talker, every flow creates one frame per frame length / leaky rate
+            flows = [self.flows[talker_flow.id] for talker_flow in talker.get_flows()]
+            if sum(talker_flow.leaky_rate for talker_flow in flows) > bandwidth:
+                return inf
+            return sum(self.frame_length(talker_flow.id)[1] for talker_flow in flows) * 8 / bandwidth
+        raise ValueError("no delay bound for talker %s of type %s" % (talker.address, type(talker).__name__))
+
+    def port_bounds(self, switch: UBSSwitch, egress_address: str) -> dict:
+        """
+        :return: flow id -> bound at the egress port of switch to egress_address, for all flows of that port
+        """
+        mode = self.get_mode(switch)
+        priority_map = self.priority_map if self.priority_map is not None else switch.priority_map
+        bandwidth = self.topology.bandwidth(switch.address, egress_address)
+        flow_ids = self.link_flows[(switch.address, egress_address)]
+        # flow id -> traffic class, burstiness in bit, leaky rate
+        classes = dict()
+        for flow_id in flow_ids:
+            flow = self.flows[flow_id]
+            max_length = self.frame_length(flow_id)[1] * 8
+            burstiness = max(flow.burstiness * 8, max_length) if mode == "tbe" else max_length
+            classes[flow_id] = (priority_map[self.priorities[flow_id]], burstiness, flow.leaky_rate)
+        stable = sum(leaky_rate for traffic_class, burstiness, leaky_rate in classes.values()) <= bandwidth
+        result = dict()
+        for flow_id, (traffic_class, burstiness, leaky_rate) in classes.items():
+            if not stable:
+                result[flow_id] = inf
+                continue
+            higher_burstiness = 0
+            higher_rate = 0
+            class_burstiness = 0
+            lower_length = 0
+            for other_id, (other_class, other_burstiness, other_rate) in classes.items():
+                if other_class > traffic_class:
+                    higher_burstiness += other_burstiness
+                    higher_rate += other_rate
+                elif other_class == traffic_class:
+                    class_burstiness += other_burstiness
+                else:
+                    lower_length = max(lower_length, self.frame_length(other_id)[1] * 8)
+            min_length = self.frame_length(flow_id)[0] * 8
+            result[flow_id] = ((higher_burstiness + class_burstiness - min_length + lower_length)
+                               / (bandwidth - higher_rate) + min_length / bandwidth)
+        return result
+
+    def compute(self):
+        for (sender_address, receiver_address), flow_ids in self.link_flows.items():
+            switch = self.topology[sender_address]
+            if isinstance(switch, UBSSwitch):
+                for flow_id, bound in self.port_bounds(switch, receiver_address).items():
+                    self.hop_bounds[(flow_id, sender_address, receiver_address)] = bound
+        for flow_id, flow in self.flows.items():
+            talker_address = self.talkers[flow_id]
+            # depth first through the path tree: (node address, bound until the arrival at that node)
+            stack = [(receiver_address, self.talker_bound(flow_id, receiver_address))
+                     for receiver_address in flow.path[talker_address]]
+            while stack.__len__() > 0:
+                address, bound = stack.pop()
+                if address not in flow.path.path_dict:
+                    self.bounds[(flow_id, address)] = bound
+                    continue
+                for receiver_address in flow.path[address]:
+                    hop_bound = self.hop_bounds.get((flow_id, address, receiver_address))
+                    if hop_bound is None:
+                        raise ValueError("no delay bound for node %s of flow %d" % (address, flow_id))
+                    stack.append((receiver_address, bound + hop_bound))
+
+    def get_data(self) -> list((list, str)):
+        """
+        :return: tables delay_bound_hop (one row per flow and switch egress port) and delay_bound (one row per flow
+            and receiver)
+        """
+        hop_result = list()
+        for (flow_id, switch_address, egress_address), bound in sorted(self.hop_bounds.items()):
+            hop_result.append({"flow_id": flow_id, "switch_address": switch_address, "egress_address": egress_address,
+                               "priority": self.priorities[flow_id], "bound": bound})
+        result = list()
+        for (flow_id, receiver_address), bound in sorted(self.bounds.items()):
+            result.append({"flow_id": flow_id, "sender": self.talkers[flow_id], "receiver": receiver_address,
+                           "priority": self.priorities[flow_id], "bound": bound})
+        return [(hop_result, "delay_bound_hop"), (result, "delay_bound")]
+
+    def check(self, results: dict) -> list:
+        """
+        compares the simulated maximum delays of results with the bounds
+        per hop: maximum of forwarding_time - pseudo_queue_time of UBS_Switch_Frame, or pseudo_queue_delay_max of
+        UBS_Switch_Statistics (without the transmission time, so exceeded bounds can be missed).
+        end to end (UBS_Switch_Frame and talker tables required): maximum delay from the start of the transmission
+        at the talker until the arrival at the receiver, the start is computed from the arrival at the first switch
+        :param results: tables of simulations of this topology, e.g. from simulate_multiple
+        :return: rows of the delay_bound_check table, exceeded is True if a simulated delay exceeds its bound
+        """
+        hop_maxima = defaultdict(float)
+        # (sim_name, sim_id, frame id) -> start of the transmission at the talker
+        transmission_starts = dict()
+        for frame_dict in results.get("UBS_Switch_Frame", ()):
+            if frame_dict["nodal_delay"] == "":
+                continue
+            flow_id = frame_dict["flow_id"]
+            switch_address = frame_dict["switch_address"]
+            key = (flow_id, switch_address, frame_dict["egress_address"])
+            hop_maxima[key] = max(hop_maxima[key], frame_dict["forwarding_time"] - frame_dict["pseudo_queue_time"])
+            flow = self.flows[flow_id]
+            talker_address = self.talkers[flow_id]
+            if switch_address in flow.path[talker_address]:
+                transmission_starts[(frame_dict["sim_name"], frame_dict["sim_id"], frame_dict["frame_id"])] = (
+                    frame_dict["arrival_time"]
+                    - frame_dict["frame_len"] * 8 / self.topology.bandwidth(talker_address, switch_address))
+        for statistics_dict in results.get("UBS_Switch_Statistics", ()):
+            if statistics_dict["pseudo_queue_delay_max"] == "":
+                continue
+            key = (statistics_dict["flow_id"], statistics_dict["switch_address"], statistics_dict["egress_address"])
+            hop_maxima[key] = max(hop_maxima[key], statistics_dict["pseudo_queue_delay_max"])
+        maxima = defaultdict(float)
+        for frame_dict in results.get("talker", ()):
+            start = transmission_starts.get((frame_dict["sim_name"], frame_dict["sim_id"], frame_dict["frame_id"]))
+            if start is None or frame_dict["arrival_time"] == "":
+                continue
+            key = (frame_dict["flow_id"], frame_dict["receiver"])
+            maxima[key] = max(maxima[key], frame_dict["arrival_time"] - start)
+
+        result = list()
+        for (flow_id, switch_address, egress_address), simulated in sorted(hop_maxima.items()):
+            bound = self.hop_bounds[(flow_id, switch_address, egress_address)]
+            result.append({"flow_id": flow_id, "hop": switch_address, "receiver": egress_address, "bound": bound,
+                           "simulated_max": simulated, "exceeded": simulated > bound})
+        for (flow_id, receiver_address), simulated in sorted(maxima.items()):
+            bound = self.bounds[(flow_id, receiver_address)]
+            result.append({"flow_id": flow_id, "hop": "", "receiver": receiver_address, "bound": bound,
+                           "simulated_max": simulated, "exceeded": simulated > bound})
+        return result
+
+    @staticmethod
+    def report(check_result: list) -> str:
+        """
+        :param check_result: rows of check
+        :return: the rows whose simulated delay exceeds the bound, one per line
+        """
+        lines = list()
+        for check_dict in check_result:
+            if check_dict["exceeded"]:
+                location = check_dict["hop"] + "->" + check_dict["receiver"] if check_dict["hop"] != "" \
+                    else "end to end to " + check_dict["receiver"]
+                lines.append("flow %d %s: simulated %0.3f > bound %0.3f" % (
+                    check_dict["flow_id"], location, check_dict["simulated_max"], check_dict["bound"]))
+        if lines.__len__() == 0:
+            return "all %d simulated delays are within their bounds" % check_result.__len__()
+        return "\n".join(lines)
@@ -0,0 +1,321 @@
+from simulation.Trace import TraceTable, open_trace
+
+import csv
+import os
+
+import numpy as np
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def dense_codes(codes: np.ndarray) -> np.ndarray:
+    """
+    renumbers non negative int codes to 0, 1, ... in the order of the codes, with a bincount instead of a sort if
+    the codes are small
+    """
+    if codes.__len__() == 0:
+        return codes.astype(np.int64)
+    if codes.max() < 4 * codes.__len__() + 1024:
+        present = np.bincount(codes) > 0
+        return (np.cumsum(present) - 1)[codes]
+    return np.unique(codes, return_inverse=True)[1].reshape(-1)
+
+
+def group_sort(group: np.ndarray, count: int, order: np.ndarray = None) -> np.ndarray:
+    """
+    :param order: permutation of the rows; default = identity
+    :return: stable sort of order by group (radix sort for up to 65536 groups)
+    """
+    group = group.astype(np.min_scalar_type(max(count - 1, 0)), copy=False)
+    if order is None:
+        return np.argsort(group, kind="stable")
+    return order[np.argsort(group[order], kind="stable")]
+
+
+class ResultTable(object):
+    def __init__(self, columns: dict, strings: dict = None):
+        """
+        columnar view of one result table for the group by operations of this module
+        :param columns: column name -> numpy array, numeric columns are float or int (NaN = value was not set),
+            string columns are int codes
+        :param strings: name of each string column -> array of its strings, the code is the index
+        """
+        self.columns = columns
+        self.strings = strings if strings is not None else dict()
+        self.size = next(iter(columns.values())).__len__() if columns.__len__() > 0 else 0
+
+    @staticmethod
+    def from_values(columns: dict) -> "ResultTable":
+        """
+        :param columns: column name -> list of the values of the column as in the rows of get_data ("" = not set)
+            or as read from a CSV file (all values str)
+        """
+        arrays = dict()
+        strings = dict()
+        for name, values in columns.items():
+            try:
+                arrays[name] = np.array(["nan" if value == "" else value for value in values], dtype=np.float64)
+                if not np.isnan(arrays[name]).any() and np.all(np.mod(arrays[name], 1) == 0):
+                    arrays[name] = arrays[name].astype(np.int64)
+            except (ValueError, TypeError):
+                strings[name], arrays[name] = np.unique(np.array([str(value) for value in values], dtype=object),
+                                                        return_inverse=True)
+        return ResultTable(arrays, strings)
+
+    @staticmethod
+    def from_rows(frame_list: list) -> "ResultTable":
+        """
+        :param frame_list: rows of one table of SimulationEnvironment.get_data or simulate_multiple
+        """
+        if frame_list.__len__() == 0:
+            return ResultTable(dict())
+        return ResultTable.from_values({name: [frame_dict[name] for frame_dict in frame_list]
+                                        for name in frame_list[0].keys()})
+
+    @staticmethod
+    def from_csv(path: str) -> "ResultTable":
+        """
+        :param path: CSV file written by write_to_csv or CSVSink
+        """
+        with open(path, "r", encoding="utf-8") as file:
+            reader = csv.reader(file, delimiter=",")
+            names = reader.__next__()
+            values = list(zip(*reader))
+        if values.__len__() == 0:
+            return ResultTable({name: np.empty(0) for name in names})
+        return ResultTable.from_values(dict(zip(names, values)))
+
+    @staticmethod
+    def from_trace(table: TraceTable) -> "ResultTable":
+        """
+        :param table: trace file (see Trace), the columns are not copied
+        """
+        columns = dict()
+        strings = dict()
+        for name, kind in table.fields:
+            columns[name] = table[name]
+            if kind == "str":
+                strings[name] = np.array(table.strings[name], dtype=object)
+        return ResultTable(columns, strings)
+
+    def values(self, name: str) -> np.ndarray:
+        """
+        :return: numeric column name as float array, NaN where the value was not set
+        """
+        if name in self.strings:
+            raise ValueError("column %s is not numeric" % name)
+        return self.columns[name].astype(np.float64, copy=False)
+
+    def sort_codes(self, name: str) -> np.ndarray:
+        """
+        :return: int codes of column name per row, in the order of the values of the column
+        """
+        column = self.columns[name]
+        if name in self.strings:
+            # trace files number strings in the order they appeared
+            ranks = np.empty(self.strings[name].__len__(), dtype=np.int64)
+            ranks[np.argsort(self.strings[name].astype(str), kind="stable")] = np.arange(ranks.__len__())
+            return ranks[column]
+        if np.issubdtype(column.dtype, np.integer):
+            return dense_codes(column - column.min(initial=0))
+        return np.unique(column, return_inverse=True)[1].reshape(-1)
+
+    def labels(self, name: str, rows: np.ndarray) -> list:
+        """
+        :return: values of column name in rows as python values for summary rows
+        """
+        if name in self.strings:
+            return self.strings[name][self.columns[name][rows]].tolist()
+        return self.columns[name][rows].tolist()
+
+    def __len__(self):
+        return self.size
+
+
+def load_tables(source) -> dict:
+    """
+    :param source: tables as returned by SimulationEnvironment.get_data or simulate_multiple (dict table name ->
+        rows), rows as yielded by SimulationEnvironment.iter_data (table name, row), which are collected column wise
+        without keeping the rows, or a result directory (results/<filename>_<offset>) with CSV or trace files;
+        if a table exists as trace and as CSV file, the trace is used
+    :return: table name -> ResultTable
+    """
+    tables = dict()
+    if isinstance(source, dict):
+        for dict_format, frame_list in source.items():
+            tables[dict_format] = ResultTable.from_rows(frame_list)
+        return tables
+    if not isinstance(source, str):
+        # table name -> column name -> values
+        columns = dict()
+        for dict_format, frame_dict in source:
+            try:
+                table_columns = columns[dict_format]
+            except KeyError:
+                table_columns = {name: list() for name in frame_dict.keys()}
+                columns[dict_format] = table_columns
+            for name, values in table_columns.items():
+                values.append(frame_dict[name])
+        for dict_format, table_columns in columns.items():
+            tables[dict_format] = ResultTable.from_values(table_columns)
+        return tables
+    for file_name in sorted(os.listdir(source)):
+        if file_name.endswith(".csv"):
+            tables[file_name[:-len(".csv")]] = ResultTable.from_csv(os.path.join(source, file_name))
+    for dict_format, table in open_trace(source).items():
+        tables[dict_format] = ResultTable.from_trace(table)
+    return tables
+
+
+class GroupBy(object):
+    def __init__(self, table: ResultTable, keys: tuple):
+        """
+        groups the rows of table by the values of the columns keys, the groups are ordered by their key values
+        """
+        self.table = table
+        self.keys = keys
+        group = np.zeros(table.__len__(), dtype=np.int64)
+        for name in keys:
+            codes = table.sort_codes(name)
+            # the codes are renumbered after every column, so they can not overflow
+            group = dense_codes(group * (codes.max(initial=0) + 1) + codes)
+        self.group = group
+        self.sizes = np.bincount(group)
+        self.count = self.sizes.__len__()
+        self.first_rows = group_sort(group, self.count)[np.cumsum(self.sizes) - self.sizes]
+
+    def key_dicts(self) -> list:
+        """
+        :return: one dict key column -> value per group
+        """
+        labels = [self.table.labels(name, self.first_rows) for name in self.keys]
+        return [dict(zip(self.keys, key_values)) for key_values in zip(*labels)]
+
+    def valid(self, values: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        :return: group of each value which is not NaN, and those values
+        """
+        valid = ~np.isnan(values)
+        return self.group[valid], values[valid]
+
+    def summary(self, values: np.ndarray, prefix: str, quantiles: tuple = DEFAULT_QUANTILES) -> dict:
+        """
+        count, mean, standard deviation, minimum, quantiles, maximum and jitter (maximum - minimum, peak to peak
+        delay variation) of values per group, NaN values are ignored. groups without values have count 0 and NaN
+        statistics
+        :param values: one value per row of the table
+        :param prefix: prefix of the names of the statistics, e.g. "delay" -> "delay_mean", "delay_p99"
+        :return: name -> array with one entry per group
+        """
+        group, values = self.valid(values)
+        count = np.bincount(group, minlength=self.count)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.bincount(group, values, minlength=self.count) / count
+            deviation = values - mean[group]
+            std = np.sqrt(np.bincount(group, deviation * deviation, minlength=self.count) / (count - 1))
+        std[count < 2] = np.nan
+        result = {"%s_count" % prefix: count, "%s_mean" % prefix: mean, "%s_std" % prefix: std}
+
+        # values sorted by group and value, each group is one contiguous block
+        values = values[group_sort(group, self.count, np.argsort(values))]
+        ends = np.cumsum(count)
+        starts = ends - count
+        empty = count == 0
+        last = np.maximum(ends - 1, 0)
+        minimum = np.where(empty, np.nan, values[np.minimum(starts, last)] if values.__len__() > 0 else np.nan)
+        maximum = np.where(empty, np.nan, values[last] if values.__len__() > 0 else np.nan)
+        result["%s_min" % prefix] = minimum
+        for q in quantiles:
+            # linear interpolation between the closest ranks, like np.quantile
+            position = starts + q * np.maximum(count - 1, 0)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.minimum(lower + 1, last)
+            if values.__len__() > 0:
+                quantile = values[np.minimum(lower, last)] + (position - lower) * (
+                    values[upper] - values[np.minimum(lower, last)])
+            else:
+                quantile = np.full(self.count, np.nan)
+            result["%s_p%s" % (prefix, ("%g" % (q * 100)).replace(".", ""))] = np.where(empty, np.nan, quantile)
+        result["%s_max" % prefix] = maximum
+        # peak to peak delay variation
+        result["%s_jitter" % prefix] = maximum - minimum
+        return result
+
+    def rows(self, *statistics: dict) -> list:
+        """
+        :param statistics: results of summary
+        :return: summary table, one row per group with the key columns and all statistics, NaN = ""
+        """
+        columns = dict()
+        for statistics_dict in statistics:
+            for name, column in statistics_dict.items():
+                columns[name] = ["" if value != value else value for value in column.tolist()]
+        result = self.key_dicts()
+        for i, row in enumerate(result):
+            for name, column in columns.items():
+                row[name] = column[i]
+        return result
+
+
+def flow_delay_summary(tables: dict, keys: tuple = ("sim_name", "flow_id"),
+                       quantiles: tuple = DEFAULT_QUANTILES) -> list:
+    """
+    end to end delay of every flow from the talker table, over all replications and receivers of a flow
+    :param tables: see load_tables
+    :param keys: columns of the talker table which identify a group, e.g. ("sim_name", "flow_id", "receiver")
+    :return: one row per group: keys, rows of the talker table which were not delivered and statistics of the
+        delays of the deliveries (see GroupBy.summary)
+    """
+    table: ResultTable = tables["talker"]
+    group_by = GroupBy(table, keys)
+    delays = table.values("delay")
+    statistics = group_by.summary(delays, "delay", quantiles)
+    lost = np.bincount(group_by.group, np.isnan(delays), minlength=group_by.count).astype(np.int64)
+    return group_by.rows({"undelivered": lost}, statistics)
+
+
+def hop_delay_summary(tables: dict, keys: tuple = ("sim_name", "switch_address", "egress_address", "shaped_queue"),
+                      quantiles: tuple = DEFAULT_QUANTILES) -> list:
+    """
+    delays of the frames at the egress ports of the switches from the UBS_Switch_Frame table, split into the time
+    in the shaped queue and the time in the pseudo queue (including transmission)
+    :param tables: see load_tables
+    :param keys: columns of UBS_Switch_Frame which identify a group, e.g. ("mode", "flow_id") to compare modes
+    :return: one row per group: keys, frames and statistics (see GroupBy.summary) of nodal_delay, shaped_queue_delay
+        and pseudo_queue_delay of the frames which were sent, and the share of the shaped queue in the mean delay
+    """
+    table: ResultTable = tables["UBS_Switch_Frame"]
+    group_by = GroupBy(table, keys)
+    statistics = [{"frames": group_by.sizes}]
+    for name in ("nodal_delay", "shaped_queue_delay", "pseudo_queue_delay"):
+        statistics.append(group_by.summary(table.values(name), name, quantiles))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        statistics.append({"shaped_share": statistics[2]["shaped_queue_delay_mean"] /
+                           statistics[1]["nodal_delay_mean"]})
+    return group_by.rows(*statistics)
+
+
+def pivot(summary: list, index: tuple, column: str, value: str) -> list:
+    """
+    rearranges a summary table to compare one statistic, e.g. pivot(rows, ("flow_id",), "mode", "nodal_delay_p99")
+    compares the p99 delay of every flow in lrq, tbe and shapeless switches
+    :param summary: result of flow_delay_summary or hop_delay_summary
+    :param index: columns which identify a row of the result
+    :param column: column whose values become the columns of the result, named <value>_<column value>
+    :param value: statistic which is compared
+    :return: one row per combination of the index columns, "" if a combination has no value
+    """
+    rows = dict()
+    names = list()
+    for row in summary:
+        name = "%s_%s" % (value, row[column])
+        if name not in names:
+            names.append(name)
+        rows.setdefault(tuple(row[key] for key in index), dict())[name] = row[value]
+    result = list()
+    for key_values, values in rows.items():
+        row = dict(zip(index, key_values))
+        for name in names:
+            row[name] = values.get(name, "")
+        result.append(row)
+    return result
@@ -0,0 +1,173 @@
+import hashlib
+import os
+import pickle
+
+from functools import partial
+
+# packages whose source files are hashed by simulator_version: the simulator and the scenarios, because scenario
+# functions and factories build on helpers of other scenario modules (e.g. cbs_comparison on line_scenario.build)
+VERSION_PACKAGES = ("simulation", "scenarios")
+
+_simulator_version = None
+
+
+def simulator_version() -> str:
+    """
+    :return: hash of the source files of the packages of VERSION_PACKAGES, changes whenever the simulator or a
+        scenario module changes
+    """
+    global _simulator_version
+    if _simulator_version is None:
+        root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        version_hash = hashlib.sha256()
+        for package in VERSION_PACKAGES:
+            package_path = os.path.join(root_path, package)
+            if not os.path.isdir(package_path):
+                continue
+            for filename in sorted(os.listdir(package_path)):
+                if filename.endswith(".py"):
+                    with open(os.path.join(package_path, filename), "rb") as file:
+                        version_hash.update(("%s/%s" % (package, filename)).encode())
+                        version_hash.update(file.read())
+        _simulator_version = version_hash.hexdigest()
+    return _simulator_version
+
+
+def source_hash(filename: str) -> str:
+    """
+    :return: hash of the content of file filename, "" if it can not be read
+    """
+    try:
+        with open(filename, "rb") as file:
+            return hashlib.sha256(file.read()).hexdigest()
+    except OSError:
+        return ""
+
+
+def generator_parameters(sim_generator) -> tuple:
+    """
+    :param sim_generator: generator created by a scenario function (e.g. foo("tbe", 0.5, "lrq"))
+    :return: name, arguments and source file hash of the scenario function
+    """
+    code = sim_generator.gi_code
+    frame_locals = sim_generator.gi_frame.f_locals if sim_generator.gi_frame is not None else dict()
+    argument_names = code.co_varnames[:code.co_argcount + code.co_kwonlyargcount]
+    arguments = tuple((name, frame_locals.get(name)) for name in argument_names)
+    return code.co_name, arguments, source_hash(code.co_filename)
+
+
+def factory_parameters(scenario_factory) -> tuple:
+    """
+    :param scenario_factory: module level function or functools.partial of one (see simulate_multiple_parallel)
+    :return: name, arguments and source file hash of the scenario factory
+    """
+    arguments = tuple()
+    keywords = tuple()
+    while isinstance(scenario_factory, partial):
+        arguments = scenario_factory.args + arguments
+        keywords = tuple(sorted(scenario_factory.keywords.items())) + keywords
+        scenario_factory = scenario_factory.func
+    code = scenario_factory.__code__
+    return scenario_factory.__qualname__, arguments, keywords, source_hash(code.co_filename)
+
+
+def describe(sim_env) -> tuple:
+    """
+    :type sim_env: SimulationEnvironment
+    :return: name, seed, monitor settings and structure (nodes, links, flows) of a ready SimulationEnvironment
+    """
+    nodes = list()
+    flows = list()
+    for address, node in sorted(sim_env.topology.nodes.items()):
+        nodes.append((address, type(node).__name__, node.monitor, getattr(node, "mode", None)))
+        for flow in node.get_flows():
+            path = tuple(sorted((sender, tuple(receivers)) for sender, receivers in flow.path.path_dict.items()))
+            flows.append((flow.id, path, flow.leaky_rate, flow.burstiness))
+    links = tuple(sorted(sim_env.topology.link_dict.items()))
+    return (sim_env.name, sim_env.seed, sim_env.monitor_mode, repr(sim_env.queue_monitor), tuple(nodes), links,
+            tuple(sorted(flows)))
+
+
+class ResultCache(object):
+    def __init__(self, path: str = os.path.join("results", "cache"), max_size: int = 1024 ** 3):
+        """
+        stores the tables of completed replications on disk, one file per replication. a replication is addressed
+        by the hash of its scenario parameters, seed, runtime and the simulator version (see key), so changed
+        scenarios or simulators never get old results. the source file of the scenario function and all modules of
+        VERSION_PACKAGES are hashed; a scenario which builds on modules outside of them (e.g. a helper module next
+        to a script) gets old results after those change, clear the cache then. the least recently used files are
+        removed when the cache exceeds max_size
+        :param path: directory of the cache, created if it does not exist
+        :param max_size: maximum size of all cache files in byte
+        """
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(*parameters) -> str:
+        """
+        :param parameters: everything the results depend on, reprs of the values are hashed
+        :return: cache key of the replication
+        """
+        return hashlib.sha256(repr((simulator_version(),) + parameters).encode()).hexdigest()
+
+    def file_path(self, key: str) -> str:
+        return os.path.join(self.path, "%s.pickle" % key)
+
+    def get(self, key: str):
+        """
+        :return: the cached value of key, None if it is not cached
+        """
+        path = self.file_path(key)
+        try:
+            with open(path, "rb") as file:
+                value = pickle.load(file)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (EOFError, pickle.UnpicklingError):
+            # incomplete file, e.g. the process died while it was written
+            os.remove(path)
+            self.misses += 1
+            return None
+        # the modification time is the time of last use, see evict
+        os.utime(path)
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value):
+        """
+        stores value for key and evicts old entries if the cache is too large
+        """
+        path = self.file_path(key)
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "wb") as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """
+        removes the least recently used entries until the cache is not larger than max_size
+        """
+        entries = list()
+        size = 0
+        for filename in os.listdir(self.path):
+            if filename.endswith(".pickle"):
+                stat = os.stat(os.path.join(self.path, filename))
+                entries.append((stat.st_mtime, stat.st_size, filename))
+                size += stat.st_size
+        entries.sort()
+        for mtime, file_size, filename in entries:
+            if size <= self.max_size:
+                break
+            os.remove(os.path.join(self.path, filename))
+            size -= file_size
+
+    def clear(self):
+        for filename in os.listdir(self.path):
+            if filename.endswith(".pickle"):
+                os.remove(os.path.join(self.path, filename))
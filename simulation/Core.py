@@ -1,7 +1,15 @@
 from simulation.Frame import Frame
-from simpy import Environment, Process, Interrupt
+from simulation.Forwarding import ForwardingTable
+from simulation.Instrumentation import Instrumentation
+from simpy import Environment, Event
+from simpy.core import URGENT, NORMAL
 
 from collections import defaultdict
+from heapq import heappush, heappop
+from itertools import count
+
+import os
+import pickle
 
 import numpy as np
 
@@ -16,6 +24,10 @@ class Topology(object):
             self.nodes[node.address] = node
         self.link_dict = dict()
 
+        # set by compile: (sender address, receiver address) -> egress port index of the sender
+        self.port_indices = dict()
+        self.compiled = False
+
     def connect(self, address_a: str, address_b: str, bandwidth: int = 1000):
         """
         frames send between node address_a and node address_b are transmitted with bandwidth bandwidth
@@ -54,106 +66,378 @@ class Topology(object):
         """
         return self.nodes[address]
 
+    def compile(self, flows=()):
+        """
+        freezes the topology: every node gets an index (Node.index) and a list of its egress ports (Node.ports,
+        tuples of receiver Node and bandwidth), then a ForwardingTable is compiled for every flow.
+        nodes and links must not be added afterwards
+        :param flows: flows which are compiled, see compile_flow
+        """
+        self.port_indices = dict()
+        for index, node in enumerate(self.nodes.values()):
+            node.index = index
+            node.ports = list()
+        for (address_a, address_b), bandwidth in self.link_dict.items():
+            if address_a in self.nodes and address_b in self.nodes:
+                sender = self.nodes[address_a]
+                self.port_indices[(address_a, address_b)] = sender.ports.__len__()
+                sender.ports.append((self.nodes[address_b], bandwidth))
+        self.compiled = True
+        for flow in flows:
+            self.compile_flow(flow)
+
+    def compile_flow(self, flow) -> ForwardingTable:
+        """
+        compiles the path of flow to a ForwardingTable and sets it as flow.table
+        :type flow: Flow
+        :raises ValueError: if a node of the path does not exist or two consecutive nodes of the path are not
+            connected
+        """
+        if not self.compiled:
+            raise RuntimeError("topology is not compiled")
+        node_count = self.nodes.__len__()
+        ports = [()] * node_count
+        next_hops = [()] * node_count
+        bandwidths = [()] * node_count
+        sinks = [False] * node_count
+        receiver_addresses = set()
+        # items instead of [], the defaultdict of the path does not grow
+        for sender_address, path_receivers in flow.path.path_dict.items():
+            if path_receivers.__len__() == 0:
+                continue
+            if sender_address not in self.nodes:
+                raise ValueError("flow %s: node %s of the path does not exist" % (flow.id, sender_address))
+            sender = self.nodes[sender_address]
+            node_ports = list()
+            for receiver_address in path_receivers:
+                if receiver_address not in self.nodes:
+                    raise ValueError("flow %s: node %s of the path does not exist" % (flow.id, receiver_address))
+                try:
+                    node_ports.append(self.port_indices[(sender_address, receiver_address)])
+                except KeyError:
+                    raise ValueError("flow %s: there is no link between %s and %s" %
+                                     (flow.id, sender_address, receiver_address))
+                receiver_addresses.add(receiver_address)
+            ports[sender.index] = tuple(node_ports)
+            next_hops[sender.index] = tuple(sender.ports[port][0].index for port in node_ports)
+            bandwidths[sender.index] = tuple(sender.ports[port][1] for port in node_ports)
+        for receiver_address in receiver_addresses:
+            receiver = self.nodes[receiver_address]
+            if ports[receiver.index].__len__() == 0:
+                sinks[receiver.index] = True
+        flow.table = ForwardingTable(flow.id, ports, next_hops, bandwidths, sinks)
+        return flow.table
+
 
 class Sending(object):
     def __init__(self, env, sender, receiver,
-                 frame: Frame, extra_bits: int, bandwidth: int):
+                 frame: Frame, extra_bits: int, bandwidth: int, callback=None):
         """
+        transmission of frame from sender to receiver. the transmission starts with a callback at the current time,
+        the frame is pushed to receiver after the transmission time; callback(sending) is called with a zero delay
+        after that. if env.fused_callbacks (native engine), the transmission timer is started right away and callback
+        is called right after the frame was pushed, one callback per hop instead of three
         :type receiver: Node
         :type sender: Node
         :type env: SimulationEnvironment
+        :param callback: called with this Sending object after frame reached receiver
         """
         self.env = env
         self.sender = sender
         self.receiver = receiver
         self.frame = frame
         self.bandwidth = bandwidth
+        self.callback = callback
 
         self.active = True
+        self.processed = False
+        # start of the current fragment, the transmission time of the current fragment
         self.start_time = env.now
-        self.transmission_time = (frame.__len__() * 8 + extra_bits) / bandwidth
-
-        self.process: Process = env.process(self.process_send_frame(sender, receiver, frame))
+        self.transmission_time = (frame.length * 8 + extra_bits) / bandwidth
+        # number of times the transmission was paused (see pause)
+        self.preemptions = 0
 
-    def process_send_frame(self, sender, receiver, frame: Frame):
-        while True:
-            try:
-                yield self.env.timeout(self.transmission_time)
-                frame.on_hop(sender.address, receiver.address, self.env.now)
-                receiver.push_frame(frame, sender)
-                break
-            except Interrupt:
-                pass
-            try:
-                yield self.env.sleep_event
-            except Interrupt:
-                pass
-
-    def interruptable(self) -> bool:
-        remaining_time = self.env.now - self.start_time
-        remaining_bits = remaining_time * self.bandwidth
-        # todo replace 8 with min_preemption_bits/bytes
-        if remaining_bits > 8:
-            return True
+        if env.fused_callbacks:
+            self.timer = env.call_later(self.transmission_time, self.on_transmitted)
         else:
-            return False
+            self.timer = None
+            env.call_soon(self.start_timer)
+
+    def start_timer(self):
+        if self.active:
+            self.timer = self.env.call_later(self.transmission_time, self.on_transmitted)
+
+    def on_transmitted(self):
+        self.timer = None
+        table = self.frame.flow.table
+        self.frame.on_hop(self.sender.address, self.receiver.address, self.env.now,
+                          None if table is None else table.sinks[self.receiver.index])
+        self.receiver.push_frame(self.frame, self.sender)
+        self.processed = True
+        if self.callback is not None:
+            if self.env.fused_callbacks:
+                self.callback(self)
+            else:
+                self.env.call_later(0, self.callback, self)
 
-    def pause(self):
+    def location(self) -> (str, str):
+        return self.sender.address, self.receiver.address
+
+    def remaining_bits(self) -> float:
+        """
+        :return: bits of the current fragment which are not sent yet
+        """
+        if not self.active:
+            return self.transmission_time * self.bandwidth
+        return (self.transmission_time - (self.env.now - self.start_time)) * self.bandwidth
+
+    def preemption_delay(self, min_fragment_bits: int = 512):
+        """
+        802.3br: every fragment, the sent one and the remaining one, has at least min_fragment_bits bits
+        :param min_fragment_bits: minimum fragment size in bit; default = 64 byte
+        :return: time until the transmission can be paused, 0 if it can be paused now, None if it can not be paused
+            anymore
+        """
+        if not self.active or self.processed:
+            return None
+        sent_bits = (self.env.now - self.start_time) * self.bandwidth
+        remaining_bits = self.transmission_time * self.bandwidth - sent_bits
+        missing_bits = min_fragment_bits - sent_bits
+        # less than a bit is missing: rounding error of the time the fragment was waited for
+        if missing_bits < 1e-6:
+            missing_bits = 0
+        if remaining_bits - missing_bits < min_fragment_bits - 1e-6:
+            return None
+        return missing_bits / self.bandwidth
+
+    def interruptable(self, min_fragment_bits: int = 512) -> bool:
+        return self.preemption_delay(min_fragment_bits) == 0
+
+    def pause(self, overhead_bits: int = 0):
+        """
+        preempts the transmission, the rest of the frame is sent as a new fragment when start is called
+        :param overhead_bits: bits added to the remaining fragment (preamble, fragment header, checksum and gap)
+        """
         if self.active:
-            remaining_time = self.env.now - self.start_time
-            remaining_bits = remaining_time * self.bandwidth
-            # todo replace 0 with preemption_penalty_bits/bytes
-            remaining_bits += 0
-            self.transmission_time = remaining_bits / self.bandwidth
+            self.transmission_time = (self.remaining_bits() + overhead_bits) / self.bandwidth
             self.active = False
-            self.process.interrupt("pause")
+            self.preemptions += 1
+            if self.timer is not None:
+                self.env.cancel(self.timer)
+                self.timer = None
 
     def start(self):
+        """
+        resumes a transmission paused with pause
+        """
         if not self.active:
             self.start_time = self.env.now
             self.active = True
-            self.process.interrupt("start")
+            self.timer = self.env.call_later(self.transmission_time, self.on_transmitted)
 
 
 class SimulationEnvironment(Environment):
 
     id = dict()
 
-    def __init__(self, name: str = "no_name", seed: int = None, verbose: bool = False, *args, **kwargs):
+    # engine used for new SimulationEnvironments if no engine is given: "simpy" or "native"
+    engine = "simpy"
+    # zero delay callbacks of the model are called directly instead of being scheduled: start and completion of a
+    # Sending, waking up an egress port, a talker or a shaper. results are equivalent, but simultaneous events are
+    # processed in a different order than with SimPy. only the native engine does this
+    fused_callbacks = False
+    # if True, new SimulationEnvironments are instrumented (see instrument)
+    instrumented = False
+    # monitoring of new SimulationEnvironments if no monitor_mode is given: "rows" or "statistics"
+    monitor_mode = "rows"
+    # queue monitoring of new SimulationEnvironments if no queue_monitor is given: None or a QueueMonitor
+    queue_monitor = None
+
+    def __new__(cls, *args, engine: str = None, **kwargs):
+        if cls is SimulationEnvironment and (engine or SimulationEnvironment.engine) == "native":
+            cls = NativeSimulationEnvironment
+        return super(SimulationEnvironment, cls).__new__(cls)
+
+    def __init__(self, name: str = "no_name", seed: int = None, verbose: bool = False, *args,
+                 engine: str = None, instrument: bool = False, monitor_mode: str = None, queue_monitor=None,
+                 **kwargs):
         """
+        nodes only use now, call_later, call_at, call_soon and cancel of the environment, so every simulation can run on
+        SimPy (default) or on the native kernel (see NativeSimulationEnvironment)
         :param topology: Topology of the Network
         :param name: Name of this specific Simulation
         :param seed: Seed for the random generator
+        :param engine: "simpy" or "native"; default = SimulationEnvironment.engine
+        :param instrument: see instrument; default = SimulationEnvironment.instrumented
+        :param monitor_mode: "rows": monitored nodes keep one row per frame (and per queue change);
+            "statistics": monitored nodes only keep constant memory summaries per flow and queue (delay moments and
+            quantiles, time weighted backlog), get_data returns these summaries;
+            default = SimulationEnvironment.monitor_mode
+        :param queue_monitor: QueueMonitor: monitored schedulers keep occupancy histograms (and snapshots) of their
+            queues instead of a change log; default = SimulationEnvironment.queue_monitor
         """
         super(SimulationEnvironment, self).__init__(*args, **kwargs)
         self.topology = None
 
         self.verbose = verbose
         self.name = name
+        self.id = SimulationEnvironment.next_id(name)
+        self.random = np.random.RandomState(seed=seed)
+        self.seed = seed if seed is not None else ""
+        self.monitor_mode = monitor_mode or SimulationEnvironment.monitor_mode
+        self.queue_monitor = queue_monitor or SimulationEnvironment.queue_monitor
+
+        self.next_frame_id = 0
+
+        # if set, monitored nodes emit their rows to this sink while the simulation is running (see CSVSink)
+        self.sink = None
+
+        self.instrumentation = None
+        if instrument or SimulationEnvironment.instrumented:
+            self.instrument()
+
+    @staticmethod
+    def next_id(name: str) -> int:
+        """
+        :param name: Name of a Simulation
+        :return: id for the next Simulation with name name; ids start at 1 and are counted per name
+        """
         try:
-            self.id = SimulationEnvironment.id[name]
+            sim_id = SimulationEnvironment.id[name]
             SimulationEnvironment.id[name] += 1
         except KeyError:
-            self.id = 1
+            sim_id = 1
             SimulationEnvironment.id[name] = 2
-        self.random = np.random.RandomState(seed=seed)
-        self.seed = seed if seed is not None else ""
+        return sim_id
 
-        self.next_frame_id = 0
+    def instrument(self) -> Instrumentation:
+        """
+        from now on all callbacks are counted and timed per node, port and event source (see Instrumentation).
+        call before the nodes are created to include their first callbacks.
+        call_later, call_at and call_soon are replaced by instrumented versions on this object only,
+        not instrumented SimulationEnvironments are not slowed down
+        :return: the Instrumentation, also available as instrumentation
+        """
+        if self.instrumentation is None:
+            instrumentation = Instrumentation()
+            wrap = instrumentation.wrap
+            call_later, call_at, call_soon = self.call_later, self.call_at, self.call_soon
+
+            def instrumented_call_later(delay, callback, *args):
+                return call_later(delay, wrap(callback, "later"), *args)
+
+            def instrumented_call_at(time, callback, *args):
+                return call_at(time, wrap(callback, "at"), *args)
+
+            def instrumented_call_soon(callback, *args):
+                return call_soon(wrap(callback, "soon"), *args)
+
+            self.call_later = instrumented_call_later
+            self.call_at = instrumented_call_at
+            self.call_soon = instrumented_call_soon
+            self.instrumentation = instrumentation
+        return self.instrumentation
+
+    def compile(self):
+        """
+        compiles the topology and the flows of all nodes to forwarding tables (see Topology.compile), the nodes
+        forward frames with these tables. called by run if the topology is not compiled yet
+        """
+        flows = list()
+        for node in self.topology.nodes.values():
+            flows += node.get_flows()
+        self.topology.compile(flows)
 
-        self.sleep_event = self.event()
+    def run(self, until=None):
+        if self.topology is not None and not self.topology.compiled:
+            self.compile()
+        return super(SimulationEnvironment, self).run(until)
+
+    def processed_events(self) -> int:
+        """
+        :return: number of events (SimPy) or callbacks (native) processed so far, including cancelled ones.
+            one event id is used up, this does not change the order of the events
+        """
+        return next(self._eid) - self._queue.__len__()
 
     def get_data(self) -> dict:
         results = defaultdict(list)
+        for dict_format, frame_dict in self.iter_data():
+            results[dict_format].append(frame_dict)
+        return results
+
+    def iter_data(self):
+        """
+        yields (name of the table, row) for all rows of the monitored nodes, the rows get_data collects. the rows are
+        created when they are requested, with the columns of this simulation and of the node first, e.g. to write
+        them to a sink: for dict_format, row in sim_env.iter_data(): sink.emit(dict_format, row)
+        """
+        context = {"sim_name": self.name, "sim_id": self.id, "seed": self.seed}
         for node_address, node in self.topology.nodes.items():
             if node.monitor:
-                node_results = node.get_data()
-                for node_result_list, dict_format in node_results:
-                    for frame_dict in node_result_list:
-                        tmp_dict = {"sim_name": self.name, "sim_id": self.id, "seed": self.seed}
-                        tmp_dict.update(frame_dict)
-                        results[dict_format].append(tmp_dict)
-        return results
+                yield from node.iter_data(context)
+
+    def emit(self, dict_format: str, *frame_dicts: dict):
+        """
+        emits one row of table dict_format to the sink
+        :param dict_format: name of the table
+        :param frame_dicts: columns of the row, merged in this order after the columns of this simulation
+        """
+        tmp_dict = {"sim_name": self.name, "sim_id": self.id, "seed": self.seed}
+        for frame_dict in frame_dicts:
+            tmp_dict.update(frame_dict)
+        self.sink.emit(dict_format, tmp_dict)
+
+    def flush_data(self):
+        """
+        call after the simulation ended, monitored nodes emit all rows they still hold to the sink
+        """
+        for node_address, node in self.topology.nodes.items():
+            if node.monitor:
+                node.flush_data()
+
+    def call_later(self, delay, callback, *args) -> Event:
+        """
+        calls callback(*args) after delay, without a process
+        :return: handle for cancel
+        """
+        event = self.timeout(delay)
+        event.callbacks.append(lambda _: callback(*args))
+        return event
+
+    def call_at(self, time, callback, *args) -> Event:
+        """
+        calls callback(*args) at the absolute time time (>= now), without a process. unlike
+        call_later(time - now, ...) the callback is called exactly at time, there is no rounding error
+        :return: handle for cancel
+        """
+        event = Event(self)
+        event._ok = True
+        event._value = None
+        event.callbacks.append(lambda _: callback(*args))
+        heappush(self._queue, (time, NORMAL, next(self._eid), event))
+        return event
+
+    def call_soon(self, callback, *args) -> Event:
+        """
+        calls callback(*args) at the current time, before any normal event of the current time which is already
+        scheduled (same priority as a process interrupt)
+        :return: handle for cancel
+        """
+        event = Event(self)
+        event._ok = True
+        event._value = None
+        event.callbacks.append(lambda _: callback(*args))
+        self.schedule(event, URGENT)
+        return event
+
+    @staticmethod
+    def cancel(handle: Event):
+        """
+        the callback of handle (see call_later, call_soon) will not be called
+        """
+        if handle.callbacks is not None:
+            handle.callbacks.clear()
 
     def sim_print(self, msg):
         if self.verbose:
@@ -166,16 +450,153 @@ class SimulationEnvironment(Environment):
         self.next_frame_id += 1
         return self.next_frame_id - 1
 
-    def send_frame(self, sender_address: str, receiver_address: str, frame: Frame, extra_bits: int = 0) -> Sending:
+    def send_frame(self, sender_address: str, receiver_address: str, frame: Frame, extra_bits: int = 0,
+                   callback=None) -> Sending:
         """
         sends the frame from node sender_address to node receiver_address
         :param sender_address:
         :param receiver_address:
         :param frame: frame to send
         :param extra_bits: extra bits to send with the frame; increases the time needed to send the frame
+        :param callback: called with the Sending object after the frame reached node receiver_address
         :return: Sending object for this sending operation
         """
         sender = self.topology[sender_address]
         receiver = self.topology[receiver_address]
         bandwidth = self.topology.bandwidth(sender_address, receiver_address)
-        return Sending(self, sender, receiver, frame, extra_bits, bandwidth)
+        return Sending(self, sender, receiver, frame, extra_bits, bandwidth, callback)
+
+
+class NativeSimulationEnvironment(SimulationEnvironment):
+    # plain attribute instead of the property of simpy.Environment
+    now = 0
+    fused_callbacks = True
+
+    def __init__(self, name: str = "no_name", seed: int = None, verbose: bool = False, *args, **kwargs):
+        """
+        SimulationEnvironment on a native kernel: a heap of plain callbacks, no SimPy events, processes or
+        interrupts. callbacks are ordered like SimPy orders events (time, call_soon before call_later, order
+        of scheduling), but the zero delay callbacks of the model are fused (see fused_callbacks): the results are
+        the same rows, simultaneous events may be recorded in a different order (see scenarios.engine_regression).
+        only call_later, call_at, call_soon, cancel and run can be used, SimPy processes and events are not supported.
+        create it with SimulationEnvironment(..., engine="native") or directly
+        """
+        super(NativeSimulationEnvironment, self).__init__(name, seed, verbose, *args, **kwargs)
+        self.now = self._now
+        # heap of [time, priority, sequence number, callback, args]; callback is None if cancelled
+        self.calendar = list()
+        self.sequence = count()
+
+    def call_later(self, delay, callback, *args) -> list:
+        entry = [self.now + delay, NORMAL, next(self.sequence), callback, args]
+        heappush(self.calendar, entry)
+        return entry
+
+    def call_at(self, time, callback, *args) -> list:
+        entry = [time, NORMAL, next(self.sequence), callback, args]
+        heappush(self.calendar, entry)
+        return entry
+
+    def call_soon(self, callback, *args) -> list:
+        entry = [self.now, URGENT, next(self.sequence), callback, args]
+        heappush(self.calendar, entry)
+        return entry
+
+    @staticmethod
+    def cancel(handle: list):
+        handle[3] = None
+
+    def processed_events(self) -> int:
+        return next(self.sequence) - self.calendar.__len__()
+
+    def schedule(self, event, priority=NORMAL, delay=0):
+        raise NotImplementedError("SimPy events are not supported by the native kernel, use call_later/call_soon")
+
+    def __getstate__(self):
+        if self.instrumentation is not None:
+            raise ValueError("instrumented simulations can not be saved")
+        if self.sink is not None:
+            raise ValueError("simulations with a sink can not be saved, rows already written would be written again")
+        state = self.__dict__.copy()
+        # counters are saved as their next value
+        sequence = next(self.sequence)
+        self.sequence = count(sequence)
+        state["sequence"] = sequence
+        del state["_eid"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.sequence = count(state["sequence"])
+        self._eid = count()
+
+    def save_checkpoint(self, path: str):
+        """
+        saves the complete state of this simulation to file path: topology, nodes, queues, shaper states,
+        frames in transmission, scheduled callbacks and random states. load_checkpoint restores it, the restored
+        simulation continues exactly like this one.
+        all objects of the simulation must be picklable, e.g. payload and time generators have to be samplers
+        (see Sampler) instead of generator functions. the file is replaced atomically
+        """
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as file:
+                pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        except (TypeError, AttributeError, pickle.PicklingError) as e:
+            os.remove(tmp_path)
+            raise TypeError("simulation %s can not be saved, all its objects have to be picklable "
+                            "(use samplers instead of generator functions): %s" % (self.name, e))
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load_checkpoint(path: str):
+        """
+        :return: the simulation saved by save_checkpoint to file path
+        :rtype: NativeSimulationEnvironment
+        """
+        with open(path, "rb") as file:
+            return pickle.load(file)
+
+    def peek(self):
+        """
+        :return: time of the next scheduled callback, infinity if there is none
+        """
+        return self.calendar[0][0] if self.calendar.__len__() > 0 else float("inf")
+
+    def step(self):
+        """
+        processes the next callback
+        """
+        entry = heappop(self.calendar)
+        self.now = self._now = entry[0]
+        if entry[3] is not None:
+            entry[3](*entry[4])
+
+    def run(self, until=None):
+        """
+        runs until the time until is reached, like simpy.Environment.run callbacks at time until are not called;
+        runs until no callback is scheduled if until is None
+        """
+        if self.topology is not None and not self.topology.compiled:
+            self.compile()
+        calendar = self.calendar
+        if until is None:
+            while calendar.__len__() > 0:
+                self.now, _, _, callback, args = heappop(calendar)
+                if callback is not None:
+                    callback(*args)
+            self._now = self.now
+            return
+        at = float(until)
+        if at <= self.now:
+            raise ValueError("until (%s) must be greater than the current simulation time" % at)
+        stop = [at, URGENT, next(self.sequence), None, None]
+        heappush(calendar, stop)
+        while True:
+            entry = heappop(calendar)
+            self.now, _, _, callback, args = entry
+            if callback is not None:
+                callback(*args)
+            elif entry is stop:
+                break
+        self.now = self._now = at
@@ -2,6 +2,8 @@ from simulation import Path
 
 
 class Flow(object):
+    __slots__ = ("id", "path", "leaky_rate", "burstiness", "table")
+
     def __init__(self, flow_id: int, path: Path, leaky_rate: float, burstiness: float = 0):
         """
         :param flow_id: id/index of this flow, this has to be unique
@@ -13,3 +15,5 @@ class Flow(object):
         self.path = path
         self.leaky_rate = leaky_rate
         self.burstiness = burstiness
+        # ForwardingTable of path, set when the topology is compiled (see Topology.compile)
+        self.table = None
@@ -0,0 +1,18 @@
+class ForwardingTable(object):
+    __slots__ = ("flow_id", "ports", "next_hops", "bandwidths", "sinks")
+
+    def __init__(self, flow_id: int, ports: list, next_hops: list, bandwidths: list, sinks: list):
+        """
+        frozen path of one flow, all lists are indexed with Node.index (see Topology.compile)
+        :param flow_id: id of the flow
+        :param ports: per node a tuple of the egress port indices (index of Node.ports) the frames of the flow are
+            forwarded to, () if the node does not forward them
+        :param next_hops: per node a tuple of the node indices of the receivers, same order as ports
+        :param bandwidths: per node a tuple of the link bandwidths, same order as ports
+        :param sinks: per node True if it is a last node of the path, the frames of the flow are delivered there
+        """
+        self.flow_id = flow_id
+        self.ports = ports
+        self.next_hops = next_hops
+        self.bandwidths = bandwidths
+        self.sinks = sinks
@@ -2,6 +2,9 @@ from simulation import Flow
 
 
 class Frame(object):
+    __slots__ = ("id", "payload", "priority", "header", "length", "flow", "traffic_class", "start_time", "hop",
+                 "receptions", "talker")
+
     def __init__(self, frame_id: int, flow: Flow, payload: int, priority: int, start_time: int = -1, header: int = 0):
         """
         :param frame_id:
@@ -14,21 +17,84 @@ class Frame(object):
         self.payload = payload
         self.priority = priority
         self.header = header
+        # payload + header, computed once; payload and header must not be changed afterwards
+        self.length = payload + header
         self.flow = flow
 
         # value which stores the last traffic class used to send this frame (UBS needs this)
         self.traffic_class = priority
         self.start_time = start_time
         self.hop = 0
-        self.delays = dict()
+        # tuple of (receiver_address, delay) pairs, None until the frame reached its first receiver.
+        # most frames reach exactly one receiver, so no dict is allocated per frame
+        self.receptions = None
+        # monitoring talker which send this frame, it is notified when the frame reaches a receiver
+        self.talker = None
 
-    def on_hop(self, sender_address: str, receiver_address: str, time: int):
+    @property
+    def delays(self) -> dict:
+        """
+        :return: dict receiver_address -> delay of all receivers this frame reached so far
+        """
+        if self.receptions is None:
+            return dict()
+        return dict(self.receptions)
+
+    def on_hop(self, sender_address: str, receiver_address: str, time: int, sink: bool = None):
+        """
+        called when the frame reached receiver_address
+        :param sink: True if receiver_address is a last node of the path (see ForwardingTable.sinks);
+            looked up in the path if None
+        """
+        if sink is None:
+            sink = receiver_address not in self.flow.path.path_dict
         # last receiver
-        if receiver_address not in self.flow.path.path_dict:
-            self.delays[receiver_address] = time - self.start_time
+        if sink:
+            delay = time - self.start_time
+            if self.receptions is None:
+                self.receptions = ((receiver_address, delay),)
+            else:
+                self.receptions += ((receiver_address, delay),)
+            if self.talker is not None:
+                self.talker.on_frame_delivered(self, receiver_address, delay)
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return "_".join(("frame", str(self.id), str(self.length), "flow", str(self.flow.id)))
+
+
+class FrameCopy(object):
+    __slots__ = ("frame", "id", "payload", "priority", "header", "length", "flow", "start_time", "traffic_class", "hop")
+
+    def __init__(self, frame):
+        """
+        copy of a frame for one branch of a multicast path. the copy has its own traffic class and hop, everything
+        else is taken from the original frame, receptions are reported to the original frame
+        :param frame: Frame or FrameCopy which is copied
+        :type frame: Frame
+        """
+        self.frame: Frame = frame.frame if isinstance(frame, FrameCopy) else frame
+        self.id = frame.id
+        self.payload = frame.payload
+        self.priority = frame.priority
+        self.header = frame.header
+        self.length = frame.length
+        self.flow = frame.flow
+        self.start_time = frame.start_time
+        self.traffic_class = frame.traffic_class
+        self.hop = frame.hop
+
+    @property
+    def delays(self) -> dict:
+        return self.frame.delays
+
+    def on_hop(self, sender_address: str, receiver_address: str, time: int, sink: bool = None):
+        self.frame.on_hop(sender_address, receiver_address, time, sink)
 
     def __len__(self):
-        return self.payload + self.header
+        return self.length
 
     def __str__(self):
-        return "_".join(("frame", str(self.id), str(self.__len__()), "flow", str(self.flow.id)))
+        return self.frame.__str__()
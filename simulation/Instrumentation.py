@@ -0,0 +1,72 @@
+from time import perf_counter
+
+
+class Instrumentation(object):
+    def __init__(self):
+        """
+        counts the callbacks of a SimulationEnvironment and measures their cumulative wall time, per node, port and
+        event source. the event source of a callback is <class>.<method>, e.g. Sending.on_transmitted for sending
+        completions, TBEShaper.serve for shaper releases or Egress.on_frame_sent for egress loop iterations.
+        kind is the way the callback was scheduled: "soon" callbacks are wake-ups (e.g. of a sleeping egress port),
+        "later" and "at" callbacks are timers.
+        the wall time of a callback includes everything it does synchronously, e.g. Sending.on_transmitted includes
+        the reception of the frame by the next node.
+        created by SimulationEnvironment.instrument, without it nothing is measured and nothing is slowed down
+        """
+        # (node, port, source, kind) -> [calls, wall time in seconds]
+        self.stats = dict()
+
+    def wrap(self, callback, kind: str):
+        """
+        :return: callback which calls callback and adds its wall time to the stats of its event source
+        """
+        owner = getattr(callback, "__self__", None)
+        location = getattr(owner, "location", None)
+        node, port = location() if location is not None else ("", "")
+        source = "%s.%s" % (type(owner).__name__, callback.__name__) if owner is not None else callback.__name__
+        key = (node, port, source, kind)
+        try:
+            stat = self.stats[key]
+        except KeyError:
+            stat = [0, 0.0]
+            self.stats[key] = stat
+
+        def timed_callback(*args):
+            start = perf_counter()
+            callback(*args)
+            stat[1] += perf_counter() - start
+            stat[0] += 1
+        return timed_callback
+
+    def merge(self, other):
+        """
+        adds the stats of Instrumentation other to this one
+        """
+        for key, (calls, wall_time) in other.stats.items():
+            stat = self.stats.setdefault(key, [0, 0.0])
+            stat[0] += calls
+            stat[1] += wall_time
+
+    def get_data(self) -> list:
+        """
+        :return: one dict per node, port, source and kind, the most expensive first
+        """
+        result = list()
+        for (node, port, source, kind), (calls, wall_time) in self.stats.items():
+            if calls > 0:
+                result.append({"node": node, "port": port, "source": source, "kind": kind, "calls": calls,
+                               "wall_time": wall_time, "mean_time": wall_time / calls})
+        result.sort(key=lambda stat_dict: stat_dict["wall_time"], reverse=True)
+        return result
+
+    def report(self) -> str:
+        """
+        :return: the stats as text table, the most expensive first
+        """
+        lines = ["%-12s %-12s %-32s %-6s %10s %10s %10s" % ("node", "port", "source", "kind", "calls",
+                                                           "time [s]", "mean [us]")]
+        for stat_dict in self.get_data():
+            lines.append("%-12s %-12s %-32s %-6s %10d %10.3f %10.2f" % (
+                stat_dict["node"], stat_dict["port"], stat_dict["source"], stat_dict["kind"], stat_dict["calls"],
+                stat_dict["wall_time"], stat_dict["mean_time"] * 1e6))
+        return "\n".join(lines)
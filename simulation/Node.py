@@ -1,5 +1,6 @@
 from simulation.Frame import Frame
 from simulation.Core import SimulationEnvironment, Sending
+from simulation.Statistics import DelayStatistics
 
 
 class Node(object):
@@ -7,6 +8,15 @@ class Node(object):
         self.env = env
         self.address = address
         self.monitor = monitor
+        # set when the topology is compiled: index of this node and list of (receiver Node, bandwidth) per port
+        self.index = None
+        self.ports = None
+
+    def location(self) -> (str, str):
+        """
+        :return: address and port (none) of this node, see Instrumentation
+        """
+        return self.address, ""
 
     def on_frame_received(self, frame: Frame, sender):
         """
@@ -27,7 +37,7 @@ class Node(object):
         self.on_frame_received(frame, sender)
 
     def send_frame(self, receiver_address: str, frame: Frame,
-                   extra_bits: int = 0, traffic_class: int = None) -> Sending:
+                   extra_bits: int = 0, traffic_class: int = None, callback=None) -> Sending:
         """
         call to send a frame from this node to receiver_address
         :param receiver_address:
@@ -35,6 +45,7 @@ class Node(object):
         :param extra_bits:
         :param traffic_class: traffic class in which this frame is send (will be saved in frame), if not specified
         frame.priority is used. important for UBS
+        :param callback: called with the Sending object after the frame reached receiver_address
         :return: Sending object
         """
         frame.hop += 1
@@ -43,19 +54,96 @@ class Node(object):
             frame.traffic_class = traffic_class
         else:
             frame.traffic_class = frame.priority
-        sending_object: Sending = self.env.send_frame(self.address, receiver_address, frame, extra_bits)
+        sending_object: Sending = self.env.send_frame(self.address, receiver_address, frame, extra_bits, callback)
         return sending_object
 
+    def send_frame_port(self, port: int, frame: Frame,
+                        extra_bits: int = 0, traffic_class: int = None, callback=None) -> Sending:
+        """
+        like send_frame, sends the frame on egress port port (see ForwardingTable.ports) without looking up
+        receiver and bandwidth in the topology
+        """
+        frame.hop += 1
+        if traffic_class is not None:
+            frame.traffic_class = traffic_class
+        else:
+            frame.traffic_class = frame.priority
+        receiver, bandwidth = self.ports[port]
+        return Sending(self.env, self, receiver, frame, extra_bits, bandwidth, callback)
+
+    def get_flows(self) -> list:
+        """
+        :return: flows whose frames are created by this node, they are compiled with the topology
+        """
+        return list()
+
     def get_data(self) -> list((list, str)):
         """
         returns a list of 2 tuples. each tuple contains a list of dicts (table) and a str (name of the table)
         """
         pass
 
+    def iter_data(self, context: dict):
+        """
+        yields (name of the table, row) for all rows of get_data, every row is a new dict which starts with the
+        columns of context. nodes with large tables create their rows lazily instead
+        """
+        node_results = self.get_data()
+        if node_results is None:
+            return
+        for rows, dict_format in node_results:
+            for row in rows:
+                tmp_dict = dict(context)
+                tmp_dict.update(row)
+                yield dict_format, tmp_dict
+
+    def flush_data(self):
+        """
+        emits all rows which were not emitted yet to env.sink (see SimulationEnvironment.emit)
+        """
+        pass
+
+    def backlog(self) -> (int, float):
+        """
+        :return: number of frames and bytes which this node holds (queued, waiting or being sent), for progress
+            reports
+        """
+        return 0, 0
+
 
 class Listener(Node):
     def __init__(self, env: SimulationEnvironment, address: str, monitor: bool = False):
-        super(Listener, self).__init__(env, address, False)
+        """
+        :param monitor: only used if env.monitor_mode is "statistics", then the end to end delay of the received
+            frames is summarized per flow
+        """
+        super(Listener, self).__init__(env, address, monitor and env.monitor_mode == "statistics")
+        # flow id -> DelayStatistics of the received frames
+        self.flow_statistics = dict()
 
     def on_frame_received(self, frame: Frame, sender):
         self.env.sim_print("received frame")
+        if self.monitor:
+            try:
+                delays = self.flow_statistics[frame.flow.id]
+            except KeyError:
+                delays = DelayStatistics()
+                self.flow_statistics[frame.flow.id] = delays
+            delays.add(self.env.now - frame.start_time)
+
+    def get_statistics_dicts(self) -> list:
+        result = list()
+        for flow_id, delays in sorted(self.flow_statistics.items()):
+            statistics_dict = {"receiver": self.address, "flow_id": flow_id, "frames": delays.moments.count}
+            statistics_dict.update(delays.to_dict("delay"))
+            result.append(statistics_dict)
+        return result
+
+    def get_data(self) -> list((list, str)):
+        if self.monitor:
+            return [(self.get_statistics_dicts(), "listener_statistics")]
+        return None
+
+    def flush_data(self):
+        for statistics_dict in self.get_statistics_dicts():
+            self.env.emit("listener_statistics", statistics_dict)
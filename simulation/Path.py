@@ -29,5 +29,20 @@ class Path(object):
         """
         return self.path_dict[node_address]
 
+    def receivers(self, node_address: str) -> list:
+        """
+        :param node_address: sending address to check
+        :return: list of addresses of all last nodes on this path which are reached from node_address
+        """
+        receivers = list()
+        stack = [node_address]
+        while stack.__len__() > 0:
+            current_node = stack.pop()
+            if current_node not in self.path_dict:
+                receivers.append(current_node)
+            else:
+                stack += self.path_dict[current_node]
+        return receivers
+
     def __str__(self):
         return str(self.path_dict)
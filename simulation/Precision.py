@@ -0,0 +1,186 @@
+from collections import defaultdict
+from math import atan, cos, inf, isnan, pi, sin, sqrt
+from statistics import NormalDist
+
+import numpy as np
+
+
+# degrees of freedom up to which student_t_quantile inverts the exact distribution function
+EXACT_T_DF = 30
+
+
+def student_t_cdf(t: float, df: int) -> float:
+    """
+    distribution function of the student t distribution with an integer number df of degrees of freedom, exact
+    (Abramowitz and Stegun 26.7.3, 26.7.4)
+    """
+    theta = atan(t / sqrt(df))
+    cos2 = cos(theta) ** 2
+    total = 1.0
+    term = 1.0
+    if df % 2 == 1:
+        for k in range(1, (df - 1) // 2):
+            term *= 2 * k / (2 * k + 1) * cos2
+            total += term
+        probability = 2 / pi * (theta + (sin(theta) * cos(theta) * total if df > 1 else 0))
+    else:
+        for k in range(1, df // 2):
+            term *= (2 * k - 1) / (2 * k) * cos2
+            total += term
+        probability = sin(theta) * total
+    return (1 + probability) / 2
+
+
+def student_t_quantile(p: float, df: int) -> float:
+    """
+    p quantile (p > 0.5) of the student t distribution with df degrees of freedom. for df <= EXACT_T_DF the exact
+    distribution function is inverted, above the Cornish-Fisher expansion of the normal quantile is used (error below
+    0.001% for p <= 0.9995). the expansion is too small for small df, e.g. 9.51 instead of 9.92 for p = 0.995, df = 2
+    """
+    if df <= EXACT_T_DF:
+        low = 0.0
+        high = 1.0
+        while student_t_cdf(high, df) < p:
+            high *= 2
+        for i in range(64):
+            middle = (low + high) / 2
+            if student_t_cdf(middle, df) < p:
+                low = middle
+            else:
+                high = middle
+        return high
+    z = NormalDist().inv_cdf(p)
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+    return z + g1 / df + g2 / df ** 2 + g3 / df ** 3 + g4 / df ** 4
+
+
+def flow_delay_metrics(sim_result: dict) -> dict:
+    """
+    mean and p99 end to end delay of every flow of one replication, from the talker table (monitor_mode "rows") or
+    the talker_statistics table (monitor_mode "statistics")
+    :param sim_result: tables of one replication (see SimulationEnvironment.get_data)
+    :return: metric name -> value, e.g. "flow_1_mean_delay", "flow_1_p99_delay"
+    """
+    metrics = dict()
+    delays = defaultdict(list)
+    for frame_dict in sim_result.get("talker", ()):
+        delay = frame_dict["delay"]
+        if delay != "" and not isnan(delay):
+            delays[frame_dict["flow_id"]].append(delay)
+    for flow_id, flow_delays in delays.items():
+        metrics["flow_%s_mean_delay" % flow_id] = float(np.mean(flow_delays))
+        metrics["flow_%s_p99_delay" % flow_id] = float(np.quantile(flow_delays, 0.99))
+    for statistics_dict in sim_result.get("talker_statistics", ()):
+        if statistics_dict["delay_mean"] != "":
+            metrics["flow_%s_mean_delay" % statistics_dict["flow_id"]] = statistics_dict["delay_mean"]
+            metrics["flow_%s_p99_delay" % statistics_dict["flow_id"]] = statistics_dict["delay_p99"]
+    return metrics
+
+
+class PrecisionTarget(object):
+    def __init__(self, relative_width: float = 0.05, confidence: float = 0.95, min_count: int = 5,
+                 metrics=flow_delay_metrics):
+        """
+        stopping rule for replications: replications are added until the confidence interval of the mean of every
+        metric over the replications is narrower than relative_width (independent replications, student t interval)
+        :param relative_width: maximum half width of the confidence intervals relative to their mean,
+            e.g. 0.05 = mean +- 5%
+        :param confidence: confidence level of the intervals
+        :param min_count: minimum number of replications before the intervals are checked, at least 3
+        :param metrics: function which returns a dict metric name -> value for the tables of one replication;
+            metrics which are missing in a replication only use the other replications
+        """
+        if min_count < 3:
+            raise ValueError("min_count has to be at least 3")
+        self.relative_width = relative_width
+        self.confidence = confidence
+        self.min_count = min_count
+        self.metrics = metrics
+
+    def tracker(self):
+        """
+        :return: new PrecisionTracker for one sweep point
+        """
+        return PrecisionTracker(self)
+
+
+class PrecisionTracker(object):
+    def __init__(self, target: PrecisionTarget):
+        """
+        collects the metrics of the replications of one sweep point, see PrecisionTarget
+        """
+        self.target = target
+        self.count = 0
+        # metric name -> values of the replications
+        self.values = defaultdict(list)
+
+    def add(self, sim_result: dict):
+        """
+        adds the metrics of one replication
+        :param sim_result: tables of the replication (see SimulationEnvironment.get_data)
+        """
+        self.count += 1
+        for name, value in self.target.metrics(sim_result).items():
+            self.values[name].append(value)
+
+    def interval(self, name: str) -> (float, float, float):
+        """
+        :return: mean, half width of the confidence interval and half width relative to the mean of metric name;
+            the widths are inf for less than 2 values
+        """
+        values = self.values[name]
+        count = values.__len__()
+        if count == 0:
+            return float("nan"), inf, inf
+        mean = sum(values) / count
+        if count < 2:
+            return mean, inf, inf
+        std = sqrt(sum((value - mean) ** 2 for value in values) / (count - 1))
+        half_width = student_t_quantile((1 + self.target.confidence) / 2, count - 1) * std / sqrt(count)
+        if half_width == 0:
+            return mean, 0.0, 0.0
+        return mean, half_width, half_width / abs(mean) if mean != 0 else inf
+
+    def converged(self) -> bool:
+        """
+        :return: True if at least min_count replications were added and all intervals are narrow enough
+        """
+        if self.count < self.target.min_count:
+            return False
+        if self.values.__len__() == 0:
+            raise ValueError("the replications have no metrics, are the talkers monitored?")
+        for name in self.values.keys():
+            if self.interval(name)[2] > self.target.relative_width:
+                return False
+        return True
+
+    def get_data(self) -> list:
+        """
+        :return: rows of the precision table, one per metric
+        """
+        result = list()
+        for name in sorted(self.values.keys()):
+            mean, half_width, relative_width = self.interval(name)
+            result.append({"metric": name, "replications": self.values[name].__len__(), "mean": mean,
+                           "half_width": half_width, "relative_width": relative_width,
+                           "target": self.target.relative_width, "confidence": self.target.confidence,
+                           "converged": relative_width <= self.target.relative_width})
+        return result
+
+    def report(self) -> str:
+        """
+        :return: one line summary: replications and the widest interval
+        """
+        widest = None
+        for name in self.values.keys():
+            relative_width = self.interval(name)[2]
+            if widest is None or relative_width > widest[1]:
+                widest = (name, relative_width)
+        if widest is None:
+            return "%d replications, no metrics" % self.count
+        return "%d replications, widest %d%% confidence interval: %s +- %0.2f%% (target %0.2f%%)" % (
+            self.count, round(self.target.confidence * 100), widest[0], widest[1] * 100,
+            self.target.relative_width * 100)
@@ -0,0 +1,150 @@
+from simulation.Core import SimulationEnvironment
+
+import json
+import sys
+import time
+
+
+def format_duration(seconds: float) -> str:
+    if seconds != seconds or seconds == float("inf"):
+        return "?"
+    seconds = int(round(seconds))
+    return "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class ProgressReporter(object):
+    def __init__(self, interval: float = 10, path: str = None, stream=sys.stderr):
+        """
+        reports the progress of the replications of a sweep (see simulate_multiple): simulated time of the running
+        replication, simulated micro seconds and events per wall clock second, frames in flight (queued in or being
+        sent by talkers and switches, see Node.backlog) and their bytes and the estimated completion of the whole
+        sweep.
+        a replication is run in segments of simulated time (sim_env.run(until) several times, which does not change
+        the results) and reports are only made between segments, so nothing is scheduled in the simulation. the
+        segments are sized to take about a tenth of interval
+        :param interval: wall clock seconds between two reports of a replication, a report is made after every
+            replication too
+        :param path: reports are also appended to this file, one JSON object per line
+        :param stream: text reports are written to stream, nothing if None
+        """
+        self.interval = interval
+        self.path = path
+        self.stream = stream
+        # replications of the sweep: planned (at most), finished
+        self.planned = 0
+        self.done = 0
+        self.start_time = None
+        # simulated time and runtime of the running replication
+        self.progress = 0.0
+
+    def plan(self, runs: int):
+        """
+        adds runs replications to the sweep, if the replications planned before are all finished. so
+        simulate_multiple_multiple can plan the whole sweep before it calls simulate_multiple for each generator
+        """
+        if self.done == self.planned:
+            self.planned += runs
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+
+    def skip(self, runs: int):
+        """
+        removes runs planned replications which will not be run, e.g. because the precision target was reached
+        """
+        self.planned = max(self.planned - runs, self.done)
+
+    def eta(self, elapsed: float) -> float:
+        """
+        :return: estimated wall clock seconds until all planned replications are finished
+        """
+        finished = self.done + self.progress
+        if finished <= 0:
+            return float("nan")
+        return elapsed * (self.planned - finished) / finished
+
+    def run(self, sim_env: SimulationEnvironment, runtime: int):
+        """
+        runs sim_env until runtime like sim_env.run(runtime) and reports its progress
+        """
+        if self.start_time is None:
+            self.plan(1)
+        start = time.perf_counter()
+        start_now = sim_env.now
+        last = (start, sim_env.now, sim_env.processed_events())
+        first = last
+        # first segment: a thousandth of the runtime, then sized from the measured speed
+        segment = (runtime - start_now) / 1000
+        while sim_env.now < runtime:
+            sim_env.run(min(sim_env.now + segment, runtime))
+            wall = time.perf_counter()
+            self.progress = (sim_env.now - start_now) / (runtime - start_now)
+            if wall - last[0] >= self.interval:
+                events = sim_env.processed_events()
+                self.report(sim_env, runtime, wall, last, events)
+                last = (wall, sim_env.now, events)
+            if wall > start:
+                segment = max((sim_env.now - start_now) / (wall - start) * self.interval / 10,
+                              (runtime - start_now) / 100000)
+        self.progress = 0.0
+        self.done += 1
+        self.report(sim_env, runtime, time.perf_counter(), first, sim_env.processed_events())
+
+    def finish(self, sim_name: str, sim_id: int):
+        """
+        reports a replication which was run elsewhere (e.g. in a worker process) and is finished now
+        """
+        if self.start_time is None:
+            self.plan(1)
+        self.done += 1
+        record = self.sweep_record(time.perf_counter())
+        record.update(sim_name=sim_name, sim_id=sim_id)
+        self.write(record, "%s #%d done | %s" % (sim_name, sim_id, self.sweep_text(record)))
+
+    def sweep_record(self, wall: float) -> dict:
+        elapsed = wall - self.start_time
+        return {"elapsed": elapsed, "runs_done": self.done, "runs_planned": self.planned,
+                "sweep_progress": (self.done + self.progress) / self.planned if self.planned > 0 else 1.0,
+                "eta": self.eta(elapsed)}
+
+    @staticmethod
+    def sweep_text(record: dict) -> str:
+        eta = record["eta"]
+        finish = "" if eta != eta else " (%s)" % time.strftime("%H:%M:%S", time.localtime(time.time() + eta))
+        return "%d/%d runs done, sweep %0.1f%%, elapsed %s, ETA %s%s" % (
+            record["runs_done"], record["runs_planned"],
+            record["sweep_progress"] * 100, format_duration(record["elapsed"]), format_duration(eta), finish)
+
+    def report(self, sim_env: SimulationEnvironment, runtime: int, wall: float, last: tuple, events: int):
+        """
+        reports the progress of sim_env since last (wall clock time, simulated time, processed events)
+        """
+        in_flight_frames = 0
+        backlog_bytes = 0
+        for node in sim_env.topology.nodes.values():
+            frames, byte_length = node.backlog()
+            in_flight_frames += frames
+            backlog_bytes += byte_length
+        duration = wall - last[0]
+        record = {"sim_name": sim_env.name, "sim_id": sim_env.id, "now": sim_env.now, "runtime": runtime,
+                  "progress": sim_env.now / runtime,
+                  "sim_speed": (sim_env.now - last[1]) / duration if duration > 0 else float("nan"),
+                  "events_per_sec": (events - last[2]) / duration if duration > 0 else float("nan"),
+                  "frames": sim_env.next_frame_id, "in_flight_frames": in_flight_frames,
+                  "backlog_bytes": backlog_bytes}
+        record.update(self.sweep_record(wall))
+        self.write(record, "%s #%d %5.1f%% %0.0f/%d us, %0.0f us/s, %0.0f events/s, %d frames in flight, "
+                           "%0.0f bytes queued | %s" % (
+                               sim_env.name, sim_env.id, record["progress"] * 100, sim_env.now, runtime,
+                               record["sim_speed"], record["events_per_sec"], in_flight_frames, backlog_bytes,
+                               self.sweep_text(record)))
+
+    def write(self, record: dict, text: str):
+        if self.stream is not None:
+            print(text, file=self.stream, flush=True)
+        if self.path is not None:
+            record["time"] = time.time()
+            for name, value in record.items():
+                if value != value:
+                    record[name] = None
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(record) + "\n")
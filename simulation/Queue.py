@@ -0,0 +1,85 @@
+from simulation.Frame import Frame
+
+from collections import deque
+
+
+class FrameQueue(deque):
+    def __init__(self):
+        """
+        FIFO queue of frames which keeps track of the sum of the length of its frames, so the length in byte of the
+        queue is known without iterating over it. only append, popleft, remove and clear keep byte_len up to date
+        """
+        super(FrameQueue, self).__init__()
+        self.byte_len = 0
+
+    def append(self, frame: Frame):
+        super(FrameQueue, self).append(frame)
+        self.byte_len += frame.length
+
+    def popleft(self) -> Frame:
+        frame = super(FrameQueue, self).popleft()
+        if self.__len__() == 0:
+            # no rounding errors build up if frame lengths are floats
+            self.byte_len = 0
+        else:
+            self.byte_len -= frame.length
+        return frame
+
+    def remove(self, frame: Frame):
+        super(FrameQueue, self).remove(frame)
+        if self.__len__() == 0:
+            self.byte_len = 0
+        else:
+            self.byte_len -= frame.length
+
+    def clear(self):
+        super(FrameQueue, self).clear()
+        self.byte_len = 0
+
+
+class PseudoQueues(object):
+    def __init__(self, traffic_classes: int = 8):
+        """
+        pseudo queues of an egress port, one FIFO queue per traffic class. a bitmask marks the non-empty queues, so
+        the head of the highest non-empty traffic class is found without looking at any queue
+        :param traffic_classes: number of traffic classes; 8 in 802.1Q
+        """
+        self.queues = [FrameQueue() for _ in range(traffic_classes)]
+        # bit i is set if the queue of traffic class i is not empty
+        self.mask = 0
+
+    def append(self, traffic_class: int, frame: Frame):
+        self.queues[traffic_class].append(frame)
+        self.mask |= 1 << traffic_class
+
+    def peek(self, traffic_classes: int = -1):
+        """
+        :param traffic_classes: bitmask of the traffic classes which are considered; default = all
+        :return: first frame of the highest non-empty traffic class, None if all queues are empty
+        """
+        mask = self.mask & traffic_classes
+        if mask == 0:
+            return None
+        return self.queues[mask.bit_length() - 1][0]
+
+    def popleft(self, traffic_class: int) -> Frame:
+        """
+        removes and returns the first frame of traffic class traffic_class
+        """
+        queue = self.queues[traffic_class]
+        frame = queue.popleft()
+        if queue.__len__() == 0:
+            self.mask &= ~(1 << traffic_class)
+        return frame
+
+    def __getitem__(self, traffic_class: int) -> FrameQueue:
+        """
+        :return: pseudo queue of traffic class traffic_class
+        """
+        return self.queues[traffic_class]
+
+    def __len__(self):
+        length = 0
+        for queue in self.queues:
+            length += queue.__len__()
+        return length
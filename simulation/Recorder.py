@@ -0,0 +1,132 @@
+import numpy as np
+
+
+class StringCodes(object):
+    def __init__(self):
+        """
+        interns strings (e.g. queue indices or addresses) to integer codes, so they can be stored in numpy arrays
+        """
+        self.codes = dict()
+        self.strings = list()
+
+    def __getitem__(self, string) -> int:
+        """
+        :return: code of string, a new code is assigned if string was not seen before
+        """
+        try:
+            return self.codes[string]
+        except KeyError:
+            code = self.strings.__len__()
+            self.codes[string] = code
+            self.strings.append(string)
+            return code
+
+    def decode(self, codes) -> list:
+        """
+        :param codes: iterable of codes
+        :return: list of the strings of codes
+        """
+        strings = self.strings
+        return [strings[code] for code in codes]
+
+
+class ColumnarRecorder(object):
+    # number of rows which are converted to python values at once when rows are exported lazily
+    export_batch = 65536
+
+    def __init__(self, fields: dict, capacity: int = 1024):
+        """
+        table with one preallocated numpy array per field. the arrays double in size when they are full.
+        float fields are NaN until they are set (exported as ""), all other fields are 0
+        :param fields: dict field name -> numpy dtype
+        :param capacity: initial number of rows
+        """
+        self.fields = fields
+        self.capacity = capacity
+        self.size = 0
+        self.columns = dict()
+        for name, dtype in fields.items():
+            self.columns[name] = self.empty(dtype, capacity)
+
+    @staticmethod
+    def empty(dtype, capacity: int) -> np.ndarray:
+        if np.issubdtype(dtype, np.floating):
+            return np.full(capacity, np.nan, dtype=dtype)
+        return np.zeros(capacity, dtype=dtype)
+
+    def full(self) -> bool:
+        return self.size == self.capacity
+
+    def grow(self):
+        capacity = self.capacity * 2
+        for name, dtype in self.fields.items():
+            column = self.empty(dtype, capacity)
+            column[:self.size] = self.columns[name][:self.size]
+            self.columns[name] = column
+        self.capacity = capacity
+
+    def append(self, **values) -> int:
+        """
+        appends a row, fields which are not in values keep their initial value
+        :return: index of the new row
+        """
+        if self.size == self.capacity:
+            self.grow()
+        row = self.size
+        columns = self.columns
+        for name, value in values.items():
+            columns[name][row] = value
+        self.size += 1
+        return row
+
+    def set(self, row: int, name: str, value):
+        self.columns[name][row] = value
+
+    def get(self, row: int, name: str):
+        return self.columns[name][row]
+
+    def view(self, name: str) -> np.ndarray:
+        """
+        :return: the used part of the array of field name, no copy
+        """
+        return self.columns[name][:self.size]
+
+    def compact(self, keep: np.ndarray) -> np.ndarray:
+        """
+        removes all rows which are not in keep, the remaining rows keep their order
+        :param keep: boolean array with one entry per row
+        :return: array with the new index of each old row, -1 for removed rows
+        """
+        kept_rows = np.flatnonzero(keep)
+        new_size = kept_rows.__len__()
+        for name, dtype in self.fields.items():
+            column = self.columns[name]
+            column[:new_size] = column[kept_rows]
+            column[new_size:self.size] = self.empty(dtype, self.size - new_size)
+        new_index = np.full(self.size, -1, dtype=np.int64)
+        new_index[kept_rows] = np.arange(new_size)
+        self.size = new_size
+        return new_index
+
+    def clear(self):
+        self.compact(np.zeros(self.size, dtype=bool))
+
+    @staticmethod
+    def to_list(column: np.ndarray) -> list:
+        """
+        converts a column to a list of python values, NaN is converted to "" (value was never set)
+        """
+        values = column.tolist()
+        if np.issubdtype(column.dtype, np.floating):
+            return ["" if value != value else value for value in values]
+        return values
+
+    @staticmethod
+    def to_len_list(column: np.ndarray) -> list:
+        """
+        like to_list, for frame lengths: integral lengths are exported as int
+        """
+        return [int(value) if value.is_integer() else value for value in column.tolist()]
+
+    def __len__(self):
+        return self.size
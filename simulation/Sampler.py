@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class BlockSampler(object):
+    def __init__(self, random, block_size: int = 4096):
+        """
+        iterator over random values which are drawn in blocks of block_size values with one numpy call.
+        the next block is drawn when the current one is used up. can be used wherever talkers expect a
+        payload_generator or time_generator.
+        the values only depend on the seed of random, block_size and the order in which samplers using the same
+        random draw their blocks
+        :param random: numpy.random.RandomState or numpy.random.Generator, e.g. SimulationEnvironment.random
+        :param block_size: number of values drawn at once
+        """
+        self.random = random
+        self.block_size = block_size
+        self.block = list()
+        self.position = 0
+
+    def draw(self, size: int) -> np.ndarray:
+        """
+        :return: array with the next size values
+        """
+        raise NotImplementedError()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            value = self.block[self.position]
+        except IndexError:
+            # python values, indexing a list is faster than indexing an array
+            self.block = self.draw(self.block_size).tolist()
+            self.position = 0
+            value = self.block[0]
+        self.position += 1
+        return value
+
+
+class ExponentialSampler(BlockSampler):
+    def __init__(self, random, mean: float, block_size: int = 4096):
+        """
+        exponential distributed values with mean mean, e.g. times between frames
+        """
+        super(ExponentialSampler, self).__init__(random, block_size)
+        self.mean = mean
+
+    def draw(self, size: int) -> np.ndarray:
+        return self.random.exponential(self.mean, size)
+
+
+class UniformSampler(BlockSampler):
+    def __init__(self, random, low: float, high: float, rounded: bool = False, block_size: int = 4096):
+        """
+        uniform distributed values in [low, high), e.g. payloads
+        :param rounded: values are rounded to integers like round() does
+        """
+        super(UniformSampler, self).__init__(random, block_size)
+        self.low = low
+        self.high = high
+        self.rounded = rounded
+
+    def draw(self, size: int) -> np.ndarray:
+        values = self.random.uniform(self.low, self.high, size)
+        if self.rounded:
+            # np.rint rounds half to even like round()
+            return np.rint(values).astype(np.int64)
+        return values
@@ -2,20 +2,31 @@ from simulation.Core import SimulationEnvironment
 from simulation.PriorityMap import PriorityMap
 from simulation.Frame import Frame
 from simulation.Node import Node
-from simpy import Interrupt
+from simulation.Queue import PseudoQueues, FrameQueue
+from simulation.Recorder import ColumnarRecorder, StringCodes
+from simulation.Shaper import Shaper, LRQShaper, TBEShaper, ShapelessShaper
+from simulation.Statistics import DelayStatistics, TimeWeightedStatistics, TimeWeightedHistogram, QueueMonitor
 
-from collections import deque, defaultdict
+from collections import defaultdict
+
+import numpy as np
 
 
 class Scheduler(object):
     def __init__(self, env: SimulationEnvironment, bandwidth: int, priority_map: PriorityMap, monitor: bool = False):
         self.env = env
         self.bandwidth = bandwidth
-        self.egress_process = None
+        # egress port which sends the frames of this scheduler, set by the switch
+        self.egress = None
         self.priority_map = priority_map
         self.monitor = monitor
+        # columns which are added in front of every row of this scheduler, set by the switch
+        self.context = dict()
 
-    def peek_frame(self):
+    def peek_frame(self, traffic_classes: int = -1):
+        """
+        :param traffic_classes: bitmask of the traffic classes which are considered; default = all
+        """
         pass
 
     def append_frame(self, frame: Frame, sender: Node):
@@ -30,14 +41,25 @@ class Scheduler(object):
     def pause_transmission(self, frame: Frame):
         pass
 
-    def end_transmission(self, frame: Frame):
+    def end_transmission(self, frame: Frame, preemptions: int = 0):
+        """
+        :param preemptions: number of times the transmission of frame was preempted
+        """
         pass
 
     def get_data(self):
         pass
 
+    def flush_data(self):
+        pass
+
 
 class UBSScheduler(Scheduler):
+    # columns of the monitored frames, the delays of the UBS_Switch_Frame table are computed when exported
+    frame_fields = {"frame_id": np.int64, "flow_id": np.int64, "frame_len": np.float64, "frame_priority": np.int8,
+                    "shaped_queue": np.int32, "arrival_time": np.float64, "pseudo_queue_time": np.float64,
+                    "forwarding_time": np.float64, "transmission_time": np.float64, "preemptions": np.int16}
+
     def __init__(self, env: SimulationEnvironment, bandwidth: int,
                  priority_map: PriorityMap, mode: str, monitor: bool = False):
         """
@@ -50,206 +72,381 @@ class UBSScheduler(Scheduler):
         super(UBSScheduler, self).__init__(env, bandwidth, priority_map, monitor)
         self.mode = mode
 
-        self.data = dict()
+        self.data = ColumnarRecorder(self.frame_fields)
+        self.shaped_queue_codes = StringCodes()
+        # frame id -> row in data, for frames which were not forwarded yet
+        self.frame_rows = dict()
         self.queue_data = defaultdict(list)
 
-        self.sleep_event = env.event()
-
-        self.pseudo_queues = defaultdict(deque)
-        self.shaped_queues = defaultdict(deque)
-        self.process_shaped_queues = dict()
-        # shaped queue sleeping or not
-        self.process_shaped_queues_state = dict()
+        # monitor_mode "statistics": summaries instead of rows
+        self.statistics: bool = env.monitor_mode == "statistics"
+        # frame id -> [arrival time, pseudo queue time] of the frames which were not forwarded yet
+        self.frame_times = dict()
+        # flow id -> DelayStatistics of the nodal, queue, shaped queue and pseudo queue delay
+        self.flow_statistics = dict()
+        # flow id -> number of preemptions of the frames of that flow
+        self.flow_preemptions = defaultdict(int)
+        # queue index -> (queue type, TimeWeightedStatistics of the byte length, of the number of frames)
+        self.queue_statistics = dict()
+
+        # occupancy histograms instead of the change log queue_data (see QueueMonitor)
+        self.queue_monitor: QueueMonitor = env.queue_monitor if monitor else None
+        # queue index -> (queue type, queue, TimeWeightedHistogram of the number of frames, of the byte length)
+        self.queue_histograms = dict()
+        self.snapshots = list()
+        self.snapshot_time = None
+        if self.queue_monitor is not None and self.queue_monitor.interval is not None:
+            # snapshots at multiples of interval, the same points in time for all schedulers
+            self.snapshot_time = (env.now // self.queue_monitor.interval + 1) * self.queue_monitor.interval
+            env.call_at(self.snapshot_time, self.take_snapshot)
+
+        self.pseudo_queues = PseudoQueues()
+        self.shaped_queues = defaultdict(FrameQueue)
+        if mode == "tbe":
+            self.shaper: Shaper = TBEShaper(self)
+        elif mode == "shapeless":
+            self.shaper: Shaper = ShapelessShaper(self)
+        else:
+            self.shaper: Shaper = LRQShaper(self)
+
+    def iter_tables(self, context: dict):
+        """
+        yields (name of the table, row) for all rows of all tables of this scheduler, every row is a new dict which
+        starts with the columns of context
+        """
+        if self.statistics:
+            flow_data, queue_data = self.get_statistics_dicts()
+            tables = [(flow_data, "UBS_Switch_Statistics"), (queue_data, "UBS_Switch_Queue_Statistics")]
+        else:
+            for frame_dict in self.iter_frame_dicts(context=context):
+                yield "UBS_Switch_Frame", frame_dict
+            tables = [((queue_dict for data_list in self.queue_data.values() for queue_dict in data_list),
+                       "UBS_Switch_Queue")]
+        if self.queue_monitor is not None:
+            tables.append((self.get_histogram_dicts(), "UBS_Switch_Queue_Histogram"))
+            tables.append((self.snapshots, "UBS_Switch_Queue_Snapshot"))
+        for rows, dict_format in tables:
+            for row in rows:
+                tmp_dict = dict(context)
+                tmp_dict.update(row)
+                yield dict_format, tmp_dict
 
     def get_data(self) -> (list, list):
-        result = list()
-        for frame_id, frame_dict in self.data.items():
-            result.append(frame_dict)
+        if self.statistics:
+            return self.get_statistics_dicts()
+        result = self.get_frame_dicts()
         queue_data_list = list()
         for queue_data in self.queue_data.values():
             queue_data_list += queue_data
         return result, queue_data_list
 
-    def add_queue_data(self, queue_type: str, queue: deque, queue_index: str):
-        queue_byte_len = self.get_queue_byte_len(queue)
+    def get_frame_dicts(self, rows: np.ndarray = None) -> list:
+        """
+        exports monitored frames as rows of the UBS_Switch_Frame table
+        :param rows: boolean array, selects which rows of data are exported; default = all rows
+        """
+        return list(self.iter_frame_dicts(rows))
+
+    def iter_frame_dicts(self, rows: np.ndarray = None, context: dict = None):
+        """
+        like get_frame_dicts, but yields the rows. the columns are converted to python values in batches of
+        ColumnarRecorder.export_batch rows
+        :param context: columns every row starts with
+        """
+        columns = dict()
+        for name in self.frame_fields.keys():
+            column = self.data.view(name)
+            columns[name] = column if rows is None else column[rows]
+        arrival_time = columns["arrival_time"]
+        forwarding_time = columns["forwarding_time"]
+        # NaN for frames which were not forwarded yet
+        nodal_delay = forwarding_time - arrival_time
+        queue_delay = nodal_delay - columns["transmission_time"]
+        shaped_queue_delay = np.where(np.isnan(forwarding_time), np.nan, columns["pseudo_queue_time"] - arrival_time)
+        pseudo_queue_delay = queue_delay - shaped_queue_delay
+
+        to_list = ColumnarRecorder.to_list
+        keys = ("frame_id", "flow_id", "frame_len", "frame_priority", "shaped_queue",
+                "arrival_time", "pseudo_queue_time", "forwarding_time", "transmission_time",
+                "nodal_delay", "queue_delay", "shaped_queue_delay", "pseudo_queue_delay", "preemptions")
+        context = context if context is not None else dict()
+        batch = ColumnarRecorder.export_batch
+        for start in range(0, arrival_time.__len__(), batch):
+            end = start + batch
+            values = zip(to_list(columns["frame_id"][start:end]), to_list(columns["flow_id"][start:end]),
+                         ColumnarRecorder.to_len_list(columns["frame_len"][start:end]),
+                         to_list(columns["frame_priority"][start:end]),
+                         self.shaped_queue_codes.decode(columns["shaped_queue"][start:end].tolist()),
+                         to_list(arrival_time[start:end]), to_list(columns["pseudo_queue_time"][start:end]),
+                         to_list(forwarding_time[start:end]), to_list(columns["transmission_time"][start:end]),
+                         to_list(nodal_delay[start:end]), to_list(queue_delay[start:end]),
+                         to_list(shaped_queue_delay[start:end]), to_list(pseudo_queue_delay[start:end]),
+                         columns["preemptions"][start:end].tolist())
+            for row in values:
+                frame_dict = dict(context)
+                frame_dict["mode"] = self.mode
+                frame_dict.update(zip(keys, row))
+                yield frame_dict
+
+    def emit_data(self, complete_only: bool = True):
+        """
+        emits monitored frames to env.sink and removes them from data
+        :param complete_only: only emit frames which were already forwarded
+        """
+        rows = np.ones(self.data.__len__(), dtype=bool)
+        if complete_only:
+            rows[list(self.frame_rows.values())] = False
+        for frame_dict in self.get_frame_dicts(rows):
+            self.env.emit("UBS_Switch_Frame", self.context, frame_dict)
+        new_index = self.data.compact(~rows)
+        for frame_id, row in self.frame_rows.items():
+            self.frame_rows[frame_id] = int(new_index[row])
+        if not complete_only:
+            self.frame_rows.clear()
+
+    def get_statistics_dicts(self) -> (list, list):
+        """
+        exports the summaries of monitor_mode "statistics"
+        :return: rows of the UBS_Switch_Statistics table (one per flow), rows of the UBS_Switch_Queue_Statistics table
+            (one per queue)
+        """
+        flow_result = list()
+        for flow_id, delays in sorted(self.flow_statistics.items()):
+            statistics_dict = {"mode": self.mode, "flow_id": flow_id, "frames": delays[0].moments.count,
+                               "preemptions": self.flow_preemptions[flow_id]}
+            for prefix, delay_statistics in zip(("nodal_delay", "queue_delay", "shaped_queue_delay",
+                                                 "pseudo_queue_delay"), delays):
+                statistics_dict.update(delay_statistics.to_dict(prefix))
+            flow_result.append(statistics_dict)
+        queue_result = list()
+        for queue_index, (queue_type, byte_length, frames) in self.queue_statistics.items():
+            queue_result.append({"queue_type": queue_type, "queue": queue_index, "until": self.env.now,
+                                 "mean_byte_length": byte_length.mean(self.env.now), "max_byte_length": byte_length.max,
+                                 "mean_frames": frames.mean(self.env.now), "max_frames": frames.max})
+        return flow_result, queue_result
+
+    def update_queue_statistics(self, queue_type: str, queue: FrameQueue, queue_index, held_frame: Frame = None):
+        """
+        updates the backlog summary of queue, has to be called after queue is changed
+        :param held_frame: frame taken from the shaped queue by the shaper which is not released yet (see
+            Shaper.held_frame), it still counts as part of the shaped queue
+        """
+        try:
+            queue_type, byte_length, frames = self.queue_statistics[queue_index]
+        except KeyError:
+            byte_length = TimeWeightedStatistics()
+            frames = TimeWeightedStatistics()
+            self.queue_statistics[queue_index] = (queue_type, byte_length, frames)
+        if held_frame is None:
+            byte_length.update(self.env.now, queue.byte_len)
+            frames.update(self.env.now, queue.__len__())
+        else:
+            byte_length.update(self.env.now, queue.byte_len + held_frame.length)
+            frames.update(self.env.now, queue.__len__() + 1)
+        if self.queue_monitor is not None:
+            self.update_queue_histograms(queue_type, queue, queue_index, held_frame)
+
+    def update_queue_histograms(self, queue_type: str, queue: FrameQueue, queue_index, held_frame: Frame = None):
+        """
+        updates the occupancy histograms of queue, has to be called after queue is changed
+        :param held_frame: see update_queue_statistics
+        """
+        try:
+            queue_type, queue, frames, byte_length = self.queue_histograms[queue_index]
+        except KeyError:
+            frames = TimeWeightedHistogram(self.queue_monitor.frame_bucket)
+            byte_length = TimeWeightedHistogram(self.queue_monitor.byte_bucket)
+            self.queue_histograms[queue_index] = (queue_type, queue, frames, byte_length)
+        if held_frame is None:
+            frames.update(self.env.now, queue.__len__())
+            byte_length.update(self.env.now, queue.byte_len)
+        else:
+            frames.update(self.env.now, queue.__len__() + 1)
+            byte_length.update(self.env.now, queue.byte_len + held_frame.length)
+
+    def get_histogram_dicts(self) -> list:
+        """
+        exports the occupancy histograms as rows of the UBS_Switch_Queue_Histogram table, one row per queue, unit
+        (frames or bytes) and bucket; duration is the time the occupancy was in [bucket_start, bucket_end)
+        """
+        result = list()
+        for queue_index, (queue_type, queue, frames, byte_length) in self.queue_histograms.items():
+            for unit, histogram in (("frames", frames), ("bytes", byte_length)):
+                for bucket_start, bucket_end, duration in histogram.get_buckets(self.env.now):
+                    result.append({"queue_type": queue_type, "queue": queue_index, "unit": unit,
+                                   "bucket_start": bucket_start, "bucket_end": bucket_end, "duration": duration,
+                                   "until": self.env.now})
+        return result
+
+    def take_snapshot(self):
+        """
+        records the occupancy of all queues of this scheduler, repeated every queue_monitor.interval
+        """
+        for queue_index, (queue_type, queue, frames, byte_length) in self.queue_histograms.items():
+            snapshot_dict = {"time": self.env.now, "queue_type": queue_type, "queue": queue_index,
+                             "frames": frames.value, "byte_length": byte_length.value}
+            if self.env.sink is not None:
+                self.env.emit("UBS_Switch_Queue_Snapshot", self.context, snapshot_dict)
+            else:
+                self.snapshots.append(snapshot_dict)
+        self.snapshot_time += self.queue_monitor.interval
+        self.env.call_at(self.snapshot_time, self.take_snapshot)
+
+    def flush_data(self):
+        """
+        emits all frames and the last entry of each queue log to env.sink
+        """
+        if self.queue_monitor is not None:
+            for histogram_dict in self.get_histogram_dicts():
+                self.env.emit("UBS_Switch_Queue_Histogram", self.context, histogram_dict)
+            for snapshot_dict in self.snapshots:
+                self.env.emit("UBS_Switch_Queue_Snapshot", self.context, snapshot_dict)
+            self.snapshots.clear()
+        if self.statistics:
+            flow_data, queue_data = self.get_statistics_dicts()
+            for statistics_dict in flow_data:
+                self.env.emit("UBS_Switch_Statistics", self.context, statistics_dict)
+            for statistics_dict in queue_data:
+                self.env.emit("UBS_Switch_Queue_Statistics", self.context, statistics_dict)
+            return
+        self.emit_data(False)
+        for data_list in self.queue_data.values():
+            for queue_dict in data_list:
+                self.env.emit("UBS_Switch_Queue", self.context, queue_dict)
+        self.queue_data.clear()
+
+    def add_queue_data(self, queue_type: str, queue: FrameQueue, queue_index):
+        """
+        logs the occupancy queue had since the last change of queue, has to be called before queue is changed
+        """
+        queue_byte_len = queue.byte_len
         data_list = self.queue_data[queue_index]
         try:
             if data_list[-1]["byte_length"] == queue_byte_len:
                 data_list[-1]["until"] = self.env.now
             else:
-                data_list.append({"queue_type": queue_type, "queue": queue_index,
-                                  "since": data_list[-1]["until"], "until": self.env.now,
-                                  "frames": queue.__len__(), "byte_length": queue_byte_len})
+                queue_dict = {"queue_type": queue_type, "queue": queue_index,
+                              "since": data_list[-1]["until"], "until": self.env.now,
+                              "frames": queue.__len__(), "byte_length": queue_byte_len}
+                if self.env.sink is not None:
+                    # the last entry is complete, it will not be extended anymore
+                    self.env.emit("UBS_Switch_Queue", self.context, data_list.pop())
+                data_list.append(queue_dict)
         except IndexError:
             data_list.append({"queue_type": queue_type, "queue": queue_index, "since": 0, "until": self.env.now,
                               "frames": queue.__len__(), "byte_length": queue_byte_len})
 
-    def end_transmission(self, frame: Frame):
-        for traffic_class, pseudo_queue in reversed(sorted(self.pseudo_queues.items())):
-            if frame in pseudo_queue:
-                if self.monitor:
-                    frame_dict = self.data[frame.id]
-                    frame_dict["forwarding_time"] = self.env.now
-                    frame_dict["nodal_delay"] = self.env.now - frame_dict["arrival_time"]
-                    frame_dict["queue_delay"] = frame_dict["nodal_delay"] - frame_dict["transmission_time"]
-                    frame_dict["shaped_queue_delay"] = frame_dict["pseudo_queue_time"] - frame_dict["arrival_time"]
-                    frame_dict["pseudo_queue_delay"] = frame_dict["queue_delay"] - frame_dict["shaped_queue_delay"]
-
-                    self.add_queue_data("pseudo", pseudo_queue, traffic_class)
-                pseudo_queue.remove(frame)
-                break
-
-    def peek_frame(self):
-        for traffic_class, queue in reversed(sorted(self.pseudo_queues.items())):
-            if queue.__len__() > 0:
-                return queue[0]
-        return None
+    def end_transmission(self, frame: Frame, preemptions: int = 0):
+        # the frame which was just sent is always the first frame of the pseudo queue of its traffic class
+        traffic_class: int = self.priority_map[frame.priority]
+        pseudo_queue: FrameQueue = self.pseudo_queues[traffic_class]
+        if pseudo_queue.__len__() == 0 or pseudo_queue[0] is not frame:
+            raise RuntimeError("frame is not the first frame of its pseudo queue")
+        if self.monitor:
+            if self.statistics:
+                self.pseudo_queues.popleft(traffic_class)
+                self.update_queue_statistics("pseudo", pseudo_queue, traffic_class)
+                arrival_time, pseudo_queue_time = self.frame_times.pop(frame.id)
+                try:
+                    delays = self.flow_statistics[frame.flow.id]
+                except KeyError:
+                    delays = (DelayStatistics(), DelayStatistics(), DelayStatistics(), DelayStatistics())
+                    self.flow_statistics[frame.flow.id] = delays
+                nodal_delay = self.env.now - arrival_time
+                queue_delay = nodal_delay - frame.length * 8 / self.bandwidth
+                shaped_queue_delay = pseudo_queue_time - arrival_time
+                delays[0].add(nodal_delay)
+                delays[1].add(queue_delay)
+                delays[2].add(shaped_queue_delay)
+                delays[3].add(queue_delay - shaped_queue_delay)
+                if preemptions > 0:
+                    self.flow_preemptions[frame.flow.id] += preemptions
+                return
+            row = self.frame_rows.pop(frame.id)
+            self.data.set(row, "forwarding_time", self.env.now)
+            if preemptions > 0:
+                self.data.set(row, "preemptions", preemptions)
+
+            if self.queue_monitor is None:
+                self.add_queue_data("pseudo", pseudo_queue, traffic_class)
+        self.pseudo_queues.popleft(traffic_class)
+        if self.queue_monitor is not None:
+            self.update_queue_histograms("pseudo", pseudo_queue, traffic_class)
+
+    def peek_frame(self, traffic_classes: int = -1):
+        return self.pseudo_queues.peek(traffic_classes)
 
     @staticmethod
     def get_shaped_queue_index(frame: Frame, traffic_class: int, egress_address: str) -> str:
         # frame not used here
         return "-".join((str(traffic_class), egress_address))
 
-    @staticmethod
-    def get_queue_byte_len(queue: deque):
-        byte_len = 0
-        for frame in queue:
-            byte_len += frame.__len__()
-        return byte_len
-
     def append_frame(self, frame: Frame, sender: Node):
         # each traffic class has a set of shaped queues for each ingress port
         # each traffic class has one pseudo queue
         traffic_class: int = self.priority_map[frame.priority]
         shaped_queue_index: str = self.get_shaped_queue_index(frame, traffic_class, sender.address)
 
-        # gets the pseudo_queue associated to this traffic_class; if there is none it is created
-        pseudo_queue: deque = self.pseudo_queues[traffic_class]
         # gets the shaped_queue associated to this traffic_class and sender; if there is none it is created
-        shaped_queue: deque = self.shaped_queues[shaped_queue_index]
+        shaped_queue: FrameQueue = self.shaped_queues[shaped_queue_index]
 
         # add frame to data
+        if self.statistics and self.monitor:
+            if frame.id in self.frame_times:
+                raise RuntimeError("frame id not unique")
+            self.frame_times[frame.id] = [self.env.now, None]
+            shaped_queue.append(frame)
+            self.update_queue_statistics("shaped", shaped_queue, shaped_queue_index,
+                                         self.shaper.held_frame(shaped_queue_index))
+            self.shaper.append_frame(shaped_queue_index, shaped_queue, traffic_class)
+            return
         if self.monitor:
-            frame_dict = {"mode": self.mode,
-                          "frame_id": frame.id, "flow_id": frame.flow.id, "frame_len": frame.__len__(),
-                          "frame_priority": frame.priority, "shaped_queue": shaped_queue_index,
-                          "arrival_time": self.env.now, "pseudo_queue_time": "", "forwarding_time": "",
-                          "transmission_time": frame.__len__() * 8 / self.bandwidth,
-                          "nodal_delay": "", "queue_delay": "", "shaped_queue_delay": "", "pseudo_queue_delay": ""}
-            if frame.id in self.data:
+            if frame.id in self.frame_rows:
                 raise RuntimeError("frame id not unique")
-            self.data[frame.id] = frame_dict
-
-            self.add_queue_data("shaped", shaped_queue, shaped_queue_index)
-
-        # if there is no process for this shaped_queue, create one
-        if shaped_queue_index not in self.process_shaped_queues:
-            if self.mode == "tbe":
-                self.process_shaped_queues[shaped_queue_index] = self.env.process(
-                    self.process_shaped_queue_tbe(shaped_queue, pseudo_queue, shaped_queue_index,
-                                                  str(traffic_class)))
-            elif self.mode == "shapeless":
-                self.process_shaped_queues[shaped_queue_index] = self.env.process(
-                    self.process_shaped_queue_shapeless(shaped_queue, pseudo_queue, shaped_queue_index,
-                                                        str(traffic_class)))
-            else:
-                self.process_shaped_queues[shaped_queue_index] = self.env.process(
-                    self.process_shaped_queue_lrq(shaped_queue, pseudo_queue, shaped_queue_index,
-                                                  str(traffic_class)))
-            # state of this process, True = sleeping, False = not sleeping
-            self.process_shaped_queues_state[shaped_queue_index] = False
-
-        # add the frame to the shaped_queue
+            if self.env.sink is not None and self.data.full():
+                # streaming: forwarded frames are emitted instead of growing data
+                self.emit_data()
+            self.frame_rows[frame.id] = self.data.append(
+                frame_id=frame.id, flow_id=frame.flow.id, frame_len=frame.length, frame_priority=frame.priority,
+                shaped_queue=self.shaped_queue_codes[shaped_queue_index], arrival_time=self.env.now,
+                transmission_time=frame.length * 8 / self.bandwidth)
+
+            if self.queue_monitor is None:
+                self.add_queue_data("shaped", shaped_queue, shaped_queue_index)
+
+        # add the frame to the shaped_queue, the shaper releases it to the pseudo queue once it is eligible
         shaped_queue.append(frame)
+        if self.queue_monitor is not None:
+            self.update_queue_histograms("shaped", shaped_queue, shaped_queue_index,
+                                         self.shaper.held_frame(shaped_queue_index))
+        self.shaper.append_frame(shaped_queue_index, shaped_queue, traffic_class)
+
+    def pseudo_queue_append(self, shaped_queue_index: str, shaped_queue: FrameQueue, traffic_class: int,
+                            frame: Frame):
+        if self.statistics and self.monitor:
+            self.frame_times[frame.id][1] = self.env.now
+            pseudo_queue = self.pseudo_queues[traffic_class]
+            self.update_queue_statistics("shaped", shaped_queue, shaped_queue_index)
+            self.pseudo_queues.append(traffic_class, frame)
+            self.update_queue_statistics("pseudo", pseudo_queue, traffic_class)
+            self.egress.notify(traffic_class)
+            return
+        if self.monitor:
+            self.data.set(self.frame_rows[frame.id], "pseudo_queue_time", self.env.now)
 
-        # if process is sleeping, interrupt
-        if self.process_shaped_queues_state[shaped_queue_index]:
-            self.process_shaped_queues[shaped_queue_index].interrupt("new frame")
+            if self.queue_monitor is None:
+                self.add_queue_data("shaped", shaped_queue, shaped_queue_index)
+                self.add_queue_data("pseudo", self.pseudo_queues[traffic_class], traffic_class)
 
-    def pseudo_queue_append(self, shaped_queue_index: str, shaped_queue: deque,
-                            pseudo_queue: deque, pseudo_queue_index: str, frame: Frame):
-        if self.monitor:
-            self.data[frame.id]["pseudo_queue_time"] = self.env.now
-
-            self.add_queue_data("shaped", shaped_queue, shaped_queue_index)
-            self.add_queue_data("pseudo", pseudo_queue, pseudo_queue_index)
-
-        pseudo_queue.append(frame)
-        self.egress_process.interrupt("new frame")
-
-    def process_shaped_queue_lrq(self, shaped_queue: deque, pseudo_queue: deque,
-                                 shaped_queue_index: str, pseudo_queue_index: str):
-        state = defaultdict(int)
-        while True:
-            if shaped_queue.__len__() > 0:
-                frame: Frame = shaped_queue.popleft()
-                frame_bit_len = frame.__len__() * 8
-                flow_index = frame.flow.id
-                flow_leaky_rate = frame.flow.leaky_rate * (1 + frame.hop / 100)
-                time = state[flow_index]
-                if not self.env.now >= time:
-                    yield self.env.timeout(time - self.env.now)
-                self.pseudo_queue_append(shaped_queue_index, shaped_queue, pseudo_queue, pseudo_queue_index, frame)
-                state[flow_index] = self.env.now + (frame_bit_len / flow_leaky_rate)
-            else:
-                try:
-                    self.process_shaped_queues_state[shaped_queue_index] = True
-                    yield self.sleep_event
-                except Interrupt:
-                    self.process_shaped_queues_state[shaped_queue_index] = False
-
-    def process_shaped_queue_tbe(self, shaped_queue: deque, pseudo_queue: deque,
-                                 shaped_queue_index: str, pseudo_queue_index: str):
-        time_state = defaultdict(int)
-        burst_state = dict()
-        while True:
-            if shaped_queue.__len__() > 0:
-                frame: Frame = shaped_queue.popleft()
-                frame_bit_len = frame.__len__() * 8
-                flow_index = frame.flow.id
-                flow_leaky_rate = frame.flow.leaky_rate * (1 + frame.hop / 100)
-                burstiness = frame.flow.burstiness * 8
-                time = time_state[flow_index]
-                try:
-                    burst = burst_state[flow_index]
-                except KeyError:
-                    burst_state[flow_index] = burstiness
-                    burst = burst_state[flow_index]
-                if not burst + (self.env.now - time) * flow_leaky_rate >= frame_bit_len:
-                    # print((frame_bit_len - (burst + (self.env.now - time) * leaky_rate)) / leaky_rate)
-                    yield self.env.timeout((frame_bit_len - (burst + (self.env.now - time) * flow_leaky_rate)) / flow_leaky_rate)
-                self.pseudo_queue_append(shaped_queue_index, shaped_queue, pseudo_queue, pseudo_queue_index, frame)
-                burst_state[flow_index] = min(burstiness, burst + (self.env.now - time) * flow_leaky_rate) - frame_bit_len
-                # if burst_state[flow_index] < -10:
-                #   print(round(burst_state[flow_index], 2))
-                #   print("%f %f %f %f" % (burst, (self.env.now - time) * leaky_rate, frame_bit_len, frame_bit_len / 8))
-                time_state[flow_index] = self.env.now
-            else:
-                try:
-                    self.process_shaped_queues_state[shaped_queue_index] = True
-                    yield self.sleep_event
-                except Interrupt:
-                    self.process_shaped_queues_state[shaped_queue_index] = False
-
-    def process_shaped_queue_shapeless(self, shaped_queue: deque, pseudo_queue: deque,
-                                       shaped_queue_index: str, pseudo_queue_index: str):
-        # no shaping, frame is directly send to the pseudo_queue
-        while True:
-            if shaped_queue.__len__() > 0:
-                frame: Frame = shaped_queue.popleft()
-                self.pseudo_queue_append(shaped_queue_index, shaped_queue, pseudo_queue, pseudo_queue_index, frame)
-            else:
-                try:
-                    self.process_shaped_queues_state[shaped_queue_index] = True
-                    yield self.sleep_event
-                except Interrupt:
-                    self.process_shaped_queues_state[shaped_queue_index] = False
+        self.pseudo_queues.append(traffic_class, frame)
+        if self.queue_monitor is not None:
+            self.update_queue_histograms("shaped", shaped_queue, shaped_queue_index)
+            self.update_queue_histograms("pseudo", self.pseudo_queues[traffic_class], traffic_class)
+        self.egress.notify(traffic_class)
 
     def __len__(self):
-        length = 0
-        for queue in self.pseudo_queues:
-            length += queue.__len__()
-        for queue in self.shaped_queues:
+        length = self.pseudo_queues.__len__()
+        for queue in self.shaped_queues.values():
             length += queue.__len__()
         return length
 
@@ -266,3 +463,131 @@ class UBSScheduler2(UBSScheduler):
     @staticmethod
     def get_shaped_queue_index(frame: Frame, traffic_class: int, egress_address: str):
         return "-".join((str(traffic_class), egress_address, str(frame.traffic_class)))
+
+
+class CBSScheduler(UBSScheduler):
+    # credits above -credit_tolerance bits count as 0, so rounding errors do not delay frames
+    credit_tolerance = 1e-6
+
+    def __init__(self, env: SimulationEnvironment, bandwidth: int,
+                 priority_map: PriorityMap, mode: str, monitor: bool = False, idle_slopes: dict = None,
+                 send_slopes: dict = None):
+        """
+        credit based shaper (802.1Qav): one FIFO queue per traffic class, strict priority between the traffic classes
+        which may send. a traffic class with an idle slope may only send while its credit is >= 0. the credit grows
+        with idleSlope while frames of the traffic class wait or the credit is negative, shrinks with sendSlope while
+        a frame of the traffic class is sent and is reset to 0 when the queue is empty and the credit is positive.
+        traffic classes without idle slope are not shaped.
+        monitoring is the same as for UBSScheduler: the queue of a traffic class is logged as pseudo queue and
+        reported as shaped_queue of UBS_Switch_Frame, frames enter it on arrival (pseudo_queue_time = arrival_time),
+        so the waiting for credit is part of pseudo_queue_delay
+        :param mode: "cbs", only used for the mode column
+        :param idle_slopes: traffic class -> idleSlope in bit per micro second (like bandwidth), 0 < idleSlope <
+            bandwidth
+        :param send_slopes: traffic class -> sendSlope in bit per micro second, < 0; default = idleSlope - bandwidth
+        """
+        super(CBSScheduler, self).__init__(env, bandwidth, priority_map, mode, monitor)
+        # frames are not shaped per ingress port, there are no shaped queues
+        self.shaper = None
+        self.idle_slopes = dict(idle_slopes) if idle_slopes is not None else dict()
+        self.send_slopes = dict()
+        for traffic_class, idle_slope in self.idle_slopes.items():
+            if not 0 < idle_slope < bandwidth:
+                raise ValueError("idle slope %s of traffic class %d is not in (0, %s)"
+                                 % (idle_slope, traffic_class, bandwidth))
+            send_slope = idle_slope - bandwidth
+            if send_slopes is not None and traffic_class in send_slopes:
+                send_slope = send_slopes[traffic_class]
+            if not send_slope < 0:
+                raise ValueError("send slope %s of traffic class %d is not negative" % (send_slope, traffic_class))
+            self.send_slopes[traffic_class] = send_slope
+        # traffic class -> credit in bit at credit_times[traffic class]
+        self.credits = {traffic_class: 0 for traffic_class in self.idle_slopes.keys()}
+        self.credit_times = {traffic_class: env.now for traffic_class in self.idle_slopes.keys()}
+        # traffic class -> callback which notifies the egress port when the credit reaches 0
+        self.credit_timers = dict()
+        # traffic class of the frame which is being sent, None if the port is idle
+        self.sending_class = None
+
+    def credit(self, traffic_class: int) -> float:
+        """
+        :return: credit of the shaped traffic class traffic_class now
+        """
+        credit = self.credits[traffic_class]
+        elapsed = self.env.now - self.credit_times[traffic_class]
+        if traffic_class == self.sending_class:
+            return credit + self.send_slopes[traffic_class] * elapsed
+        if self.pseudo_queues[traffic_class].__len__() > 0:
+            return credit + self.idle_slopes[traffic_class] * elapsed
+        return min(credit + self.idle_slopes[traffic_class] * elapsed, 0)
+
+    def update_credit(self, traffic_class: int):
+        """
+        has to be called before the queue of the shaped traffic class traffic_class or sending_class are changed
+        """
+        self.credits[traffic_class] = self.credit(traffic_class)
+        self.credit_times[traffic_class] = self.env.now
+
+    def on_credit(self, traffic_class: int):
+        del self.credit_timers[traffic_class]
+        self.egress.notify(traffic_class)
+
+    def peek_frame(self, traffic_classes: int = -1):
+        mask = self.pseudo_queues.mask & traffic_classes
+        while mask != 0:
+            traffic_class = mask.bit_length() - 1
+            mask &= ~(1 << traffic_class)
+            if traffic_class not in self.idle_slopes:
+                return self.pseudo_queues[traffic_class][0]
+            credit = self.credit(traffic_class)
+            if credit >= -self.credit_tolerance:
+                return self.pseudo_queues[traffic_class][0]
+            if traffic_class not in self.credit_timers:
+                # the credit grows with idleSlope until the traffic class sends again
+                self.credit_timers[traffic_class] = self.env.call_later(
+                    -credit / self.idle_slopes[traffic_class], self.on_credit, traffic_class)
+        return None
+
+    def append_frame(self, frame: Frame, sender: Node):
+        traffic_class: int = self.priority_map[frame.priority]
+        pseudo_queue: FrameQueue = self.pseudo_queues[traffic_class]
+        if self.monitor:
+            if self.statistics:
+                if frame.id in self.frame_times:
+                    raise RuntimeError("frame id not unique")
+                self.frame_times[frame.id] = [self.env.now, self.env.now]
+            else:
+                if frame.id in self.frame_rows:
+                    raise RuntimeError("frame id not unique")
+                if self.env.sink is not None and self.data.full():
+                    self.emit_data()
+                self.frame_rows[frame.id] = self.data.append(
+                    frame_id=frame.id, flow_id=frame.flow.id, frame_len=frame.length, frame_priority=frame.priority,
+                    shaped_queue=self.shaped_queue_codes[str(traffic_class)], arrival_time=self.env.now,
+                    pseudo_queue_time=self.env.now, transmission_time=frame.length * 8 / self.bandwidth)
+                if self.queue_monitor is None:
+                    self.add_queue_data("pseudo", pseudo_queue, traffic_class)
+        if traffic_class in self.idle_slopes:
+            self.update_credit(traffic_class)
+        self.pseudo_queues.append(traffic_class, frame)
+        if self.monitor and self.statistics:
+            self.update_queue_statistics("pseudo", pseudo_queue, traffic_class)
+        elif self.queue_monitor is not None:
+            self.update_queue_histograms("pseudo", pseudo_queue, traffic_class)
+        self.egress.notify(traffic_class)
+
+    def start_transmission(self, frame: Frame):
+        traffic_class: int = self.priority_map[frame.priority]
+        if traffic_class in self.idle_slopes:
+            self.update_credit(traffic_class)
+        self.sending_class = traffic_class
+
+    def end_transmission(self, frame: Frame, preemptions: int = 0):
+        traffic_class: int = self.priority_map[frame.priority]
+        if traffic_class in self.idle_slopes:
+            self.update_credit(traffic_class)
+        self.sending_class = None
+        super(CBSScheduler, self).end_transmission(frame, preemptions)
+        if traffic_class in self.idle_slopes and self.pseudo_queues[traffic_class].__len__() == 0 and \
+                self.credits[traffic_class] > 0:
+            self.credits[traffic_class] = 0
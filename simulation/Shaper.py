@@ -0,0 +1,155 @@
+from simulation.Frame import Frame
+from simulation.Queue import FrameQueue
+
+
+class ShapedQueue(object):
+    __slots__ = ("index", "queue", "traffic_class", "frame", "release", "active", "time_state", "burst_state")
+
+    def __init__(self, index: str, queue: FrameQueue, traffic_class: int):
+        """
+        shaper state of one shaped queue
+        :param index: shaped queue index
+        :param queue: the shaped queue
+        :param traffic_class: traffic class of the pseudo queue eligible frames are released to
+        """
+        self.index = index
+        self.queue = queue
+        self.traffic_class = traffic_class
+        # head of line frame, already removed from queue, waiting until it is eligible
+        self.frame = None
+        # values computed when frame was taken from queue, used when it is released
+        self.release = None
+        # False if queue is empty and nothing is scheduled for it
+        self.active = False
+        # flow id -> shaper state of that flow in this shaped queue
+        self.time_state = dict()
+        self.burst_state = dict()
+
+
+class Shaper(object):
+    def __init__(self, scheduler):
+        """
+        shaper engine of one UBSScheduler, serves all of its shaped queues without a process per shaped queue.
+        a shaped queue is served with a callback scheduled for the current time when its first frame arrives;
+        a head of line frame which is not eligible yet schedules a timed callback for its eligibility time.
+        the callbacks are scheduled at the same points in time and in the same order as the former shaped queue
+        processes woke up, so results do not change. with env.fused_callbacks the queue is served right away instead
+        :type scheduler: UBSScheduler
+        """
+        self.scheduler = scheduler
+        self.env = scheduler.env
+        # shaped queue index -> ShapedQueue
+        self.shaped_queues = dict()
+
+    def location(self) -> (str, str):
+        context = self.scheduler.context
+        return context.get("switch_address", ""), context.get("egress_address", "")
+
+    def held_frame(self, shaped_queue_index: str):
+        """
+        :return: head of line frame of the shaped queue which waits until it is eligible, None if there is none
+        """
+        state = self.shaped_queues.get(shaped_queue_index)
+        return state.frame if state is not None else None
+
+    def append_frame(self, shaped_queue_index: str, shaped_queue: FrameQueue, traffic_class: int):
+        """
+        call after a frame was appended to shaped_queue
+        """
+        try:
+            state = self.shaped_queues[shaped_queue_index]
+        except KeyError:
+            state = ShapedQueue(shaped_queue_index, shaped_queue, traffic_class)
+            self.shaped_queues[shaped_queue_index] = state
+        if not state.active:
+            state.active = True
+            if self.env.fused_callbacks:
+                self.serve(state)
+            else:
+                self.env.call_soon(self.serve, state)
+
+    def serve(self, state: ShapedQueue):
+        """
+        releases eligible frames of a shaped queue until it is empty or its head of line frame has to wait
+        """
+        queue = state.queue
+        while True:
+            if state.frame is None:
+                if queue.__len__() == 0:
+                    state.active = False
+                    return
+                frame = queue.popleft()
+                state.frame = frame
+                delay = self.get_delay(state, frame)
+                if delay is not None:
+                    self.env.call_later(delay, self.on_eligible, state)
+                    return
+            self.release_frame(state)
+
+    def on_eligible(self, state: ShapedQueue):
+        self.release_frame(state)
+        self.serve(state)
+
+    def release_frame(self, state: ShapedQueue):
+        frame = state.frame
+        self.scheduler.pseudo_queue_append(state.index, state.queue, state.traffic_class, frame)
+        self.on_release(state, frame)
+        state.frame = None
+        state.release = None
+
+    def get_delay(self, state: ShapedQueue, frame: Frame):
+        """
+        called when frame is taken from the shaped queue, may store values in state.release
+        :return: time until frame is eligible, None if it is eligible now
+        """
+        return None
+
+    def on_release(self, state: ShapedQueue, frame: Frame):
+        """
+        called after frame was released to the pseudo queue, updates the state of its flow
+        """
+        pass
+
+
+class LRQShaper(Shaper):
+    def get_delay(self, state: ShapedQueue, frame: Frame):
+        frame_bit_len = frame.length * 8
+        flow_leaky_rate = frame.flow.leaky_rate * (1 + frame.hop / 100)
+        state.release = (frame_bit_len, flow_leaky_rate)
+        time = state.time_state.get(frame.flow.id, 0)
+        if not self.env.now >= time:
+            return time - self.env.now
+        return None
+
+    def on_release(self, state: ShapedQueue, frame: Frame):
+        frame_bit_len, flow_leaky_rate = state.release
+        state.time_state[frame.flow.id] = self.env.now + (frame_bit_len / flow_leaky_rate)
+
+
+class TBEShaper(Shaper):
+    def get_delay(self, state: ShapedQueue, frame: Frame):
+        frame_bit_len = frame.length * 8
+        flow_index = frame.flow.id
+        flow_leaky_rate = frame.flow.leaky_rate * (1 + frame.hop / 100)
+        burstiness = frame.flow.burstiness * 8
+        time = state.time_state.get(flow_index, 0)
+        try:
+            burst = state.burst_state[flow_index]
+        except KeyError:
+            burst = burstiness
+            state.burst_state[flow_index] = burst
+        state.release = (frame_bit_len, flow_leaky_rate, burstiness, burst, time)
+        if not burst + (self.env.now - time) * flow_leaky_rate >= frame_bit_len:
+            return (frame_bit_len - (burst + (self.env.now - time) * flow_leaky_rate)) / flow_leaky_rate
+        return None
+
+    def on_release(self, state: ShapedQueue, frame: Frame):
+        frame_bit_len, flow_leaky_rate, burstiness, burst, time = state.release
+        flow_index = frame.flow.id
+        state.burst_state[flow_index] = min(burstiness, burst + (self.env.now - time) * flow_leaky_rate) - frame_bit_len
+        state.time_state[flow_index] = self.env.now
+
+
+class ShapelessShaper(Shaper):
+    # no shaping, frames are directly send to the pseudo queue
+    pass
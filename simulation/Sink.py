@@ -0,0 +1,76 @@
+from simulation.Trace import TRACE_TABLES, TraceWriter
+
+import csv
+import os
+
+from collections import defaultdict
+
+
+class CSVSink(object):
+    def __init__(self, path: str, batch_size: int = 10000):
+        """
+        receives rows while simulations are running and writes them in batches to <path>/<dict_format>.csv,
+        the same files write_to_csv writes. at most batch_size rows per table are held in memory
+        :param path: result directory, has to exist
+        :param batch_size: number of rows of one table which are buffered before they are written
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.buffers = defaultdict(list)
+        self.fieldnames = dict()
+
+    def emit(self, dict_format: str, frame_dict: dict):
+        """
+        :param dict_format: name of the table
+        :param frame_dict: row of the table
+        """
+        buffer = self.buffers[dict_format]
+        buffer.append(frame_dict)
+        if buffer.__len__() >= self.batch_size:
+            self.flush(dict_format)
+
+    def flush(self, dict_format: str = None):
+        """
+        writes the buffered rows of table dict_format, or of all tables if dict_format is None
+        """
+        if dict_format is None:
+            for buffered_format in list(self.buffers.keys()):
+                self.flush(buffered_format)
+            return
+        buffer = self.buffers[dict_format]
+        if buffer.__len__() == 0:
+            return
+        path = os.path.join(self.path, "%s.csv" % dict_format)
+        if dict_format not in self.fieldnames:
+            self.fieldnames[dict_format] = list(buffer[0].keys())
+        with open(path, "a", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=self.fieldnames[dict_format], delimiter=",",
+                                    lineterminator="\n")
+            if os.stat(path).st_size == 0:
+                writer.writeheader()
+            writer.writerows(buffer)
+        buffer.clear()
+
+    def close(self):
+        self.flush()
+
+
+class TraceSink(CSVSink):
+    def __init__(self, path: str, batch_size: int = 10000):
+        """
+        like CSVSink, but the tables of TRACE_TABLES are written in the binary trace format (see TraceWriter)
+        """
+        super(TraceSink, self).__init__(path, batch_size)
+        self.writers = dict()
+
+    def flush(self, dict_format: str = None):
+        if dict_format is None or dict_format not in TRACE_TABLES:
+            super(TraceSink, self).flush(dict_format)
+            return
+        try:
+            writer = self.writers[dict_format]
+        except KeyError:
+            writer = TraceWriter(self.path, dict_format)
+            self.writers[dict_format] = writer
+        writer.write(self.buffers[dict_format])
+        self.buffers[dict_format].clear()
@@ -0,0 +1,243 @@
+from math import ceil, log, sqrt
+
+
+class OnlineMoments(object):
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        """
+        count, mean, variance, min and max of a stream of values in constant memory (Welford's algorithm)
+        """
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """
+        adds all values of OnlineMoments other (Chan's parallel algorithm)
+        """
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self) -> float:
+        """
+        :return: sample variance, 0 for less than two values
+        """
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return sqrt(self.variance)
+
+
+class QuantileSketch(object):
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-9):
+        """
+        quantiles of a stream of values >= 0 with a relative error of at most relative_accuracy (like DDSketch).
+        values are counted in logarithmic buckets, the memory only depends on the range of the values:
+        about log(max / min_value) / relative_accuracy / 2 buckets
+        :param relative_accuracy: maximum relative error of a quantile
+        :param min_value: values below min_value are counted as 0
+        """
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = log(self.gamma)
+        self.min_value = min_value
+        # bucket index -> count; bucket k holds values in (gamma^(k-1), gamma^k]
+        self.buckets = dict()
+        self.zero_count = 0
+        self.count = 0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def add(self, value: float):
+        self.count += 1
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value < self.min_value:
+            self.zero_count += 1
+        else:
+            index = ceil(log(value) / self.log_gamma)
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other):
+        """
+        adds all values of QuantileSketch other, both need the same relative_accuracy
+        """
+        for index, bucket_count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + bucket_count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """
+        :param q: 0 <= q <= 1
+        :return: estimate of the q quantile, NaN if no value was added
+        """
+        if self.count == 0:
+            return float("nan")
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return max(self.min, 0.0)
+        for index in sorted(self.buckets.keys()):
+            seen += self.buckets[index]
+            if seen > rank:
+                # the value with the lowest relative error to all values of the bucket
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+
+class DelayStatistics(object):
+    # quantiles in the summary, name -> q
+    quantiles = (("p50", 0.5), ("p99", 0.99), ("p999", 0.999))
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        """
+        moments and quantiles of delays
+        """
+        self.moments = OnlineMoments()
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def add(self, delay: float):
+        self.moments.add(delay)
+        self.sketch.add(delay)
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+
+    def to_dict(self, prefix: str) -> dict:
+        """
+        :return: dict <prefix>_mean, <prefix>_std, <prefix>_min, <prefix>_max, <prefix>_p50, ...; "" if no delay was
+            added
+        """
+        moments = self.moments
+        if moments.count == 0:
+            summary = {"%s_%s" % (prefix, name): "" for name in ("mean", "std", "min", "max")}
+            summary.update(("%s_%s" % (prefix, name), "") for name, q in self.quantiles)
+            return summary
+        summary = {"%s_mean" % prefix: moments.mean, "%s_std" % prefix: moments.std,
+                   "%s_min" % prefix: moments.min, "%s_max" % prefix: moments.max}
+        for name, q in self.quantiles:
+            summary["%s_%s" % (prefix, name)] = self.sketch.quantile(q)
+        return summary
+
+
+class TimeWeightedStatistics(object):
+    __slots__ = ("value", "since", "area", "max", "start")
+
+    def __init__(self, start: float = 0, value: float = 0):
+        """
+        time weighted mean and max of a value which changes over time, e.g. the backlog of a queue
+        :param start: time the value is observed from
+        :param value: value at start
+        """
+        self.value = value
+        self.since = start
+        self.start = start
+        self.area = 0.0
+        self.max = value
+
+    def update(self, time: float, value: float):
+        """
+        the value changed to value at time
+        """
+        self.area += self.value * (time - self.since)
+        self.value = value
+        self.since = time
+        if value > self.max:
+            self.max = value
+
+    def mean(self, time: float) -> float:
+        """
+        :return: time weighted mean from start until time
+        """
+        duration = time - self.start
+        if duration <= 0:
+            return self.value
+        return (self.area + self.value * (time - self.since)) / duration
+
+
+class TimeWeightedHistogram(object):
+    __slots__ = ("bucket_width", "value", "since", "start", "durations")
+
+    def __init__(self, bucket_width: float, start: float = 0, value: float = 0):
+        """
+        how long a value which changes over time had each value, e.g. the backlog of a queue. values are counted in
+        buckets [k * bucket_width, (k + 1) * bucket_width)
+        :param bucket_width: width of a bucket
+        :param start: time the value is observed from
+        :param value: value at start
+        """
+        self.bucket_width = bucket_width
+        self.value = value
+        self.since = start
+        self.start = start
+        # bucket index -> time the value was in that bucket
+        self.durations = dict()
+
+    def update(self, time: float, value: float):
+        """
+        the value changed to value at time
+        """
+        if time > self.since:
+            index = int(self.value // self.bucket_width)
+            self.durations[index] = self.durations.get(index, 0) + time - self.since
+        self.value = value
+        self.since = time
+
+    def get_buckets(self, time: float) -> list:
+        """
+        :return: list of (bucket start, bucket end, duration) from start until time, ordered by bucket
+        """
+        durations = dict(self.durations)
+        if time > self.since:
+            index = int(self.value // self.bucket_width)
+            durations[index] = durations.get(index, 0) + time - self.since
+        return [(index * self.bucket_width, (index + 1) * self.bucket_width, duration)
+                for index, duration in sorted(durations.items())]
+
+
+class QueueMonitor(object):
+    def __init__(self, byte_bucket: int = 100, frame_bucket: int = 1, interval: float = None):
+        """
+        settings of the queue monitoring of UBSScheduler (see SimulationEnvironment.queue_monitor): instead of a
+        change log of every queue, monitored schedulers keep time weighted histograms of the occupancy of every shaped
+        and pseudo queue, and optionally snapshots of all queues every interval. the size of the output does not
+        depend on the number of frames, histograms of several replications can be summed up
+        :param byte_bucket: bucket width of the byte length histograms in byte
+        :param frame_bucket: bucket width of the frame histograms in frames
+        :param interval: time between two snapshots in micro seconds; None = no snapshots
+        """
+        self.byte_bucket = byte_bucket
+        self.frame_bucket = frame_bucket
+        self.interval = interval
+
+    def __repr__(self):
+        return "QueueMonitor(%r, %r, %r)" % (self.byte_bucket, self.frame_bucket, self.interval)
@@ -1,12 +1,9 @@
-from simulation.Frame import Frame
-from simulation.Path import Path
+from simulation.Frame import Frame, FrameCopy
 from simulation.Node import Node
 from simulation.Core import SimulationEnvironment, Sending
-from simulation.Scheduler import UBSScheduler, UBSScheduler2, Scheduler
+from simulation.Scheduler import UBSScheduler, UBSScheduler2, CBSScheduler, Scheduler
 from simulation.PriorityMap import PriorityMap
 
-from simpy import Interrupt
-
 
 class Switch(Node):
     def __init__(self, env: SimulationEnvironment, address: str, priority_map: PriorityMap, monitor: bool = False):
@@ -14,86 +11,220 @@ class Switch(Node):
         self.priority_map = priority_map
 
     def on_frame_received(self, frame: Frame, sender: Node):
-        path: Path = frame.flow.path
-        receiver_addresses: list = path[self.address]
+        # egress ports of this switch the frame is forwarded to
+        ports: tuple = frame.flow.table.ports[self.index]
 
 
 class UBSSwitch(Switch):
     def __init__(self, env: SimulationEnvironment, address: str, priority_map: PriorityMap, mode: str = "lrq",
-                 monitor: bool = False):
+                 monitor: bool = False, express_traffic_classes: tuple = (), min_fragment: int = 64,
+                 fragment_overhead: int = 24):
+        """
+        :param express_traffic_classes: frame preemption (802.1Qbu): frames of these traffic classes preempt the
+            transmission of frames of all other (preemptable) traffic classes; default = no preemption
+        :param min_fragment: minimum size of a fragment of a preempted frame in byte (802.3br: 64)
+        :param fragment_overhead: bytes added to the transmission for every preemption (802.3br: 24 = checksum of
+            the preempted fragment, preamble and fragment header of the next fragment, inter frame gap)
+        """
         super(UBSSwitch, self).__init__(env, address, priority_map, monitor)
         self.mode = mode
+        # bit i is set if traffic class i is express
+        self.express_mask = 0
+        for traffic_class in express_traffic_classes:
+            self.express_mask |= 1 << traffic_class
+        self.min_fragment = min_fragment
+        self.fragment_overhead = fragment_overhead
+        # receiver address -> scheduler / Egress of that egress port
         self.schedulers = dict()
-        self.processes = dict()
-
-        self.sleep_event = env.event()
+        self.egresses = dict()
+        # egress port index -> scheduler of that egress port
+        self.port_schedulers = dict()
 
     def get_data(self) -> list((list, str)):
         if self.monitor:
-            frame_result = list()
-            queue_result = list()
-            for receiver_address, scheduler in self.schedulers.items():
-                frame_data, queue_data = scheduler.get_data()
-                for frame_dict in frame_data:
-                    tmp_dict = {"switch_address": self.address, "egress_address": receiver_address}
-                    tmp_dict.update(frame_dict)
-                    frame_result.append(tmp_dict)
-                for queue_dict in queue_data:
-                    tmp_dict = {"switch_address": self.address, "egress_address": receiver_address}
-                    tmp_dict.update(queue_dict)
-                    queue_result.append(tmp_dict)
-            return [(frame_result, "UBS_Switch_Frame"), (queue_result, "UBS_Switch_Queue")]
+            # table name -> rows of all schedulers
+            results = dict()
+            for dict_format, row in self.iter_data(dict()):
+                results.setdefault(dict_format, list()).append(row)
+            return [(result, dict_format) for dict_format, result in results.items()]
         else:
             return None
 
+    def iter_data(self, context: dict):
+        for receiver_address, scheduler in self.schedulers.items():
+            scheduler_context = dict(context)
+            scheduler_context.update(scheduler.context)
+            yield from scheduler.iter_tables(scheduler_context)
+
+    def flush_data(self):
+        for scheduler in self.schedulers.values():
+            scheduler.flush_data()
+
+    def backlog(self) -> (int, float):
+        # frames which are being sent (or are preempted) stay in their pseudo queue until end_transmission, frames
+        # which the shaper holds until they are eligible are in no queue
+        frames = 0
+        byte_length = 0
+        for scheduler in self.schedulers.values():
+            frames += scheduler.__len__()
+            for queue in scheduler.pseudo_queues.queues:
+                byte_length += queue.byte_len
+            for queue in scheduler.shaped_queues.values():
+                byte_length += queue.byte_len
+            if scheduler.shaper is not None:
+                for state in scheduler.shaper.shaped_queues.values():
+                    if state.frame is not None:
+                        frames += 1
+                        byte_length += state.frame.length
+        return frames, byte_length
+
     def egress_append_frame(self, frame: Frame, sender: Node, scheduler_class: Scheduler.__class__):
-        path: Path = frame.flow.path
-        # multicast, frame might need to be added to multiple egress schedulers
-        receiver_addresses: list = path[self.address]
-
-        for receiver_address in receiver_addresses:
-            # egress does not exist: create scheduler for that egress port
-            if receiver_address not in self.schedulers:
-                bandwidth = self.env.topology.bandwidth(self.address, receiver_address)
-                scheduler = scheduler_class(self.env, bandwidth, self.priority_map, self.mode, self.monitor)
-                process = self.env.process(self.process_send(scheduler, receiver_address))
-                scheduler.egress_process = process
-                self.schedulers[receiver_address] = scheduler
-                self.processes[receiver_address] = process
+        # multicast, frame might need to be added to multiple egress schedulers.
+        # every further egress port gets its own FrameCopy, so the branches do not share traffic class and hop
+        received_frame = frame
+        for i, port in enumerate(frame.flow.table.ports[self.index]):
+            if i > 0:
+                frame = FrameCopy(received_frame)
+            try:
+                scheduler = self.port_schedulers[port]
+            except KeyError:
+                # egress does not exist: create scheduler for that egress port
+                receiver, bandwidth = self.ports[port]
+                scheduler = self.new_scheduler(scheduler_class, bandwidth)
+                scheduler.context = {"switch_address": self.address, "egress_address": receiver.address}
+                egress = Egress(self, scheduler, port)
+                scheduler.egress = egress
+                self.schedulers[receiver.address] = scheduler
+                self.egresses[receiver.address] = egress
+                self.port_schedulers[port] = scheduler
             # add frame to the scheduler of that egress port
-            self.schedulers[receiver_address].append_frame(frame, sender)
+            scheduler.append_frame(frame, sender)
+
+    def new_scheduler(self, scheduler_class: Scheduler.__class__, bandwidth: int) -> Scheduler:
+        """
+        :return: scheduler for a new egress port with bandwidth bandwidth
+        """
+        return scheduler_class(self.env, bandwidth, self.priority_map, self.mode, self.monitor)
 
     def on_frame_received(self, frame: Frame, sender: Node):
         self.egress_append_frame(frame, sender, UBSScheduler)
 
-    def process_send(self, scheduler: UBSScheduler, receiver_address: str):
-        frame: Frame = None
-        sending_object: Sending = None
-        while True:
-            try:
-                if frame is not None:
-                    if sending_object.process.processed:
-                        frame = None
-                        sending_object = None
-                    else:
-                        scheduler.start_transmission(frame)
-                        yield sending_object.process
-                        scheduler.end_transmission(frame)
-                else:
-                    frame = scheduler.peek_frame()
-                    if frame is None:
-                        yield self.sleep_event
-                    else:
-                        sending_object = self.send_frame(
-                            receiver_address, frame, traffic_class=self.priority_map[frame.priority])
-            except Interrupt:
-                pass
-
 
 class UBSSwitch2(UBSSwitch):
     def __init__(self, env: SimulationEnvironment, address: str, priority_map: PriorityMap, mode: str = "lrq",
-                 monitor: bool = False):
-        super(UBSSwitch2, self).__init__(env, address, priority_map, mode, monitor)
+                 monitor: bool = False, express_traffic_classes: tuple = (), min_fragment: int = 64,
+                 fragment_overhead: int = 24):
+        super(UBSSwitch2, self).__init__(env, address, priority_map, mode, monitor, express_traffic_classes,
+                                         min_fragment, fragment_overhead)
 
     def on_frame_received(self, frame: Frame, sender: Node):
         self.egress_append_frame(frame, sender, UBSScheduler2)
+
+
+class CBSSwitch(UBSSwitch):
+    def __init__(self, env: SimulationEnvironment, address: str, priority_map: PriorityMap, idle_slopes: dict,
+                 monitor: bool = False, send_slopes: dict = None):
+        """
+        switch with credit based shapers (802.1Qav) at its egress ports instead of UBS, see CBSScheduler. the
+        monitored frames are added to the UBS_Switch_Frame table with mode "cbs", so they can be compared with UBS
+        :param idle_slopes: traffic class -> idleSlope in bit per micro second, the same for all egress ports;
+            traffic classes without idle slope are not shaped
+        :param send_slopes: traffic class -> sendSlope; default = idleSlope - bandwidth of the port
+        """
+        super(CBSSwitch, self).__init__(env, address, priority_map, "cbs", monitor)
+        self.idle_slopes = idle_slopes
+        self.send_slopes = send_slopes
+
+    def new_scheduler(self, scheduler_class: Scheduler.__class__, bandwidth: int) -> Scheduler:
+        return scheduler_class(self.env, bandwidth, self.priority_map, self.mode, self.monitor, self.idle_slopes,
+                               self.send_slopes)
+
+    def on_frame_received(self, frame: Frame, sender: Node):
+        self.egress_append_frame(frame, sender, CBSScheduler)
+
+
+class Egress(object):
+    def __init__(self, switch: Switch, scheduler: Scheduler, port: int):
+        """
+        egress port of a switch, sends the frames of scheduler to the node connected to port one at a time.
+        the port sleeps while the scheduler has no frame, the scheduler wakes it up with notify.
+        if the switch has express traffic classes, a frame of an express traffic class preempts the transmission of
+        a preemptable frame as soon as the fragments are large enough; the preempted frame is resumed before any
+        other preemptable frame once no express frame is left
+        :param switch: switch of this egress port
+        :param scheduler: scheduler of this egress port
+        :param port: index of the port in switch.ports
+        """
+        self.switch = switch
+        self.env = switch.env
+        self.scheduler = scheduler
+        self.port = port
+        self.receiver_address = switch.ports[port][0].address
+        # True if no frame is being sent and none is scheduled to be sent
+        self.sleeping: bool = True
+        self.sending_object: Sending = None
+        # paused transmission of a preemptable frame, timer of a pending preemption
+        self.preempted: Sending = None
+        self.preemption_timer = None
+
+    def location(self) -> (str, str):
+        return self.switch.address, self.receiver_address
+
+    def notify(self, traffic_class: int):
+        """
+        called by the scheduler after a frame was added to the queue of traffic_class from which frames are sent
+        """
+        if self.sleeping:
+            self.sleeping = False
+            if self.env.fused_callbacks:
+                self.send_next_frame()
+            else:
+                self.env.call_soon(self.send_next_frame)
+        elif self.switch.express_mask >> traffic_class & 1 and self.preemption_timer is None:
+            self.preempt()
+
+    def preempt(self):
+        """
+        pauses the transmission of a preemptable frame, or schedules the pause if the sent fragment is too small
+        """
+        self.preemption_timer = None
+        sending_object = self.sending_object
+        if sending_object is None or self.switch.express_mask >> sending_object.frame.traffic_class & 1:
+            return
+        delay = sending_object.preemption_delay(self.switch.min_fragment * 8)
+        if delay is None:
+            # the rest of the frame is smaller than a fragment
+            return
+        if delay > 0:
+            self.preemption_timer = self.env.call_later(delay, self.preempt)
+            return
+        sending_object.pause(self.switch.fragment_overhead * 8)
+        self.preempted = sending_object
+        self.sending_object = None
+        self.send_next_frame()
+
+    def send_next_frame(self):
+        if self.preempted is not None:
+            frame: Frame = self.scheduler.peek_frame(self.switch.express_mask)
+            if frame is None:
+                # resume the preempted frame
+                self.sending_object = self.preempted
+                self.preempted = None
+                self.sending_object.start()
+                return
+        else:
+            frame: Frame = self.scheduler.peek_frame()
+        if frame is None:
+            self.sleeping = True
+            return
+        self.sending_object = self.switch.send_frame_port(
+            self.port, frame, traffic_class=self.switch.priority_map[frame.priority], callback=self.on_frame_sent)
+        self.scheduler.start_transmission(frame)
+
+    def on_frame_sent(self, sending_object: Sending):
+        self.sending_object = None
+        if self.preemption_timer is not None:
+            self.env.cancel(self.preemption_timer)
+            self.preemption_timer = None
+        self.scheduler.end_transmission(sending_object.frame, sending_object.preemptions)
+        self.send_next_frame()
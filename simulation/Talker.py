@@ -1,12 +1,231 @@
 from simulation.Node import Node
 from simulation.Flow import Flow
 from simulation.Frame import Frame
-from simulation.Core import SimulationEnvironment
-from simpy import Event, Process, Interrupt
+from simulation.Core import SimulationEnvironment, Sending
+from simulation.Forwarding import ForwardingTable
+from simulation.Recorder import ColumnarRecorder, StringCodes
+from simulation.Statistics import DelayStatistics
 from collections import deque
+from heapq import heappush, heappop
 
+import numpy as np
 
-class Talker(Node):
+
+class BaseTalker(Node):
+    # columns of the monitored frames, one row per send frame
+    frame_fields = {"frame_id": np.int64, "flow_id": np.int64, "frame_len": np.float64, "frame_priority": np.int8,
+                    "start_time": np.float64, "delivered": np.int32}
+    # columns of the deliveries, one row per frame and receiver; row = row of the frame in data
+    delivery_fields = {"row": np.int64, "receiver": np.int32, "delay": np.float64}
+
+    def __init__(self, env: SimulationEnvironment, address: str, monitor: bool = False):
+        """
+        monitoring shared by all talkers. send frames and their deliveries are recorded in columns, frames report
+        their deliveries back to the talker (see Frame.on_hop). if env.sink is set, frames which reached all
+        receivers of their flow are emitted to the sink instead of growing the columns
+        """
+        super(BaseTalker, self).__init__(env, address, monitor)
+        self.data = ColumnarRecorder(self.frame_fields)
+        self.deliveries = ColumnarRecorder(self.delivery_fields)
+        self.receiver_codes = StringCodes()
+        # frame id -> row in data, for frames which did not reach all receivers yet
+        self.frame_rows = dict()
+        # flow id -> number of receivers of frames of that flow send by this talker
+        self.receiver_count = dict()
+        # frame which was taken from the queue and did not reach the next node yet (waits for tokens or is sent)
+        self.sending_frame: Frame = None
+
+        # monitor_mode "statistics": no rows, flow id -> [send frames, send bytes, DelayStatistics of the deliveries]
+        self.statistics: bool = env.monitor_mode == "statistics"
+        self.flow_statistics = dict()
+
+    def get_priorities(self) -> dict:
+        """
+        :return: flow id -> priority of the frames of that flow, for all flows of get_flows
+        """
+        return dict()
+
+    def get_data(self) -> list((list, str)):
+        if self.monitor:
+            if self.statistics:
+                return [(self.get_statistics_dicts(), "talker_statistics")]
+            return [(self.get_frame_dicts(), "talker")]
+        else:
+            return None, None
+
+    def iter_data(self, context: dict):
+        if self.statistics:
+            for statistics_dict in self.get_statistics_dicts():
+                tmp_dict = dict(context)
+                tmp_dict.update(statistics_dict)
+                yield "talker_statistics", tmp_dict
+        else:
+            for frame_dict in self.iter_frame_dicts(context=context):
+                yield "talker", frame_dict
+
+    def backlog(self) -> (int, float):
+        # all talkers keep the frames which wait to be sent in queue
+        frames = self.queue.__len__()
+        byte_length = sum(frame.length for frame in self.queue)
+        if self.sending_frame is not None:
+            frames += 1
+            byte_length += self.sending_frame.length
+        return frames, byte_length
+
+    def flush_data(self):
+        if self.statistics:
+            for statistics_dict in self.get_statistics_dicts():
+                self.env.emit("talker_statistics", statistics_dict)
+        else:
+            self.emit_data(False)
+
+    def get_statistics_dicts(self) -> list:
+        """
+        exports the summaries of monitor_mode "statistics", one row per flow
+        """
+        result = list()
+        for flow_id, (frames, byte_count, delays) in sorted(self.flow_statistics.items()):
+            statistics_dict = {"sender": self.address, "flow_id": flow_id, "frames": frames, "bytes": byte_count,
+                               "deliveries": delays.moments.count}
+            statistics_dict.update(delays.to_dict("delay"))
+            result.append(statistics_dict)
+        return result
+
+    def get_frame_dicts(self, rows: np.ndarray = None) -> list:
+        """
+        exports monitored frames as rows of the talker table, one row per receiver a frame reached so far,
+        or one row without receiver if it reached none
+        :param rows: boolean array, selects which rows of data are exported; default = all rows
+        """
+        return list(self.iter_frame_dicts(rows))
+
+    def iter_frame_dicts(self, rows: np.ndarray = None, context: dict = None):
+        """
+        like get_frame_dicts, but yields the rows. the columns are converted to python values in batches of
+        ColumnarRecorder.export_batch frames
+        :param context: columns every row starts with
+        """
+        columns = dict()
+        for name in ("frame_id", "flow_id", "frame_len", "frame_priority", "start_time"):
+            column = self.data.view(name)
+            columns[name] = column if rows is None else column[rows]
+        start_time = self.data.view("start_time")
+        selected_rows = np.arange(self.data.__len__()) if rows is None else np.flatnonzero(rows)
+
+        # deliveries grouped by frame, in the order they happened
+        delivery_rows = self.deliveries.view("row")
+        order = np.argsort(delivery_rows, kind="stable")
+        delivery_rows = delivery_rows[order]
+        receiver_codes = self.deliveries.view("receiver")[order]
+        delays = self.deliveries.view("delay")[order]
+        arrival_times = start_time[delivery_rows] + delays
+        firsts = np.searchsorted(delivery_rows, selected_rows, side="left")
+        lasts = np.searchsorted(delivery_rows, selected_rows, side="right")
+
+        to_list = ColumnarRecorder.to_list
+        context = context if context is not None else dict()
+        batch = ColumnarRecorder.export_batch
+        for start in range(0, selected_rows.__len__(), batch):
+            end = min(start + batch, selected_rows.__len__())
+            frame_ids = to_list(columns["frame_id"][start:end])
+            flow_ids = to_list(columns["flow_id"][start:end])
+            frame_lens = ColumnarRecorder.to_len_list(columns["frame_len"][start:end])
+            frame_priorities = to_list(columns["frame_priority"][start:end])
+            start_times = to_list(columns["start_time"][start:end])
+            # the deliveries of the frames of this batch are contiguous
+            offset = int(firsts[start])
+            delivery_end = int(lasts[end - 1])
+            receivers = self.receiver_codes.decode(receiver_codes[offset:delivery_end].tolist())
+            batch_arrival_times = arrival_times[offset:delivery_end].tolist()
+            batch_delays = delays[offset:delivery_end].tolist()
+            batch_firsts = (firsts[start:end] - offset).tolist()
+            batch_lasts = (lasts[start:end] - offset).tolist()
+            for i in range(end - start):
+                frame_dict = dict(context)
+                frame_dict.update(frame_id=frame_ids[i], flow_id=flow_ids[i], frame_len=frame_lens[i],
+                                  frame_priority=frame_priorities[i], sender=self.address)
+                if batch_firsts[i] == batch_lasts[i]:
+                    frame_dict.update(receiver="", start_time=start_times[i], arrival_time="", delay="")
+                    yield frame_dict
+                for j in range(batch_firsts[i], batch_lasts[i]):
+                    delivery_dict = dict(frame_dict)
+                    delivery_dict.update(receiver=receivers[j], start_time=start_times[i],
+                                         arrival_time=batch_arrival_times[j], delay=batch_delays[j])
+                    yield delivery_dict
+
+    def get_table(self, flow: Flow) -> ForwardingTable:
+        """
+        :return: forwarding table of flow, flows added after the topology was compiled are compiled now
+        """
+        table = flow.table
+        if table is None:
+            table = self.env.topology.compile_flow(flow)
+        return table
+
+    def get_receiver_count(self, flow: Flow) -> int:
+        try:
+            return self.receiver_count[flow.id]
+        except KeyError:
+            receiver_count = flow.path.receivers(self.address).__len__()
+            self.receiver_count[flow.id] = receiver_count
+            return receiver_count
+
+    def monitor_frame(self, frame: Frame):
+        """
+        called when frame is send by this talker
+        """
+        if self.statistics:
+            try:
+                flow_statistics = self.flow_statistics[frame.flow.id]
+            except KeyError:
+                flow_statistics = [0, 0, DelayStatistics()]
+                self.flow_statistics[frame.flow.id] = flow_statistics
+            flow_statistics[0] += 1
+            flow_statistics[1] += frame.length
+            frame.talker = self
+            return
+        if self.env.sink is not None and self.data.full():
+            self.emit_data()
+        self.frame_rows[frame.id] = self.data.append(
+            frame_id=frame.id, flow_id=frame.flow.id, frame_len=frame.length, frame_priority=frame.priority,
+            start_time=frame.start_time)
+        frame.talker = self
+
+    def on_frame_delivered(self, frame: Frame, receiver_address: str, delay):
+        """
+        called by frame when it reached receiver_address, one of the last nodes of its path
+        """
+        if self.statistics:
+            self.flow_statistics[frame.flow.id][2].add(delay)
+            return
+        row = self.frame_rows[frame.id]
+        self.deliveries.append(row=row, receiver=self.receiver_codes[receiver_address], delay=delay)
+        delivered = self.data.get(row, "delivered") + 1
+        self.data.set(row, "delivered", delivered)
+        if delivered >= self.get_receiver_count(frame.flow):
+            del self.frame_rows[frame.id]
+
+    def emit_data(self, complete_only: bool = True):
+        """
+        emits monitored frames to env.sink and removes them from data
+        :param complete_only: only emit frames which reached all receivers of their flow
+        """
+        rows = np.ones(self.data.__len__(), dtype=bool)
+        if complete_only:
+            rows[list(self.frame_rows.values())] = False
+        for frame_dict in self.get_frame_dicts(rows):
+            self.env.emit("talker", frame_dict)
+        new_index = self.data.compact(~rows)
+        new_delivery_rows = new_index[self.deliveries.view("row")]
+        self.deliveries.compact(new_delivery_rows >= 0)
+        self.deliveries.view("row")[:] = new_delivery_rows[new_delivery_rows >= 0]
+        for frame_id, row in self.frame_rows.items():
+            self.frame_rows[frame_id] = int(new_index[row])
+        if not complete_only:
+            self.frame_rows.clear()
+
+
+class Talker(BaseTalker):
     def __init__(self, env: SimulationEnvironment, address: str, monitor: bool = False):
         """
         Talker which can hold multiple flows. Each flow will generate Frames in a leaky bucket pattern with
@@ -17,81 +236,91 @@ class Talker(Node):
         """
         super(Talker, self).__init__(env, address, monitor)
         self.queue = deque()
-        self.sleeping: bool = False
-        self.sleep_event: Event = env.event()
-        self.send_process: Process = env.process(self.process_send_frame())
+        # True if the queue is empty and no frame is being sent
+        self.sleeping: bool = True
 
-        self.data = list()
+        # one timer for all flows: heap of (creation time of the next frame, flow number, flow, priority,
+        # payload_generator); the timer is set to the creation time of the first entry
+        self.creation_times = list()
+        self.timer = None
+        self.timer_time = None
+        self.flows = list()
+        # flow id -> priority of the frames of that flow
+        self.priorities = dict()
 
-    def get_data(self) -> list((list, str)):
-        if self.monitor:
-            result = list()
-            for frame in self.data:
-                if frame.delays.__len__() == 0:
-                    frame_dict = {"frame_id": frame.id, "flow_id": frame.flow.id,
-                                  "frame_len": frame.__len__(), "frame_priority": frame.priority,
-                                  "sender": self.address, "receiver": "",
-                                  "start_time": frame.start_time, "arrival_time": "", "delay": ""}
-                    result.append(frame_dict)
-                else:
-                    for receiver_address, delay in frame.delays.items():
-                        frame_dict = {"frame_id": frame.id, "flow_id": frame.flow.id,
-                                      "frame_len": frame.__len__(), "frame_priority": frame.priority,
-                                      "sender": self.address, "receiver": receiver_address,
-                                      "start_time": frame.start_time, "arrival_time": frame.start_time + delay,
-                                      "delay": delay}
-                        result.append(frame_dict)
-            return [(result, "talker")]
-        else:
-            return None, None
+    def get_flows(self) -> list:
+        return list(self.flows)
+
+    def get_priorities(self) -> dict:
+        return dict(self.priorities)
 
     def add_flow(self, flow: Flow, priority: int, payload_generator=None):
         """
-        Adds a flow to this Talker. This will create a process which creates frames this talker will send
+        Adds a flow to this Talker. The first frame of the flow is created at the current time
         :param flow: flow for which frames are generated, this also provides the leaky_rate for the frame generation
         :param priority: priority of the frames
-        :param payload_generator: payload of the frames
+        :param payload_generator: payload of the frames, any iterator, e.g. a BlockSampler
         """
-        self.env.process(self.process_flow_create_frame(flow, priority, payload_generator))
+        # flow number = index in flows, orders flows with the same creation time
+        heappush(self.creation_times, (self.env.now, self.flows.__len__(), flow, priority, payload_generator))
+        self.flows.append(flow)
+        self.priorities[flow.id] = priority
+        if self.timer is None or self.timer_time > self.env.now:
+            if self.timer is not None:
+                self.env.cancel(self.timer)
+            self.timer_time = self.env.now
+            self.timer = self.env.call_soon(self.create_frames)
 
-    def process_send_frame(self):
+    def wake_up(self):
         """
-        process which sends frames generated by process_flow_create_frame
+        called after a frame was added to the queue
         """
-        while True:
-            if self.queue.__len__() > 0:
-                frame = self.queue.popleft()
-                if self.monitor:
-                    self.data.append(frame)
-                receiver_address = frame.flow.path[self.address][0]
-                sending_object = self.send_frame(receiver_address, frame)
-                yield sending_object.process
-                self.env.sim_print("send frame")
+        if self.sleeping:
+            self.sleeping = False
+            if self.env.fused_callbacks:
+                self.send_next_frame()
             else:
-                self.sleeping = True
-                try:
-                    yield self.sleep_event
-                except Interrupt:
-                    self.sleeping = False
+                self.env.call_soon(self.send_next_frame)
 
-    def process_flow_create_frame(self, flow: Flow, priority: int, payload_generator):
+    def send_next_frame(self):
         """
-        process which creates frames in a leaky bucket pattern with leaky_rate from the flow
-        :param flow:
-        :param priority:
-        :param payload_generator:
+        sends the next frame generated by create_frame, sleeps if there is none
         """
-        while True:
-            frame = Frame(self.env.frame_id(), flow, payload_generator.__next__(), priority, start_time=self.env.now)
+        if self.queue.__len__() > 0:
+            frame = self.queue.popleft()
+            self.sending_frame = frame
+            if self.monitor:
+                self.monitor_frame(frame)
+            self.send_frame_port(self.get_table(frame.flow).ports[self.index][0], frame,
+                                 callback=self.on_frame_sent)
+        else:
+            self.sleeping = True
+
+    def on_frame_sent(self, sending_object: Sending):
+        self.sending_frame = None
+        self.env.sim_print("send frame")
+        self.send_next_frame()
+
+    def create_frames(self):
+        """
+        creates the frames of all flows which are due, each flow in a leaky bucket pattern with leaky_rate from
+        the flow, and sets the timer to the next creation time
+        """
+        now = self.env.now
+        creation_times = self.creation_times
+        while creation_times.__len__() > 0 and creation_times[0][0] <= self.timer_time:
+            time, flow_number, flow, priority, payload_generator = heappop(creation_times)
+            frame = Frame(self.env.frame_id(), flow, payload_generator.__next__(), priority, start_time=now)
             # frame = Frame(self.env.frame_id(), flow, 1500, priority)
             self.queue.append(frame)
-            if self.sleeping:
-                self.sleeping = False
-                self.send_process.interrupt("new frame")
-            yield self.env.timeout(frame.__len__() * 8 / flow.leaky_rate)
+            self.wake_up()
+            heappush(creation_times, (now + frame.length * 8 / flow.leaky_rate, flow_number, flow, priority,
+                                      payload_generator))
+        self.timer_time = creation_times[0][0]
+        self.timer = self.env.call_at(self.timer_time, self.create_frames)
 
 
-class TokenBucketTalker(Node):
+class TokenBucketTalker(BaseTalker):
     def __init__(self, env: SimulationEnvironment, address: str, flow: Flow, priority: int,
                  payload_generator, time_generator, monitor: bool = False):
         """
@@ -102,85 +331,86 @@ class TokenBucketTalker(Node):
         super(TokenBucketTalker, self).__init__(env, address, monitor)
         self.flow = flow
         self.priority = priority
+        self.payload_generator = payload_generator
+        self.time_generator = time_generator
 
         self.queue = deque()
-        self.sleeping: bool = False
-        self.sleep_event: Event = env.event()
-        self.send_process: Process = env.process(self.process_send_frame())
-        self.frame_process: Process = env.process(
-            self.process_flow_create_frame(flow, priority, payload_generator, time_generator))
-        self.data = list()
+        # True if the queue is empty and no frame is being sent
+        self.sleeping: bool = True
 
-    def get_data(self) -> list((list, str)):
-        if self.monitor:
-            result = list()
-            for frame in self.data:
-                if frame.delays.__len__() == 0:
-                    frame_dict = {"frame_id": frame.id, "flow_id": frame.flow.id,
-                                  "frame_len": frame.__len__(), "frame_priority": frame.priority,
-                                  "sender": self.address, "receiver": "",
-                                  "start_time": frame.start_time, "arrival_time": "", "delay": ""}
-                    result.append(frame_dict)
-                else:
-                    for receiver_address, delay in frame.delays.items():
-                        frame_dict = {"frame_id": frame.id, "flow_id": frame.flow.id,
-                                      "frame_len": frame.__len__(), "frame_priority": frame.priority,
-                                      "sender": self.address, "receiver": receiver_address,
-                                      "start_time": frame.start_time, "arrival_time": frame.start_time + delay,
-                                      "delay": delay}
-                        result.append(frame_dict)
-            return [(result, "talker")]
-        else:
-            return None, None
+        # token bucket state
+        self.leaky_rate = flow.leaky_rate
+        self.burstiness = flow.burstiness * 8
+        # burst = remaining burst
+        self.burst = self.burstiness
+        self.time = env.now
+
+        env.call_soon(self.create_frame)
+
+    def get_flows(self) -> list:
+        return [self.flow]
 
-    def process_send_frame(self):
+    def get_priorities(self) -> dict:
+        return {self.flow.id: self.priority}
+
+    def wake_up(self):
+        """
+        called after a frame was added to the queue
+        """
+        if self.sleeping:
+            self.sleeping = False
+            if self.env.fused_callbacks:
+                self.send_next_frame()
+            else:
+                self.env.call_soon(self.send_next_frame)
+
+    def send_next_frame(self):
         """
-        process which sends frames generated by process_flow_create_frame in a token bucket pattern.
+        sends frames generated by create_frame in a token bucket pattern, sleeps if there is none.
         leaky rate and burstiness are defined by the flow
         """
-        leaky_rate = self.flow.leaky_rate
-        burstiness = self.flow.burstiness * 8
-        # burst = remaining burst
-        burst = burstiness
-
-        time = self.env.now
-        while True:
-            if self.queue.__len__() > 0:
-                frame = self.queue.popleft()
-                frame_bit_len = frame.__len__() * 8
-                if self.monitor:
-                    self.data.append(frame)
-                receiver_address = frame.flow.path[self.address][0]
-
-                if not burst + (self.env.now - time) * leaky_rate >= frame_bit_len:
-                    yield self.env.timeout((frame_bit_len - (burst + (self.env.now - time) * leaky_rate)) / leaky_rate)
-                burst = min(burstiness, burst + (self.env.now - time) * leaky_rate) - frame_bit_len
-                time = self.env.now
-
-                sending_object = self.send_frame(receiver_address, frame)
-                yield sending_object.process
-                self.env.sim_print("send frame")
+        if self.queue.__len__() > 0:
+            frame = self.queue.popleft()
+            self.sending_frame = frame
+            frame_bit_len = frame.length * 8
+            if self.monitor:
+                self.monitor_frame(frame)
+
+            if not self.burst + (self.env.now - self.time) * self.leaky_rate >= frame_bit_len:
+                self.env.call_later(
+                    (frame_bit_len - (self.burst + (self.env.now - self.time) * self.leaky_rate)) / self.leaky_rate,
+                    self.transmit_frame, frame)
             else:
-                self.sleeping = True
-                try:
-                    yield self.sleep_event
-                except Interrupt:
-                    self.sleeping = False
-
-    def process_flow_create_frame(self, flow: Flow, priority: int, payload_generator, time_generator):
-        """
-        process which creates a frame, puts it in a token bucket shaped queue and waits time_generator.__next__() time
-        until a new frame is created
-        :param flow: flow for which frame are created, also used for the token bucket shaper in process_send_frame
-        :param priority: priority for this flow
-        :param payload_generator: generator which generates the size of frames (in byte),
+                self.transmit_frame(frame)
+        else:
+            self.sleeping = True
+
+    def transmit_frame(self, frame: Frame):
+        """
+        takes the tokens for frame from the bucket and sends it
+        """
+        self.burst = min(self.burstiness, self.burst + (self.env.now - self.time) * self.leaky_rate) - frame.length * 8
+        self.time = self.env.now
+
+        self.send_frame_port(self.get_table(frame.flow).ports[self.index][0], frame, callback=self.on_frame_sent)
+
+    def on_frame_sent(self, sending_object: Sending):
+        self.sending_frame = None
+        self.env.sim_print("send frame")
+        self.send_next_frame()
+
+    def create_frame(self):
+        """
+        creates a frame, puts it in a token bucket shaped queue and waits time_generator.__next__() time
+        until a new frame is created.
+        payload_generator: generator which generates the size of frames (in byte),
             values created by this generator have to be > 0 and should be < flow.burstiness;
             values should not exceed ~1500 bytes (max. frame size in ethernet)
-        :param time_generator: generator which generates the time until the next frame is created in microsecond,
+        time_generator: generator which generates the time until the next frame is created in microsecond,
             values created by this generator have to be > 0.
 
         Meine Gedanken, mögen falsch sein:
-        NOTE: because send_frame_process is token bucket shaped with leaky_rate r,
+        NOTE: because send_next_frame is token bucket shaped with leaky_rate r,
             generating more bit (each frame can have different sizes) than can be transmitted via r will make this
             talker behave like a leaky bucket shaped talker.
 
@@ -191,14 +421,12 @@ class TokenBucketTalker(Node):
             => x >= (y * 8 / r) ; otherwise the queue will overflow (frames come faster than we can send them)
             -> we send frames in a leaky bucket pattern
         """
-        while True:
-            frame = Frame(self.env.frame_id(), flow, payload_generator.__next__(), priority, start_time=self.env.now)
-            # frame = Frame(self.env.frame_id(), flow, 1500, priority)
-            self.queue.append(frame)
-            if self.sleeping:
-                self.sleeping = False
-                self.send_process.interrupt("new frame")
-            yield self.env.timeout(time_generator.__next__())
+        frame = Frame(self.env.frame_id(), self.flow, self.payload_generator.__next__(), self.priority,
+                      start_time=self.env.now)
+        # frame = Frame(self.env.frame_id(), flow, 1500, priority)
+        self.queue.append(frame)
+        self.wake_up()
+        self.env.call_later(self.time_generator.__next__(), self.create_frame)
 
 
 class UnshapedTalker(TokenBucketTalker):
@@ -206,20 +434,14 @@ class UnshapedTalker(TokenBucketTalker):
                  payload_generator, time_generator, monitor: bool = False):
         super(UnshapedTalker, self).__init__(env, address, flow, priority, payload_generator, time_generator, monitor)
 
-    def process_send_frame(self):
-        while True:
-            if self.queue.__len__() > 0:
-                frame = self.queue.popleft()
-
-                if self.monitor:
-                    self.data.append(frame)
-                receiver_address = frame.flow.path[self.address][0]
-                sending_object = self.send_frame(receiver_address, frame)
-                yield sending_object.process
-                self.env.sim_print("send frame")
-            else:
-                self.sleeping = True
-                try:
-                    yield self.sleep_event
-                except Interrupt:
-                    self.sleeping = False
+    def send_next_frame(self):
+        if self.queue.__len__() > 0:
+            frame = self.queue.popleft()
+            self.sending_frame = frame
+
+            if self.monitor:
+                self.monitor_frame(frame)
+            self.send_frame_port(self.get_table(frame.flow).ports[self.index][0], frame,
+                                 callback=self.on_frame_sent)
+        else:
+            self.sleeping = True
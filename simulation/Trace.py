@@ -0,0 +1,237 @@
+import csv
+import json
+import os
+import struct
+
+import numpy as np
+
+# tables which are written in the trace format, all other tables are written as CSV
+TRACE_TABLES = ("talker", "UBS_Switch_Frame", "UBS_Switch_Queue")
+
+MAGIC = b"UBSTRACE"
+VERSION = 2
+
+# kind of every column of the trace tables:
+# "int": int64, "float": float64 (NaN = "" in CSV), "number": float64 and a flag per value which is set if the value
+# was an int, so ints and floats are written to CSV as they were (frame lengths, queue times which start at the int 0),
+# "str": int32 code into the string dictionary of the column, other values are stored as their str()
+FIELD_KINDS = {"sim_name": "str", "sim_id": "int", "seed": "str",
+               "switch_address": "str", "egress_address": "str", "mode": "str",
+               "sender": "str", "receiver": "str", "queue_type": "str", "queue": "str",
+               "frame_id": "int", "flow_id": "int", "frame_len": "number", "frame_priority": "int",
+               "shaped_queue": "str", "preemptions": "int", "frames": "int", "byte_length": "number",
+               "start_time": "float", "arrival_time": "float", "delay": "float",
+               "pseudo_queue_time": "float", "forwarding_time": "float", "transmission_time": "float",
+               "nodal_delay": "float", "queue_delay": "float", "shaped_queue_delay": "float",
+               "pseudo_queue_delay": "float", "since": "number", "until": "number"}
+
+KIND_DTYPES = {"int": "<i8", "float": "<f8", "number": "<f8", "str": "<i4"}
+
+
+def trace_path(path: str, dict_format: str) -> str:
+    return os.path.join(path, "%s.trace" % dict_format)
+
+
+def strings_path(path: str, dict_format: str) -> str:
+    return os.path.join(path, "%s.strings.json" % dict_format)
+
+
+def read_header(file) -> (list, int):
+    """
+    :param file: trace file opened in binary mode, positioned at the start
+    :return: list of (field name, kind) and the offset of the first record
+    """
+    prefix = file.read(12)
+    if prefix.__len__() < 12 or prefix[:8] != MAGIC:
+        raise ValueError("%s is not a trace file" % file.name)
+    header_length = struct.unpack("<I", prefix[8:])[0]
+    header = json.loads(file.read(header_length).decode("utf-8"))
+    if header["version"] != VERSION:
+        raise ValueError("%s has trace version %s, %s is supported" % (file.name, header["version"], VERSION))
+    return [tuple(field) for field in header["fields"]], 12 + header_length
+
+
+def int_flag(name: str) -> str:
+    """
+    :return: name of the field which flags the int values of the "number" column name
+    """
+    return "%s:int" % name
+
+
+def record_dtype(fields: list) -> np.dtype:
+    """
+    :param fields: list of (field name, kind)
+    :return: packed structured dtype of one record, every "number" field is followed by its int flag (uint8)
+    """
+    dtype = list()
+    for name, kind in fields:
+        dtype.append((name, KIND_DTYPES[kind]))
+        if kind == "number":
+            dtype.append((int_flag(name), "<u1"))
+    return np.dtype(dtype)
+
+
+class TraceWriter(object):
+    def __init__(self, path: str, dict_format: str):
+        """
+        appends rows of table dict_format to <path>/<dict_format>.trace. the file starts with the magic bytes, the
+        length of the header and the header (JSON: version and list of (field name, kind), see FIELD_KINDS),
+        followed by fixed width records (record_dtype). the strings of the "str" columns are stored in
+        <path>/<dict_format>.strings.json, field name -> list of strings, the index in the list is the code.
+        if the file exists, rows are appended with its fields, like write_to_csv keeps the header of a CSV file
+        """
+        self.path = path
+        self.dict_format = dict_format
+        self.fields = None
+        self.strings = dict()
+        self.codes = dict()
+        if os.path.exists(trace_path(path, dict_format)):
+            with open(trace_path(path, dict_format), "rb") as file:
+                self.set_fields(read_header(file)[0])
+            with open(strings_path(path, dict_format), "r", encoding="utf-8") as file:
+                for name, strings in json.load(file).items():
+                    self.strings[name] = strings
+                    self.codes[name] = {string: code for code, string in enumerate(strings)}
+
+    def set_fields(self, fields: list):
+        self.fields = fields
+        self.dtype = record_dtype(fields)
+        for name, kind in fields:
+            if kind == "str" and name not in self.strings:
+                self.strings[name] = list()
+                self.codes[name] = dict()
+
+    def write_header(self, frame_dict: dict):
+        fields = list()
+        for name in frame_dict.keys():
+            try:
+                fields.append((name, FIELD_KINDS[name]))
+            except KeyError:
+                raise ValueError("column %s of table %s has no trace kind" % (name, self.dict_format))
+        self.set_fields(fields)
+        header = json.dumps({"version": VERSION, "fields": fields}).encode("utf-8")
+        with open(trace_path(self.path, self.dict_format), "wb") as file:
+            file.write(MAGIC + struct.pack("<I", header.__len__()) + header)
+
+    def encode(self, name: str, value) -> int:
+        string = str(value)
+        codes = self.codes[name]
+        try:
+            return codes[string]
+        except KeyError:
+            code = self.strings[name].__len__()
+            codes[string] = code
+            self.strings[name].append(string)
+            return code
+
+    def write(self, frame_list: list):
+        """
+        appends the rows of frame_list, all rows have to have the columns of the first row written to the file
+        """
+        if frame_list.__len__() == 0:
+            return
+        if self.fields is None:
+            self.write_header(frame_list[0])
+        records = np.empty(frame_list.__len__(), dtype=self.dtype)
+        for name, kind in self.fields:
+            try:
+                values = [frame_dict[name] for frame_dict in frame_list]
+            except KeyError:
+                raise ValueError("a row of table %s has no column %s" % (self.dict_format, name))
+            if kind == "str":
+                records[name] = [self.encode(name, value) for value in values]
+            elif kind == "int":
+                records[name] = values
+            else:
+                records[name] = [np.nan if value == "" else value for value in values]
+                if kind == "number":
+                    # np.float64 is a float too
+                    records[int_flag(name)] = [value != "" and not isinstance(value, float) for value in values]
+        with open(trace_path(self.path, self.dict_format), "ab") as file:
+            file.write(records.tobytes())
+        with open(strings_path(self.path, self.dict_format), "w", encoding="utf-8") as file:
+            json.dump(self.strings, file)
+
+
+class TraceTable(object):
+    def __init__(self, path: str, dict_format: str):
+        """
+        read only view of a trace file (see TraceWriter), the records are memory mapped, nothing is copied
+        :param path: result directory
+        :param dict_format: name of the table
+        """
+        self.dict_format = dict_format
+        with open(trace_path(path, dict_format), "rb") as file:
+            self.fields, offset = read_header(file)
+        with open(strings_path(path, dict_format), "r", encoding="utf-8") as file:
+            self.strings = json.load(file)
+        dtype = record_dtype(self.fields)
+        # a record which was written partially (e.g. crash while writing) is ignored
+        count = (os.path.getsize(trace_path(path, dict_format)) - offset) // dtype.itemsize
+        if count == 0:
+            self.records = np.empty(0, dtype=dtype)
+        else:
+            self.records = np.memmap(trace_path(path, dict_format), dtype=dtype, mode="r", offset=offset,
+                                     shape=(count,))
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """
+        :return: column name of all records, no copy; "str" columns are codes, see decode
+        """
+        return self.records[name]
+
+    def decode(self, name: str, codes=None) -> np.ndarray:
+        """
+        :param codes: codes of column name; default = the whole column
+        :return: object array with the strings of codes
+        """
+        strings = np.array(self.strings[name], dtype=object)
+        return strings[self.records[name] if codes is None else codes]
+
+    def to_rows(self, start: int = 0, stop: int = None) -> list:
+        """
+        :return: records start to stop as rows in the layout write_to_csv writes (one list per row)
+        """
+        columns = list()
+        for name, kind in self.fields:
+            column = self.records[name][start:stop]
+            if kind == "str":
+                strings = self.strings[name]
+                columns.append([strings[code] for code in column.tolist()])
+            elif kind == "int":
+                columns.append(column.tolist())
+            elif kind == "float":
+                columns.append(["" if value != value else value for value in column.tolist()])
+            else:
+                columns.append(["" if value != value else int(value) if is_int else value
+                                for value, is_int in zip(column.tolist(),
+                                                         self.records[int_flag(name)][start:stop].tolist())])
+        return list(zip(*columns))
+
+    def __len__(self):
+        return self.records.__len__()
+
+
+def open_trace(path: str) -> dict:
+    """
+    :param path: result directory (e.g. results/<filename>_<offset>)
+    :return: table name -> TraceTable of every trace file in path
+    """
+    tables = dict()
+    for file_name in sorted(os.listdir(path)):
+        if file_name.endswith(".trace"):
+            tables[file_name[:-len(".trace")]] = TraceTable(path, file_name[:-len(".trace")])
+    return tables
+
+
+def trace_to_csv(path: str, batch_size: int = 100000):
+    """
+    converts every trace file in path to <table>.csv in path, with the same columns and values write_to_csv writes.
+    at most batch_size records are converted at once
+    """
+    for dict_format, table in open_trace(path).items():
+        with open(os.path.join(path, "%s.csv" % dict_format), "w", encoding="utf-8") as file:
+            writer = csv.writer(file, delimiter=",", lineterminator="\n")
+            writer.writerow([name for name, kind in table.fields])
+            for start in range(0, table.__len__(), batch_size):
+                writer.writerows(table.to_rows(start, start + batch_size))
@@ -1,9 +1,25 @@
-from simulation.Core import SimulationEnvironment
+from simulation.Core import SimulationEnvironment, NativeSimulationEnvironment
+from simulation.Cache import ResultCache, generator_parameters, factory_parameters, describe
+from simulation.Instrumentation import Instrumentation
+from simulation.Precision import PrecisionTarget
+from simulation.Progress import ProgressReporter
+from simulation.Sink import CSVSink, TraceSink
+from simulation.Trace import TRACE_TABLES, TraceWriter
 
 import csv
 import os
+import signal
+import threading
+import time
 
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+# seconds a replication may run longer than 2 * timeout before simulate_multiple_multiple_parallel terminates the workers
+REPLICATION_GRACE = 10
 
 
 def mk_result_dir(filename: str, offset: int = 0):
@@ -28,34 +44,438 @@ def write_to_csv(result: dict, filename: str, offset: int):
     print("Done")
 
 
-def simulate_multiple(sim_generator, count: int, runtime: int, filename: str = None, offset: int = None):
+def write_to_trace(result: dict, filename: str, offset: int):
+    """
+    like write_to_csv, but the tables of TRACE_TABLES are written in the binary trace format (see TraceWriter)
+    """
+    path = os.path.join("results", "%s_%s" % (filename, str(offset)))
+    for dict_format in TRACE_TABLES:
+        if dict_format in result:
+            TraceWriter(path, dict_format).write(result[dict_format])
+    write_to_csv({dict_format: frame_list for dict_format, frame_list in result.items()
+                  if dict_format not in TRACE_TABLES}, filename, offset)
+
+
+def simulate_multiple(sim_generator, count: int, runtime: int, filename: str = None, offset: int = None,
+                      stream: bool = False, batch_size: int = 10000, instrument: bool = False,
+                      cache: ResultCache = None, precision: PrecisionTarget = None, trace: bool = False,
+                      progress: ProgressReporter = None):
+    """
+    :param sim_generator: generator which yields ready SimulationEnvironments
+    :param count: number of replications, maximum number of replications if precision is used
+    :param runtime: in micro seconds
+    :param filename: results are written to results/<filename>_<offset>/, nothing is written if None
+    :param offset:
+    :param stream: rows are written while the simulations run, in batches of batch_size rows per table, instead
+        of collecting all replications in memory first. requires filename, nothing is returned
+    :param batch_size: see stream
+    :param instrument: the replications are instrumented (see SimulationEnvironment.instrument), a report of the
+        callbacks of all replications per node, port and event source is printed at the end and added as table
+        instrumentation
+    :param cache: replications which are in cache are not simulated again, simulated replications are added.
+        a replication is identified by the parameters of the scenario function of sim_generator, its number,
+        the name, seed and structure of its SimulationEnvironment, runtime and the simulator version.
+        replications without seed are not cached. can not be used with stream
+    :param precision: replications are stopped as soon as the confidence intervals of the metrics of precision are
+        narrow enough (see PrecisionTarget), the achieved precision is printed and added as table precision.
+        can not be used with stream
+    :param trace: the tables of TRACE_TABLES are written in the binary trace format instead of CSV (see
+        TraceWriter), they can be read with Trace.open_trace and converted with Trace.trace_to_csv
+    :param progress: the progress, speed and ETA of the replications are reported while they run (see
+        ProgressReporter), the results are the same
+    :return: tables of all replications
+    """
+    if filename is not None and offset is None:
+        try:
+            os.mkdir("results")
+        except FileExistsError:
+            pass
+        offset = mk_result_dir(filename)
+    if stream:
+        if filename is None:
+            raise ValueError("streaming requires a filename")
+        if cache is not None:
+            raise ValueError("streamed simulations can not be cached")
+        if precision is not None:
+            raise ValueError("the precision of streamed simulations can not be checked")
+        sink = (TraceSink if trace else CSVSink)(os.path.join("results", "%s_%s" % (filename, str(offset))),
+                                                 batch_size)
+    if cache is not None:
+        parameters = generator_parameters(sim_generator)
+    instrumentation = Instrumentation()
+    instrumented = SimulationEnvironment.instrumented
+    tracker = precision.tracker() if precision is not None else None
+    if progress is not None:
+        progress.plan(count)
     result = defaultdict(list)
     for i in range(0, count):
-        sim_env: SimulationEnvironment = sim_generator.__next__()
-        sim_env.run(runtime)
-        sim_result: dict = sim_env.get_data()
+        # the generator creates the SimulationEnvironment and its nodes, so the first callbacks are instrumented too
+        SimulationEnvironment.instrumented = instrument or instrumented
+        try:
+            sim_env: SimulationEnvironment = sim_generator.__next__()
+        finally:
+            SimulationEnvironment.instrumented = instrumented
+        if stream:
+            sim_env.sink = sink
+            if progress is not None:
+                progress.run(sim_env, runtime)
+            else:
+                sim_env.run(runtime)
+            sim_env.flush_data()
+        else:
+            key = None
+            sim_result = None
+            if cache is not None and sim_env.seed != "":
+                key = cache.key("simulate_multiple", parameters, i, describe(sim_env), runtime)
+                sim_result = cache.get(key)
+            if sim_result is None:
+                if progress is not None:
+                    progress.run(sim_env, runtime)
+                else:
+                    sim_env.run(runtime)
+                sim_result: dict = dict(sim_env.get_data())
+                if key is not None:
+                    cache.put(key, sim_result)
+            else:
+                print("Simulation %d/%d loaded from cache" % (i + 1, count))
+                for frame_list in sim_result.values():
+                    for frame_dict in frame_list:
+                        frame_dict["sim_id"] = sim_env.id
+                if progress is not None:
+                    progress.finish(sim_env.name, sim_env.id)
+            if tracker is not None:
+                tracker.add(sim_result)
+            for dict_format, frame_list in sim_result.items():
+                result[dict_format] += frame_list
+        if instrument:
+            instrumentation.merge(sim_env.instrumentation)
         print("Simulation %d/%d done" % (i + 1, count))
-        for dict_format, frame_list in sim_result.items():
-            result[dict_format] += frame_list
+        if tracker is not None and tracker.converged():
+            if progress is not None:
+                progress.skip(count - (i + 1))
+            break
+    if instrument:
+        print(instrumentation.report())
+        for stat_dict in instrumentation.get_data():
+            tmp_dict = {"sim_name": sim_env.name}
+            tmp_dict.update(stat_dict)
+            if stream:
+                sink.emit("instrumentation", tmp_dict)
+            else:
+                result["instrumentation"].append(tmp_dict)
+    if tracker is not None:
+        print("Precision of %s: %s" % (sim_env.name, tracker.report()))
+        for precision_dict in tracker.get_data():
+            tmp_dict = {"sim_name": sim_env.name}
+            tmp_dict.update(precision_dict)
+            result["precision"].append(tmp_dict)
+    if stream:
+        sink.close()
+        return None
     if filename is not None:
-        if offset is None:
-            try:
-                os.mkdir("results")
-            except FileExistsError:
-                pass
-            offset = mk_result_dir(filename)
-        write_to_csv(result, filename, offset)
+        if trace:
+            write_to_trace(result, filename, offset)
+        else:
+            write_to_csv(result, filename, offset)
     return result
 
 
-def simulate_multiple_multiple(sim_generator_list: list, count: int, runtime: int, filename: str = None):
+def simulate_multiple_multiple(sim_generator_list: list, count: int, runtime: int, filename: str = None,
+                               stream: bool = False, batch_size: int = 10000, instrument: bool = False,
+                               cache: ResultCache = None, precision: PrecisionTarget = None, trace: bool = False,
+                               progress: ProgressReporter = None):
     try:
         os.mkdir("results")
     except FileExistsError:
         pass
     offset = mk_result_dir(filename)
+    if progress is not None:
+        # the whole sweep is planned first, so the ETA covers all generators
+        progress.plan(sim_generator_list.__len__() * count)
     i = 1
     for sim_generator in sim_generator_list:
-        simulate_multiple(sim_generator, count, runtime, filename, offset)
+        simulate_multiple(sim_generator, count, runtime, filename, offset, stream, batch_size, instrument, cache,
+                          precision, trace, progress)
         print("Simulation %d done" % i)
         i += 1
+
+
+def run_with_checkpoints(sim_env: SimulationEnvironment, runtime: int, path: str,
+                         interval: int) -> SimulationEnvironment:
+    """
+    runs sim_env in segments of interval micro seconds and saves a checkpoint to path after each segment
+    (see NativeSimulationEnvironment.save_checkpoint). if path exists, the simulation is resumed from that
+    checkpoint instead, sim_env is not used then. the results are the same as the results of sim_env.run(runtime).
+    requires the native engine
+    :param sim_env: ready SimulationEnvironment, can be None if path exists
+    :param runtime: in micro seconds
+    :param path: file of the checkpoint
+    :param interval: simulated time between two checkpoints in micro seconds
+    :return: the simulation after runtime, resumed simulations are new objects
+    """
+    if os.path.exists(path):
+        sim_env = NativeSimulationEnvironment.load_checkpoint(path)
+        print("Simulation %s resumed at %0.2f" % (sim_env.name, sim_env.now))
+    elif not isinstance(sim_env, NativeSimulationEnvironment):
+        raise ValueError("checkpoints require the native engine (SimulationEnvironment(..., engine=\"native\"))")
+    while sim_env.now < runtime:
+        sim_env.run(min(sim_env.now + interval, runtime))
+        sim_env.save_checkpoint(path)
+    return sim_env
+
+
+def replication_seeds(seed: int, count: int) -> list:
+    """
+    derives count independent seeds from seed. the same seed and count always result in the same seeds
+    :param seed: base seed of a sweep point
+    :param count: number of replications
+    :return: list of seeds which can be used for np.random.RandomState
+    """
+    return [int(replication_seed) for replication_seed in np.random.SeedSequence(seed).generate_state(count)]
+
+
+def run_replication(scenario_factory, seed: int, runtime: int, timeout: float = None,
+                    segments: int = 100) -> (str, dict):
+    """
+    builds a SimulationEnvironment with scenario_factory(seed), runs it for runtime and returns its tables.
+    this is executed in the worker processes of simulate_multiple_parallel
+    :param scenario_factory: picklable callable, scenario_factory(seed) has to return a ready SimulationEnvironment
+    :param seed: seed for this replication
+    :param runtime: in micro seconds
+    :param timeout: maximum wall clock time in seconds for this replication; None = no limit. where SIGALRM is
+        available (POSIX, main thread) the simulation is interrupted when timeout expires, otherwise timeout is only
+        checked between segments
+    :param segments: the simulation is run in this many segments, timeout is checked after each segment
+    :return: tuple of the name of the Simulation and its tables (see SimulationEnvironment.get_data)
+    """
+    sim_env: SimulationEnvironment = scenario_factory(seed)
+    if timeout is None:
+        sim_env.run(runtime)
+        return sim_env.name, dict(sim_env.get_data())
+
+    def timed_out(*args):
+        raise TimeoutError("simulation %s (seed %d) exceeded %0.1fs at %0.2f/%d"
+                           % (sim_env.name, seed, timeout, sim_env.now, runtime))
+
+    alarm = hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+    if alarm:
+        previous_handler = signal.signal(signal.SIGALRM, timed_out)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        deadline = time.monotonic() + timeout
+        for segment in range(1, segments + 1):
+            sim_env.run(runtime * segment / segments)
+            if time.monotonic() > deadline and segment < segments:
+                timed_out()
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+    return sim_env.name, dict(sim_env.get_data())
+
+
+def terminate_workers(executor: ProcessPoolExecutor):
+    """
+    terminates the worker processes of executor, the futures which did not finish fail with BrokenProcessPool
+    """
+    # ProcessPoolExecutor.kill_workers is new in python 3.14
+    if hasattr(executor, "kill_workers"):
+        executor.kill_workers()
+    else:
+        for process in list(executor._processes.values()):
+            process.terminate()
+    executor.shutdown(wait=True)
+
+
+def simulate_multiple_parallel(scenario_factory, count: int, runtime: int, filename: str = None,
+                               offset: int = None, seed: int = 0, processes: int = None, timeout: float = None,
+                               cache: ResultCache = None, precision: PrecisionTarget = None, trace: bool = False,
+                               progress: ProgressReporter = None):
+    """
+    like simulate_multiple, but the replications are run in a process pool.
+    :param scenario_factory: picklable callable (module level function or functools.partial of one),
+        scenario_factory(seed) has to return a ready SimulationEnvironment
+    :param count: number of replications
+    :param runtime: in micro seconds
+    :param filename: results are written to results/<filename>_<offset>/, nothing is written if None
+    :param offset:
+    :param seed: base seed, see replication_seeds
+    :param processes: number of worker processes; default = os.cpu_count()
+    :param timeout: maximum wall clock time in seconds for each replication; replications which time out are skipped
+    :param cache: see simulate_multiple_multiple_parallel
+    :param precision: see simulate_multiple_multiple_parallel
+    :param trace: see simulate_multiple
+    :param progress: see simulate_multiple_multiple_parallel
+    :return: tables of all replications
+    """
+    return simulate_multiple_multiple_parallel([scenario_factory], count, runtime, filename, seed, processes,
+                                               timeout, offset, cache, precision, trace, progress)[0]
+
+
+def simulate_multiple_multiple_parallel(scenario_factory_list: list, count: int, runtime: int, filename: str = None,
+                                        seed: int = 0, processes: int = None, timeout: float = None,
+                                        offset: int = None, cache: ResultCache = None,
+                                        precision: PrecisionTarget = None, trace: bool = False,
+                                        progress: ProgressReporter = None) -> list:
+    """
+    like simulate_multiple_multiple, but all replications of all scenario factories share one process pool.
+    results are collected and written in the same order simulate_multiple_multiple would write them
+    :param scenario_factory_list: list of picklable callables, see simulate_multiple_parallel
+    :param count: number of replications per scenario factory, maximum number if precision is used
+    :param runtime: in micro seconds
+    :param filename: results are written to results/<filename>_<offset>/, nothing is written if None
+    :param seed: base seed, every scenario factory uses the same replication seeds
+    :param processes: number of worker processes; default = os.cpu_count()
+    :param timeout: maximum wall clock time in seconds for each replication; replications which time out are skipped.
+        the workers interrupt replications which time out (see run_replication). if a replication has not returned
+        2 * timeout + REPLICATION_GRACE seconds after it was started (e.g. stuck in code which can not be interrupted),
+        all workers are terminated and the replications which did not finish are submitted to a new pool
+    :param offset:
+    :param cache: replications which are in cache are not submitted to the pool, simulated replications are
+        added. a replication is identified by the scenario factory (function, arguments, source file), its seed,
+        runtime and the simulator version
+    :param precision: the replications of each scenario factory are stopped as soon as the confidence intervals of
+        the metrics of precision are narrow enough (see PrecisionTarget). min_count replications are submitted
+        first, then batches of processes replications until the target or count is reached. the replications are
+        checked in seed order, so the results only depend on seed. the achieved precision is printed and added as
+        table precision
+    :param trace: see simulate_multiple
+    :param progress: a report is made when a replication is collected (see ProgressReporter.finish), the
+        replications in the worker processes are not reported while they run
+    :return: list of the tables of each scenario factory
+    """
+    if filename is not None and offset is None:
+        try:
+            os.mkdir("results")
+        except FileExistsError:
+            pass
+        offset = mk_result_dir(filename)
+    seeds = replication_seeds(seed, count)
+    if precision is None:
+        first_batch = count
+    else:
+        first_batch = min(precision.min_count, count)
+    batch = processes if processes is not None else os.cpu_count()
+    if progress is not None:
+        progress.plan(scenario_factory_list.__len__() * count)
+    results = list()
+    # replaced by a new pool if the workers are terminated, see recycle
+    pool = [ProcessPoolExecutor(max_workers=processes)]
+    try:
+
+        def submit_replication(scenario_factory, replication_seed: int):
+            return pool[0].submit(run_replication, scenario_factory, replication_seed, runtime, timeout)
+
+        def submit(scenario_factory, replication_futures: list, replications: int):
+            # submits the next replications of scenario_factory, cached ones are not submitted
+            for replication_seed in seeds[replication_futures.__len__():replication_futures.__len__() + replications]:
+                key = None
+                cached = None
+                if cache is not None:
+                    key = cache.key("simulate_multiple_parallel", factory_parameters(scenario_factory),
+                                    replication_seed, runtime)
+                    cached = cache.get(key)
+                if cached is None:
+                    replication_futures.append((key, submit_replication(scenario_factory, replication_seed),
+                                                replication_seed))
+                else:
+                    replication_futures.append((None, cached, replication_seed))
+
+        def recycle(i: int, j: int):
+            # terminates the workers and submits the replications which did not finish (from replication j of
+            # scenario factory i on) to a new pool
+            terminate_workers(pool[0])
+            pool[0] = ProcessPoolExecutor(max_workers=processes)
+            for k in range(i, futures.__len__()):
+                replication_futures = futures[k]
+                for n in range(j if k == i else 0, replication_futures.__len__()):
+                    key, future, replication_seed = replication_futures[n]
+                    if isinstance(future, tuple):
+                        continue
+                    if future.cancelled() or not future.done() or isinstance(future.exception(), BrokenProcessPool):
+                        replication_futures[n] = (key, submit_replication(scenario_factory_list[k], replication_seed),
+                                                  replication_seed)
+
+        def wait_replication(future, i: int, j: int) -> (str, dict):
+            # result of future, the workers are recycled if the replication runs longer than 2 * timeout + grace
+            if timeout is None:
+                return future.result()
+            started = None
+            while True:
+                if wait([future], timeout=min(timeout, 1))[0].__len__() > 0:
+                    return future.result()
+                if started is None:
+                    # a future is running as soon as it is queued for a worker, so this may be early
+                    if future.running():
+                        started = time.monotonic()
+                elif time.monotonic() - started > 2 * timeout + REPLICATION_GRACE:
+                    recycle(i, j)
+                    raise TimeoutError("replication did not return %0.1fs after it was started, the workers were "
+                                       "terminated" % (time.monotonic() - started))
+
+        # per scenario factory and replication: (cache key, future or cached result, replication seed)
+        futures = list()
+        for scenario_factory in scenario_factory_list:
+            replication_futures = list()
+            submit(scenario_factory, replication_futures, first_batch)
+            futures.append(replication_futures)
+        for i, replication_futures in enumerate(futures):
+            result = defaultdict(list)
+            tracker = precision.tracker() if precision is not None else None
+            sim_name = None
+            j = 0
+            while True:
+                if j == replication_futures.__len__():
+                    if tracker is None or j == count or tracker.converged():
+                        break
+                    submit(scenario_factory_list[i], replication_futures, batch)
+                key, future, replication_seed = replication_futures[j]
+                j += 1
+                if isinstance(future, tuple):
+                    sim_name, sim_result = future
+                    print("Simulation %d/%d loaded from cache" % (j, count))
+                else:
+                    try:
+                        sim_name, sim_result = wait_replication(future, i, j)
+                    except TimeoutError as e:
+                        print("Simulation %d/%d timed out: %s" % (j, count, e))
+                        if progress is not None:
+                            progress.skip(1)
+                        continue
+                    if key is not None:
+                        cache.put(key, (sim_name, sim_result))
+                # ids are assigned here, in the order simulate_multiple would have created the environments
+                sim_id = SimulationEnvironment.next_id(sim_name)
+                print("Simulation %d/%d done" % (j, count))
+                if progress is not None:
+                    progress.finish(sim_name, sim_id)
+                for dict_format, frame_list in sim_result.items():
+                    for frame_dict in frame_list:
+                        frame_dict["sim_id"] = sim_id
+                    result[dict_format] += frame_list
+                if tracker is not None:
+                    tracker.add(sim_result)
+                    if tracker.converged():
+                        # replications of the last batch which are not needed anymore
+                        for key, future, replication_seed in replication_futures[j:]:
+                            if not isinstance(future, tuple):
+                                future.cancel()
+                        if progress is not None:
+                            progress.skip(count - j)
+                        break
+            if tracker is not None:
+                print("Precision of %s: %s" % (sim_name, tracker.report()))
+                for precision_dict in tracker.get_data():
+                    tmp_dict = {"sim_name": sim_name}
+                    tmp_dict.update(precision_dict)
+                    result["precision"].append(tmp_dict)
+            if filename is not None and result.__len__() > 0:
+                if trace:
+                    write_to_trace(result, filename, offset)
+                else:
+                    write_to_csv(result, filename, offset)
+            print("Simulation %d done" % (i + 1))
+            results.append(result)
+    finally:
+        pool[0].shutdown()
+    return results